@@ -0,0 +1,127 @@
+import math
+import threading
+
+
+class WelfordStats:
+    """Running mean and sample variance over every value seen (Welford's algorithm)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        # Sample standard deviation, the same as pandas' default std()
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.count - 1))
+
+
+class EWMAStats:
+    """Exponentially weighted mean and variance, recent values weigh more."""
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self._var = 0.0
+
+    def update(self, value):
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return
+        delta = value - self.mean
+        increment = self.alpha * delta
+        self.mean += increment
+        self._var = (1 - self.alpha) * (self._var + delta * increment)
+
+    @property
+    def std(self):
+        return math.sqrt(self._var)
+
+
+class StreamingAnomalyDetector:
+    """
+    Flag records whose columns are more than `threshold` standard deviations
+    from the mean of everything seen so far.
+
+    Statistics are kept per column, and per subreddit as well when
+    per_subreddit is set, so each record is scored in O(1) against a baseline
+    that spans the whole stream instead of only the current batch. A record is
+    scored before it is added, so an outlier does not dampen its own z-score.
+    Anomalies are passed to `sink`, for example list.append.
+    """
+
+    def __init__(self, columns=('score', 'num_comments', 'popularity_score'), threshold=3.0,
+                 method='welford', alpha=0.01, per_subreddit=False, min_count=30, sink=None):
+        if method not in ('welford', 'ewma'):
+            raise ValueError("method must be 'welford' or 'ewma'")
+        self.columns = tuple(columns)
+        self.threshold = threshold
+        self.method = method
+        self.alpha = alpha
+        self.per_subreddit = per_subreddit
+        self.min_count = min_count
+        self.sink = sink
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _new_stats(self):
+        return WelfordStats() if self.method == 'welford' else EWMAStats(self.alpha)
+
+    def update(self, record):
+        """Score one record, update the baselines and return the anomalies found."""
+        groups = [None]
+        if self.per_subreddit and record.get('subreddit'):
+            groups.append(record['subreddit'])
+
+        found = []
+        with self._lock:
+            for column in self.columns:
+                value = record.get(column)
+                if value is None:
+                    continue
+                value = float(value)
+
+                for group in groups:
+                    key = (group, column)
+                    stats = self._stats.get(key)
+                    if stats is None:
+                        stats = self._stats[key] = self._new_stats()
+
+                    # Wait for a stable baseline before flagging anything
+                    std = stats.std
+                    if stats.count >= self.min_count and std > 0:
+                        z_score = (value - stats.mean) / std
+                        if abs(z_score) > self.threshold:
+                            found.append({
+                                'id': record.get('id'),
+                                'subreddit': group,
+                                'column': column,
+                                'value': value,
+                                'z_score': z_score,
+                                'mean': stats.mean,
+                                'std': std,
+                            })
+                    stats.update(value)
+
+        if self.sink is not None:
+            for anomaly in found:
+                self.sink(anomaly)
+        return found
+
+    def baseline(self, column, subreddit=None):
+        """Return (count, mean, std) for a column, overall or for one subreddit."""
+        with self._lock:
+            stats = self._stats.get((subreddit, column))
+            if stats is None:
+                return 0, 0.0, 0.0
+            return stats.count, stats.mean, stats.std
@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import time
+from decimal import Decimal
+
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+# Converters for get_query_results values by Athena column type, anything else stays a string
+COLUMN_TYPES = {
+    'tinyint': int,
+    'smallint': int,
+    'integer': int,
+    'bigint': int,
+    'float': float,
+    'real': float,
+    'double': float,
+    'decimal': Decimal,
+    'boolean': lambda value: value == 'true',
+}
+
+
+class QueryResult:
+    """Outcome of one Athena query: its state, output location and timings."""
+
+    def __init__(self, query_execution_id, state, execution=None, reused=False):
+        self.query_execution_id = query_execution_id
+        self.state = state
+        self.execution = execution or {}
+        self.reused = reused
+        self.timings = {}
+
+    @property
+    def succeeded(self):
+        return self.state == 'SUCCEEDED'
+
+    @property
+    def output_location(self):
+        return self.execution.get('ResultConfiguration', {}).get('OutputLocation')
+
+    @property
+    def reason(self):
+        return self.execution.get('Status', {}).get('StateChangeReason', self.state)
+
+    def output_bucket_key(self):
+        bucket, _, key = self.output_location[len('s3://'):].partition('/')
+        return bucket, key
+
+
+class AthenaQueryRunner:
+    """
+    Run Athena queries without sleeping longer than needed.
+
+    Polling starts at initial_poll seconds and backs off by `backoff` up to
+    max_poll, so short queries return in well under a second. Results can be
+    copied to S3, paged with get_query_results or streamed from S3.
+
+    Results are reused in two ways:
+    - Athena's own result reuse, when reuse_max_age_minutes is set.
+    - An earlier execution of the same query and `data_version`, from
+      `cache` (any dict-like, e.g. part of a persisted state).
+
+    Every QueryResult carries timings. The queue, planning and execution
+    times come from Athena, the wall-clock waiting and copy times are
+    measured here. The client and sleep function are injectable for tests.
+    """
+
+    def __init__(self, athena_client, database, output_location, workgroup=None, initial_poll=0.2,
+                 max_poll=5.0, backoff=2.0, timeout=None, reuse_max_age_minutes=None, cache=None,
+                 sleep=time.sleep):
+        self.athena = athena_client
+        self.database = database
+        self.output_location = output_location
+        self.workgroup = workgroup
+        self.initial_poll = initial_poll
+        self.max_poll = max_poll
+        self.backoff = backoff
+        self.timeout = timeout
+        self.reuse_max_age_minutes = reuse_max_age_minutes
+        self.cache = cache if cache is not None else {}
+        self.sleep = sleep
+
+    @staticmethod
+    def cache_key(query, data_version):
+        return hashlib.sha256(f"{data_version}\n{query}".encode('utf-8')).hexdigest()
+
+    def run(self, query, data_version=None):
+        """Run a query and wait for it to finish. Returns a QueryResult."""
+        start = time.perf_counter()
+
+        if data_version is not None:
+            cached_id = self.cache.get(self.cache_key(query, data_version))
+            if cached_id:
+                result = self.describe(cached_id)
+                if result.succeeded:
+                    logging.info("Reusing query %s, the data has not changed", cached_id)
+                    result.reused = True
+                    result.timings['total_seconds'] = time.perf_counter() - start
+                    return result
+
+        params = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': self.database},
+            'ResultConfiguration': {'OutputLocation': self.output_location},
+        }
+        if self.workgroup:
+            params['WorkGroup'] = self.workgroup
+        if self.reuse_max_age_minutes:
+            params['ResultReuseConfiguration'] = {
+                'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': self.reuse_max_age_minutes}
+            }
+        query_execution_id = self.athena.start_query_execution(**params)['QueryExecutionId']
+        logging.info("ATHENA QUERY EXECUTION ID: %s", query_execution_id)
+        submit_seconds = time.perf_counter() - start
+
+        result = self.wait(query_execution_id)
+        result.timings['submit_seconds'] = submit_seconds
+        result.timings['total_seconds'] = time.perf_counter() - start
+        if result.succeeded and data_version is not None:
+            self.cache[self.cache_key(query, data_version)] = query_execution_id
+        return result
+
+    def describe(self, query_execution_id):
+        """Current state of an execution, without waiting."""
+        execution = self.athena.get_query_execution(QueryExecutionId=query_execution_id)['QueryExecution']
+        result = QueryResult(query_execution_id, execution['Status']['State'], execution)
+        statistics = execution.get('Statistics', {})
+        result.reused = statistics.get('ResultReuseInformation', {}).get('ReusedPreviousResult', False)
+        for name, key in (('queue_ms', 'QueryQueueTimeInMillis'),
+                          ('planning_ms', 'QueryPlanningTimeInMillis'),
+                          ('execution_ms', 'EngineExecutionTimeInMillis'),
+                          ('service_processing_ms', 'ServiceProcessingTimeInMillis'),
+                          ('total_execution_ms', 'TotalExecutionTimeInMillis')):
+            if key in statistics:
+                result.timings[name] = statistics[key]
+        if 'DataScannedInBytes' in statistics:
+            result.timings['data_scanned_bytes'] = statistics['DataScannedInBytes']
+        return result
+
+    def wait(self, query_execution_id):
+        """Poll with exponential backoff until the query finishes or the timeout passes."""
+        started = time.perf_counter()
+        delay = self.initial_poll
+        polls = 0
+        slept = 0.0
+
+        while True:
+            result = self.describe(query_execution_id)
+            polls += 1
+            if result.state in TERMINAL_STATES:
+                break
+            # Counting the sleeps as well keeps the timeout exact with an injected sleep
+            waited = max(time.perf_counter() - started, slept)
+            if self.timeout is not None and waited + delay > self.timeout:
+                logging.error("Query %s still %s after %.1fs, cancelling", query_execution_id, result.state, waited)
+                self.athena.stop_query_execution(QueryExecutionId=query_execution_id)
+                result = self.describe(query_execution_id)
+                break
+            logging.debug("Query %s is %s, polling again in %.2fs", query_execution_id, result.state, delay)
+            self.sleep(delay)
+            slept += delay
+            delay = min(self.max_poll, delay * self.backoff)
+
+        result.timings['wait_seconds'] = time.perf_counter() - started
+        result.timings['polls'] = polls
+        if result.state != 'SUCCEEDED':
+            logging.error("Query %s finished as %s: %s", query_execution_id, result.state, result.reason)
+        return result
+
+    def copy_result(self, result, s3_client, bucket, key, delete_source=True):
+        """Copy the result CSV to bucket/key server-side, then remove the temp files."""
+        start = time.perf_counter()
+        source_bucket, source_key = result.output_bucket_key()
+        s3_client.copy_object(CopySource={'Bucket': source_bucket, 'Key': source_key}, Bucket=bucket, Key=key)
+        # A reused result may be shared with later runs, so it is only removed when we created it
+        if delete_source and not result.reused:
+            s3_client.delete_objects(Bucket=source_bucket, Delete={'Objects': [
+                {'Key': source_key}, {'Key': source_key + '.metadata'}], 'Quiet': True})
+        result.timings['copy_seconds'] = time.perf_counter() - start
+
+    def stream_result(self, result, s3_client, chunk_size=1024 * 1024):
+        """Yield the result CSV from S3 in chunks, without holding it in memory."""
+        source_bucket, source_key = result.output_bucket_key()
+        body = s3_client.get_object(Bucket=source_bucket, Key=source_key)['Body']
+        yield from body.iter_chunks(chunk_size)
+
+    def iter_rows(self, result, page_size=1000):
+        """Yield result rows as dicts with typed values, paging through get_query_results."""
+        params = {'QueryExecutionId': result.query_execution_id, 'MaxResults': page_size}
+        columns = None
+        while True:
+            page = self.athena.get_query_results(**params)
+            rows = page['ResultSet']['Rows']
+            if columns is None:
+                info = page['ResultSet']['ResultSetMetadata']['ColumnInfo']
+                columns = [(column['Name'], COLUMN_TYPES.get(column['Type'].lower())) for column in info]
+                rows = rows[1:]  # The first row of the first page holds the column names
+            for row in rows:
+                record = {}
+                for (name, convert), cell in zip(columns, row['Data']):
+                    value = cell.get('VarCharValue')
+                    record[name] = convert(value) if convert and value is not None else value
+                yield record
+            if not page.get('NextToken'):
+                return
+            params['NextToken'] = page['NextToken']
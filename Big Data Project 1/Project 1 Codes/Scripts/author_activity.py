@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+
+SNAPSHOT_VERSION = 1
+
+
+def author_hash(author):
+    """Stable 64-bit hash of an author name, the same in every process and run."""
+    return int.from_bytes(hashlib.blake2b(author.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency sketch. Estimates never undercount and overcount by at
+    most about total / width * e with high probability, in depth * width counters.
+    """
+
+    def __init__(self, width=2 ** 18, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', bytes(4 * width)) for _ in range(depth)]
+
+    def indexes(self, key_hash):
+        """Counter positions of a key, one per row. Sketches of the same width share them."""
+        # Double hashing derives every row index from one 64-bit hash
+        h1 = key_hash & 0xFFFFFFFF
+        h2 = key_hash >> 32
+        return [(h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key_hash, count=1, indexes=None):
+        for row, index in zip(self.rows, indexes or self.indexes(key_hash)):
+            row[index] += count
+
+    def estimate(self, key_hash, indexes=None):
+        return min(row[index] for row, index in zip(self.rows, indexes or self.indexes(key_hash)))
+
+    def memory_bytes(self):
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+
+class AuthorActivityStore:
+    """
+    Count posts per author with bounded memory and optional persistence.
+
+    mode='exact' keeps one counter per author, keyed by the interned name
+    (key_mode='intern') or a 64-bit hash of it (key_mode='hash').
+    mode='sketch' keeps a Count-Min Sketch instead, so memory is fixed no
+    matter how many authors appear.
+
+    With window_seconds set, only posts from the last window count. Posts are
+    grouped into buckets of bucket_seconds and whole buckets are evicted as
+    they expire. With snapshot_path set, the counts are loaded on start and
+    written to disk every snapshot_interval seconds.
+    """
+
+    def __init__(self, mode='exact', key_mode='intern', window_seconds=None, bucket_seconds=None,
+                 sketch_width=2 ** 18, sketch_depth=4, snapshot_path=None, snapshot_interval=60):
+        if mode not in ('exact', 'sketch'):
+            raise ValueError("mode must be 'exact' or 'sketch'")
+        if key_mode not in ('intern', 'hash'):
+            raise ValueError("key_mode must be 'intern' or 'hash'")
+        self.mode = mode
+        self.key_mode = 'hash' if mode == 'sketch' else key_mode
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds or (window_seconds / 12 if window_seconds else None)
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.Lock()
+        self._last_snapshot = time.time()
+        self.clear()
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    def clear(self):
+        """Forget every count."""
+        self._counts = {}  # Exact mode, key -> count within the window
+        self._sketch = None  # Sketch mode without a window
+        self._buckets = deque()  # Windowed, (bucket_start, {key: count} or sketch)
+        if self.mode == 'sketch' and not self.window_seconds:
+            self._sketch = CountMinSketch(self.sketch_width, self.sketch_depth)
+
+    def _key(self, author):
+        if self.key_mode == 'hash':
+            return author_hash(author)
+        return sys.intern(author)
+
+    def increment(self, author, timestamp=None):
+        """Count one post by the author and return the author's current count."""
+        key = self._key(author)
+        now = time.time() if timestamp is None else timestamp
+
+        with self._lock:
+            if self.window_seconds:
+                self._evict(now)
+                bucket = self._current_bucket(now)
+
+            if self.mode == 'exact':
+                if self.window_seconds:
+                    bucket[key] = bucket.get(key, 0) + 1
+                count = self._counts.get(key, 0) + 1
+                self._counts[key] = count
+            elif self.window_seconds:
+                indexes = bucket.indexes(key)
+                bucket.add(key, indexes=indexes)
+                count = sum(sketch.estimate(key, indexes) for _, sketch in self._buckets)
+            else:
+                self._sketch.add(key)
+                count = self._sketch.estimate(key)
+
+        self.maybe_snapshot()
+        return count
+
+    def get(self, author, default=0):
+        """Return the author's current count without incrementing it."""
+        key = self._key(author)
+        with self._lock:
+            if self.mode == 'exact':
+                return self._counts.get(key, default)
+            if self.window_seconds:
+                return sum(sketch.estimate(key) for _, sketch in self._buckets) or default
+            return self._sketch.estimate(key) or default
+
+    def _current_bucket(self, now):
+        bucket_start = now - now % self.bucket_seconds
+        if not self._buckets or self._buckets[-1][0] < bucket_start:
+            if self.mode == 'exact':
+                bucket = {}
+            else:
+                bucket = CountMinSketch(self.sketch_width, self.sketch_depth)
+            self._buckets.append((bucket_start, bucket))
+        return self._buckets[-1][1]
+
+    def _evict(self, now):
+        cutoff = now - self.window_seconds
+        while self._buckets and self._buckets[0][0] + self.bucket_seconds <= cutoff:
+            _, bucket = self._buckets.popleft()
+            if self.mode == 'exact':
+                for key, count in bucket.items():
+                    remaining = self._counts[key] - count
+                    if remaining:
+                        self._counts[key] = remaining
+                    else:
+                        del self._counts[key]
+
+    def __len__(self):
+        """Number of authors tracked exactly, 0 in sketch mode."""
+        return len(self._counts)
+
+    def memory_bytes(self):
+        """Approximate memory held by the counters and keys."""
+        with self._lock:
+            if self.mode == 'sketch':
+                sketches = [self._sketch] if self._sketch else [s for _, s in self._buckets]
+                return sum(sketch.memory_bytes() for sketch in sketches)
+            total = sys.getsizeof(self._counts)
+            total += sum(sys.getsizeof(key) for key in self._counts)
+            total += sum(sys.getsizeof(bucket) for _, bucket in self._buckets)
+            return total
+
+    def maybe_snapshot(self):
+        """Write a snapshot if snapshot_interval has passed since the last one."""
+        if self.snapshot_path and time.time() - self._last_snapshot >= self.snapshot_interval:
+            self.save_snapshot()
+
+    def save_snapshot(self, path=None):
+        """Write the counts to local disk, replacing the previous snapshot atomically."""
+        path = path or self.snapshot_path
+        with self._lock:
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'mode': self.mode,
+                'key_mode': self.key_mode,
+                'window_seconds': self.window_seconds,
+                'counts': self._counts,
+                'sketch': self._sketch,
+                'buckets': self._buckets,
+            }
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._last_snapshot = time.time()
+
+    def load_snapshot(self, path):
+        """Restore counts written by save_snapshot with the same settings."""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        settings = (self.mode, self.key_mode, self.window_seconds)
+        if state.get('version') != SNAPSHOT_VERSION or \
+                (state['mode'], state['key_mode'], state['window_seconds']) != settings:
+            logging.warning("Ignoring author activity snapshot %s written with other settings", path)
+            return
+        counts = state['counts']
+        if self.key_mode == 'intern':
+            counts = {sys.intern(key): count for key, count in counts.items()}
+        with self._lock:
+            self._counts = counts
+            self._sketch = state['sketch']
+            self._buckets = state['buckets']
+        logging.info("Loaded author activity snapshot from %s", path)
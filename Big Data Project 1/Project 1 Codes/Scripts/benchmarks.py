@@ -0,0 +1,807 @@
+import argparse
+import json
+import os
+import random
+import re
+import string
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Words used to build synthetic titles, mixing stopwords, sentiment words and noise
+TITLE_WORDS = [
+    'the', 'a', 'my', 'this', 'is', 'was', 'why', 'how', 'what', 'and', 'of', 'to', 'in', 'for',
+    'great', 'terrible', 'amazing', 'bad', 'happy', 'sad', 'love', 'hate', 'best', 'worst',
+    'new', 'old', 'first', 'last', 'finally', 'really', 'very', 'not', 'never', 'good',
+    'cat', 'dog', 'game', 'movie', 'city', 'car', 'job', 'school', 'friend', 'photo',
+    'today', 'yesterday', 'year', 'week', 'python', 'data', 'science', 'news', 'update',
+]
+PUNCTUATION = ['!', '?', '...', ',', ':)', "'s", '!!', '"', '(OC)', '[Serious]']
+SUBREDDITS = ['AskReddit', 'pics', 'funny', 'worldnews', 'gaming', 'science', 'teenagers', 'memes']
+FLAIRS = [None, 'Discussion', 'OC', 'Meme', 'Question', 'News']
+THUMBNAILS = ['self', 'default', 'nsfw', 'https://b.thumbs.redditmedia.com/abc.jpg']
+
+
+def generate_submissions(count, seed=0, repost_ratio=0.3, authors=None, start_time=None):
+    """
+    Generate synthetic payloads shaped like the ones reddit_kinesis_1.py sends.
+    A share of the titles are reposts of earlier titles, as on r/all.
+    """
+    rng = random.Random(seed)
+    authors = authors or max(1, count // 5)
+    start_time = start_time or datetime(2024, 10, 1, tzinfo=timezone.utc)
+    titles = []
+    submissions = []
+
+    for i in range(count):
+        if titles and rng.random() < repost_ratio:
+            title = rng.choice(titles)
+        else:
+            words = rng.choices(TITLE_WORDS, k=rng.randint(3, 14))
+            title = ' '.join(word.capitalize() if rng.random() < 0.2 else word for word in words)
+            title += rng.choice(PUNCTUATION)
+            titles.append(title)
+
+        created = start_time + timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+        is_self = rng.random() < 0.4
+        submissions.append({
+            'id': ''.join(rng.choices(string.ascii_lowercase + string.digits, k=7)) + str(i),
+            'author': f"user_{rng.randint(0, authors)}",
+            'title': title,
+            'subreddit': rng.choice(SUBREDDITS),
+            'created_time': created.strftime('%Y-%m-%d %H:%M:%S'),
+            'score': int(rng.paretovariate(1.2)) - 1,
+            'num_comments': int(rng.paretovariate(1.5)) - 1,
+            'is_self_post': is_self,
+            'flair_text': rng.choice(FLAIRS),
+            'upvote_ratio': round(rng.uniform(0.5, 1.0), 2),
+            'edited': False,
+            'over_18': rng.random() < 0.05,
+            'thumbnail': 'self' if is_self else rng.choice(THUMBNAILS),
+            'stickied': False,
+        })
+    return submissions
+
+
+def load_corpus(args):
+    """
+    Return the submissions to benchmark with.
+    Reads a saved JSON lines corpus when --corpus is given, otherwise generates one
+    and saves it to --save-corpus if asked.
+    """
+    if args.corpus:
+        with open(args.corpus) as f:
+            submissions = [json.loads(line) for line in f if line.strip()]
+        return submissions[:args.records] if args.records else submissions
+
+    submissions = generate_submissions(args.records, seed=args.seed)
+    if args.save_corpus:
+        with open(args.save_corpus, 'w') as f:
+            for submission in submissions:
+                f.write(json.dumps(submission) + '\n')
+    return submissions
+
+
+def chunks(items, size):
+    """Split a list into consecutive chunks of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def report(name, count, elapsed):
+    print(f"{name:<28} {count:>8} records  {elapsed:8.3f}s  {count / elapsed:12.0f} records/s")
+
+
+def bench_preprocessing(args):
+    """Compare per-record preprocess_record with the vectorized preprocess_batch."""
+    import kinesis_processing_2 as consumer
+
+    submissions = load_corpus(args)
+    now = datetime.now(timezone.utc)
+
+    consumer.author_activity.clear()
+    start = time.perf_counter()
+    expected = [consumer.preprocess_record(dict(s), now=now) for s in submissions]
+    per_record = time.perf_counter() - start
+    report('preprocess_record', len(submissions), per_record)
+
+    consumer.author_activity.clear()
+    start = time.perf_counter()
+    actual = []
+    for batch in chunks([dict(s) for s in submissions], args.batch_size):
+        actual.extend(consumer.preprocess_batch(batch, now=now))
+    batched = time.perf_counter() - start
+    report(f"preprocess_batch ({args.batch_size})", len(submissions), batched)
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"speedup: {per_record / batched:.2f}x, mismatched records: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def bench_sentiment(args):
+    """Compare TextBlob polarity with the lexicon scorer, with and without the cache."""
+    from sentiment import LEXICON_TOLERANCE, LexiconSentiment, SentimentScorer, TextBlobSentiment
+    from text_normalization import normalize_title
+
+    # Score titles the way preprocess_record sees them
+    titles = [normalize_title(s['title']) for s in load_corpus(args)]
+
+    textblob = TextBlobSentiment()
+    start = time.perf_counter()
+    expected = [textblob.polarity(title) for title in titles]
+    report('TextBlob', len(titles), time.perf_counter() - start)
+
+    lexicon = LexiconSentiment()
+    start = time.perf_counter()
+    uncached = [lexicon.polarity(title) for title in titles]
+    report('lexicon', len(titles), time.perf_counter() - start)
+
+    scorer = SentimentScorer('lexicon', processes=args.processes)
+    start = time.perf_counter()
+    cached = []
+    for batch in chunks(titles, args.batch_size):
+        cached.extend(scorer.polarities(batch))
+    report(f"lexicon + cache ({args.batch_size})", len(titles), time.perf_counter() - start)
+    scorer.close()
+
+    worst = max(abs(a - b) for results in (uncached, cached) for a, b in zip(expected, results))
+    print(f"max polarity difference: {worst:.2e} (tolerance {LEXICON_TOLERANCE:.0e}), "
+          f"cache: {scorer.cache_info()}")
+    if worst > LEXICON_TOLERANCE:
+        raise SystemExit(1)
+
+
+def bench_author_activity(args):
+    """
+    Replay a simulated 55-minute r/all stream through each author-activity mode
+    and report memory every 5 simulated minutes.
+    """
+    import tracemalloc
+    from author_activity import AuthorActivityStore
+
+    rate = args.rate
+    duration = 55 * 60
+    configurations = {
+        'exact': dict(mode='exact'),
+        'exact, hashed keys': dict(mode='exact', key_mode='hash'),
+        'exact, 10 min window': dict(mode='exact', window_seconds=600),
+        'sketch': dict(mode='sketch'),
+        'sketch, 10 min window': dict(mode='sketch', window_seconds=600, sketch_width=2 ** 16),
+    }
+
+    for name, options in configurations.items():
+        rng = random.Random(args.seed)
+        tracemalloc.start()
+        store = AuthorActivityStore(**options)
+        samples = []
+        new_authors = 0
+        start = time.perf_counter()
+
+        for second in range(duration):
+            for _ in range(rate):
+                # Most r/all authors post once, a few post all the time
+                if rng.random() < 0.8:
+                    new_authors += 1
+                    author = f"author_{new_authors}"
+                else:
+                    author = f"regular_{int(rng.paretovariate(1.0))}"
+                store.increment(author, timestamp=second)
+            if second % 300 == 299:
+                samples.append((store.memory_bytes(), tracemalloc.get_traced_memory()[0]))
+
+        elapsed = time.perf_counter() - start
+        tracemalloc.stop()
+        print(f"{name}: {rate * duration / elapsed:,.0f} increments/s")
+        print("  store MB every 5 min:  " + ' '.join(f"{m / 1e6:6.1f}" for m, _ in samples))
+        print("  traced MB every 5 min: " + ' '.join(f"{t / 1e6:6.1f}" for _, t in samples))
+
+
+def bench_dedup(args):
+    """
+    Replay a simulated 55-minute stream where --redeliver of the records are
+    redeliveries of recent ones through each SeenIds mode, and report lookup
+    speed, missed and false duplicates, and memory.
+    """
+    from dedup import SeenIds
+
+    rate = args.rate
+    duration = 55 * 60
+    configurations = {
+        'lru': dict(mode='lru', window_seconds=3600),
+        'lru, 10 min window': dict(mode='lru', window_seconds=600),
+        'bloom': dict(mode='bloom', window_seconds=3600, capacity=rate * 3600),
+        'bloom, 10 min window': dict(mode='bloom', window_seconds=600, capacity=rate * 600),
+    }
+
+    for name, options in configurations.items():
+        rng = random.Random(args.seed)
+        seen = SeenIds(**options)
+        recent = []
+        duplicates = missed = false_duplicates = 0
+        start = time.perf_counter()
+
+        for second in range(duration):
+            for _ in range(rate):
+                # Redeliveries follow the original within a few minutes
+                duplicate = bool(recent) and rng.random() < args.redeliver
+                key = rng.choice(recent[-rate * 300:]) if duplicate else f"t3_{second}_{len(recent)}"
+                if not duplicate:
+                    recent.append(key)
+                duplicates += duplicate
+                hit = seen.add(key, timestamp=second)
+                missed += duplicate and not hit
+                false_duplicates += bool(hit and not duplicate)
+
+        elapsed = time.perf_counter() - start
+        stats = seen.stats()
+        print(f"{name}: {stats['lookups'] / elapsed:,.0f} lookups/s, hit rate {stats['hit_rate']:.1%}, "
+              f"{duplicates} duplicates, {missed} missed, {false_duplicates} false, "
+              f"{seen.memory_bytes() / 1e6:.1f} MB")
+
+
+class StubKinesis:
+    """
+    Stand-in Kinesis client with a fixed round trip per call and a share of
+    PutRecords entries failing with ProvisionedThroughputExceededException.
+    """
+
+    def __init__(self, latency=0.01, failure_rate=0.02, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.records = []
+        self.calls = 0
+
+    def put_record(self, StreamName, Data, PartitionKey):
+        self.calls += 1
+        time.sleep(self.latency)
+        self.records.append(Data)
+        return {'ShardId': 'shardId-000000000000', 'SequenceNumber': str(len(self.records))}
+
+    def put_records(self, StreamName, Records):
+        self.calls += 1
+        time.sleep(self.latency)
+        results = []
+        for entry in Records:
+            if self.rng.random() < self.failure_rate:
+                results.append({'ErrorCode': 'ProvisionedThroughputExceededException',
+                                'ErrorMessage': 'Rate exceeded for shard'})
+            else:
+                self.records.append(entry['Data'])
+                results.append({'ShardId': 'shardId-000000000000',
+                                'SequenceNumber': str(len(self.records))})
+        failed = sum(1 for result in results if 'ErrorCode' in result)
+        return {'FailedRecordCount': failed, 'Records': results}
+
+
+def bench_producer(args):
+    """Compare one PutRecord per submission with the batching PutRecords producer."""
+    from kinesis_producer import BatchingKinesisProducer
+
+    payloads = [(json.dumps(s), s['id']) for s in load_corpus(args)]
+
+    # One blocking call per record, measured on a sample because it is slow
+    sample = payloads[:1000]
+    client = StubKinesis(latency=args.latency)
+    start = time.perf_counter()
+    for data, key in sample:
+        client.put_record(StreamName='reddit-bde', Data=data, PartitionKey=key)
+    report('put_record', len(sample), time.perf_counter() - start)
+
+    client = StubKinesis(latency=args.latency)
+    producer = BatchingKinesisProducer('reddit-bde', kinesis_client=client, base_backoff=0.01)
+    start = time.perf_counter()
+    for data, key in payloads:
+        producer.put(data, key)
+    producer.close()
+    report('BatchingKinesisProducer', len(payloads), time.perf_counter() - start)
+
+    stats = producer.stats()
+    print(f"calls: {client.calls}, retries: {stats['retries']}, sent: {stats['records_sent']}, "
+          f"failed: {stats['records_failed']}")
+    if len(client.records) != len(payloads):
+        raise SystemExit(1)
+
+
+def bench_codec(args):
+    """Compare record size and encode/decode speed of each record_codec encoding with JSON."""
+    import record_codec
+
+    submissions = load_corpus(args)
+    baseline = None
+
+    for encoding in record_codec.ENCODINGS:
+        if not record_codec.is_supported(encoding):
+            print(f"{encoding:<28} skipped, dependency not installed")
+            continue
+
+        start = time.perf_counter()
+        encoded = [record_codec.encode_record(s, encoding) for s in submissions]
+        encode_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = [record_codec.decode_record(data) for data in encoded]
+        decode_seconds = time.perf_counter() - start
+
+        size = sum(len(data) for data in encoded)
+        baseline = baseline or size
+        report(f"encode {encoding}", len(submissions), encode_seconds)
+        report(f"decode {encoding}", len(submissions), decode_seconds)
+        mismatches = sum(1 for a, b in zip(submissions, decoded) if a != b)
+        print(f"{encoding}: {size / len(submissions):.1f} bytes/record, {size / baseline:.0%} of JSON, "
+              f"mismatched records: {mismatches}")
+        if mismatches:
+            raise SystemExit(1)
+
+
+def generate_posts(count, seed=0):
+    """
+    Generate synthetic post bodies with the noise the notebook's clean_post handles:
+    URLs, email addresses, contractions, digits, emoji and accented words.
+    """
+    rng = random.Random(seed)
+    noise = ['https://i.redd.it/abc123.jpg', 'www.example.com/page', "don't", "I'm", "it's", "can't",
+             '2024', '#help', '@mods', 'café', '\U0001F602', '\\u2019', '...', '(OC)', '&amp;']
+    posts = []
+    for _ in range(count):
+        if rng.random() < 0.02:
+            posts.append(f"user{rng.randint(0, 999)}@mail.com")
+            continue
+        words = rng.choices(TITLE_WORDS, k=rng.randint(5, 40)) + rng.choices(noise, k=rng.randint(0, 4))
+        rng.shuffle(words)
+        posts.append(' '.join(word.capitalize() if rng.random() < 0.2 else word for word in words))
+    return posts
+
+
+def bench_spark_cleaning(args):
+    """
+    Compare the notebook's regexp_replace chain + Python stopword UDF with the
+    native text_cleaning.clean_posts in Spark local mode. Run with
+    --records 1000000 for the full-size corpus.
+    """
+    from pyspark.sql import SparkSession
+    from pyspark.sql import functions as F
+    from pyspark.sql import types as T
+
+    from stopwords import STOP_WORDS
+    from text_cleaning import clean_posts
+
+    spark = SparkSession.builder.master('local[*]').appName('bench-spark-cleaning').getOrCreate()
+    spark.sparkContext.setLogLevel('WARN')
+
+    # Distinct bodies are generated in Python and repeated over a range, so the
+    # corpus is built quickly and cached before either cleaner is timed
+    posts = generate_posts(min(args.records, 20000), seed=args.seed)
+    bodies = spark.createDataFrame(list(enumerate(posts)), ['body_id', 'body'])
+    corpus = (spark.range(args.records)
+              .withColumn('body_id', F.col('id') % len(posts))
+              .join(F.broadcast(bodies), 'body_id')
+              .select('id', 'body')
+              .cache())
+    corpus.count()
+
+    def clean_post_udf(reddit_body):
+        # The notebook's clean_post before text_cleaning, with the shared stopwords
+        reddit_body = F.regexp_replace(reddit_body, r'^.+@[^\.].*\.[a-z]{2,}$', 'emailaddress')
+        reddit_body = F.regexp_replace(reddit_body, r'(\\u[0-9A-Fa-f]+)', '')
+        reddit_body = F.regexp_replace(reddit_body, r'[^\x00-\x7f]', '')
+        reddit_body = F.regexp_replace(reddit_body, r'((www\.[^\s]+)|(https?://[^\s]+))', 'website')
+        reddit_body = F.regexp_replace(reddit_body, r'[^a-zA-Z#@]+', ' ')
+        reddit_body = F.regexp_replace(reddit_body, r'\s+', ' ')
+        reddit_body = F.regexp_replace(reddit_body, r'^\s+|\s+?$', '')
+        reddit_body = F.lower(reddit_body)
+
+        @F.udf(T.StringType())
+        def remove_stopwords(text):
+            return ' '.join([word for word in text.split() if word not in STOP_WORDS])
+
+        return remove_stopwords(reddit_body)
+
+    def timed(name, df):
+        # Summing the lengths makes Spark compute every cleaned row without collecting them
+        start = time.perf_counter()
+        df.agg(F.sum(F.length('cleaned_body'))).collect()
+        elapsed = time.perf_counter() - start
+        report(name, args.records, elapsed)
+        return elapsed
+
+    udf_df = corpus.withColumn('cleaned_body', clean_post_udf(F.col('body')))
+    native_df = clean_posts(corpus, 'body', 'cleaned_body')
+    udf_seconds = timed('regexp chain + Python UDF', udf_df)
+    native_seconds = timed('native clean_posts', native_df)
+
+    # Stopword contractions differ on purpose: the UDF splits "it's" into "it s" and keeps
+    # the "s", clean_posts drops "it's". Other apostrophes split words in both
+    differing = (udf_df.select('id', F.col('cleaned_body').alias('udf'))
+                 .join(native_df.select('id', F.col('cleaned_body').alias('native')), 'id')
+                 .filter(F.col('udf') != F.col('native'))
+                 .count())
+    print(f"speedup: {udf_seconds / native_seconds:.2f}x, rows that differ: {differing} "
+          f"({differing / args.records:.1%}, from stopword contractions)")
+    corpus.unpersist()
+    spark.stop()
+
+
+def bench_tokenizer(args):
+    """
+    Per-title cost of the title normalization and tokenizing that preprocess_record
+    used to do inline, against text_normalization per title and in batches, and
+    the memory held by the tokens with and without interning.
+    """
+    import gc
+    import tracemalloc
+    from stopwords import STOP_WORDS
+    from text_normalization import normalize_title, normalize_titles, tokenize, tokenize_batch
+
+    titles = [s['title'] for s in load_corpus(args)]
+    # Real titles carry emoji and accents, which take the regex path
+    titles = [title + ' \U0001F525' if i % 10 == 0 else title for i, title in enumerate(titles)]
+
+    def timed(name, function, repeat=5):
+        # Best of a few runs without the garbage collector, like timeit, so the
+        # token lists kept from earlier runs do not slow the later ones down
+        best = None
+        for _ in range(repeat):
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                result = function()
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+        report(name, len(titles), best)
+        print(f"{'':<28} {best / len(titles) * 1e9:8.0f} ns/title")
+        return result
+
+    def inline():
+        tokens = []
+        for title in titles:
+            text = re.sub(r'[^\w\s]', '', title.lower())
+            tokens.append([word for word in text.split() if word not in STOP_WORDS])
+        return tokens
+
+    def batched(intern):
+        tokens = []
+        for batch in chunks(titles, args.batch_size):
+            tokens.extend(tokenize_batch(normalize_titles(batch), intern=intern))
+        return tokens
+
+    expected = timed('inline re.sub + split', inline)
+    single = timed('normalize_title + tokenize', lambda: [tokenize(normalize_title(title)) for title in titles])
+
+    results = {}
+    for intern in (False, True):
+        results[intern] = timed(f"batch ({args.batch_size}){', interned' if intern else ''}",
+                                lambda: batched(intern))
+
+        # Measured separately, tracing slows everything down
+        tracemalloc.start()
+        tokens = batched(intern)
+        print(f"{'':<28} {tracemalloc.get_traced_memory()[0] / 1e6:8.1f} MB held by the tokens")
+        tracemalloc.stop()
+        del tokens
+
+    mismatches = sum(1 for tokens in (single, results[False], results[True]) for a, b in zip(expected, tokens) if a != b)
+    print(f"mismatched titles: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+class InMemoryKinesis:
+    """
+    One in-memory Kinesis shard implementing the calls made by
+    BatchingKinesisProducer and kinesis_consumer.consume_shard. Once closed,
+    get_records returns no NextShardIterator after the last record, like a
+    shard closed by resharding, so consume_shard drains it and returns.
+    """
+
+    shard_id = 'shardId-000000000000'
+
+    def __init__(self):
+        self.records = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def put_records(self, StreamName, Records):
+        results = []
+        with self._lock:
+            for entry in Records:
+                sequence_number = f"{len(self.records):020d}"
+                self.records.append({
+                    'Data': entry['Data'] if isinstance(entry['Data'], bytes) else entry['Data'].encode('utf-8'),
+                    'PartitionKey': entry['PartitionKey'],
+                    'SequenceNumber': sequence_number,
+                    'ApproximateArrivalTimestamp': datetime.now(timezone.utc),
+                })
+                results.append({'ShardId': self.shard_id, 'SequenceNumber': sequence_number})
+        return {'FailedRecordCount': 0, 'Records': results}
+
+    def get_shard_iterator(self, StreamName, ShardId, ShardIteratorType, StartingSequenceNumber=None):
+        if ShardIteratorType == 'AFTER_SEQUENCE_NUMBER':
+            position = int(StartingSequenceNumber) + 1
+        elif ShardIteratorType == 'LATEST':
+            position = len(self.records)
+        else:
+            position = 0
+        return {'ShardIterator': str(position)}
+
+    def get_records(self, ShardIterator, Limit=10000):
+        position = int(ShardIterator)
+        with self._lock:
+            records = self.records[position:position + Limit]
+            remaining = len(self.records) - position - len(records)
+        next_position = position + len(records)
+        drained = self.closed and remaining == 0
+        return {
+            'Records': records,
+            'NextShardIterator': None if drained else str(next_position),
+            'MillisBehindLatest': 1000 * 60 if remaining else 0,
+        }
+
+
+class LocalAthena:
+    """
+    Athena stand-in for reddit_lambda. It answers the export query from the
+    local Parquet dataset written by the consumer: it prunes dt partitions
+    and filters the created_time window of build_query. The result CSV goes
+    to the output location in (moto) S3, formatted the way Athena writes it.
+    """
+
+    def __init__(self, dataset_root, s3_client):
+        import pyarrow.dataset as ds
+        from reddit_lambda import TYPED_EXPORT_COLUMNS
+
+        self.dataset = lambda: ds.dataset(dataset_root, format='parquet', partitioning='hive')
+        self.s3 = s3_client
+        self.columns = [column.split()[-1] for column in TYPED_EXPORT_COLUMNS.split(',\n')]
+        self.executions = {}
+
+    def start_query_execution(self, QueryString, QueryExecutionContext, ResultConfiguration, **_):
+        import csv
+        import io
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        start = time.perf_counter()
+        query_execution_id = f"local-{len(self.executions):06d}"
+        dataset = self.dataset()
+        window = re.findall(r"created_time [<>]=? TIMESTAMP '([^']+)'", QueryString)
+        selection = None
+        if window:
+            low, high = (datetime.strptime(value, '%Y-%m-%d %H:%M:%S') for value in window)
+            selection = ((ds.field('dt') >= f"{low:%Y-%m-%d}") & (ds.field('dt') <= f"{high:%Y-%m-%d}")
+                         & (ds.field('created_time') > pc.scalar(low).cast('timestamp[s]'))
+                         & (ds.field('created_time') <= pc.scalar(high).cast('timestamp[s]')))
+        rows = dataset.to_table(filter=selection).to_pylist() if dataset.files else []
+
+        def athena_value(value):
+            if value is None:
+                return ''
+            if isinstance(value, bool):
+                return 'true' if value else 'false'
+            if isinstance(value, datetime):
+                return value.strftime('%Y-%m-%d %H:%M:%S')
+            return str(value)
+
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(self.columns)
+        for row in rows:
+            writer.writerow([athena_value(row.get(column)) for column in self.columns])
+        output_location = f"{ResultConfiguration['OutputLocation']}{query_execution_id}.csv"
+        bucket, _, key = output_location[len('s3://'):].partition('/')
+        self.s3.put_object(Bucket=bucket, Key=key, Body=output.getvalue().encode('utf-8'))
+
+        self.executions[query_execution_id] = {
+            'QueryExecutionId': query_execution_id,
+            'Status': {'State': 'SUCCEEDED'},
+            'ResultConfiguration': {'OutputLocation': output_location},
+            'Statistics': {'EngineExecutionTimeInMillis': int((time.perf_counter() - start) * 1000),
+                           'DataScannedInBytes': sum(os.path.getsize(path) for path in dataset.files)},
+            'rows': len(rows),
+        }
+        return {'QueryExecutionId': query_execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': self.executions[QueryExecutionId]}
+
+    def stop_query_execution(self, QueryExecutionId):
+        return {}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def bench_pipeline(args):
+    """
+    Replay submissions through the whole pipeline offline and report records/s,
+    p50/p99 per stage and peak RSS:
+    producer -> in-memory Kinesis shard -> consume_shard + process_batch
+    (moto DynamoDB, local Parquet) -> LocalAthena -> lambda_handler (moto S3).
+    The real consumer and Lambda code runs unchanged; only clients and output
+    paths are swapped for local stand-ins.
+    """
+    import resource
+    import tempfile
+    from moto import mock_aws
+
+    submissions = load_corpus(args)
+    # Replay in created_time order at --rate posts per second, as the live stream
+    # delivers them, ending just before the Lambda's late-arrival cut-off
+    submissions.sort(key=lambda submission: submission['created_time'])
+    end = datetime.utcnow() - timedelta(minutes=15)
+    for i, submission in enumerate(submissions):
+        created = end - timedelta(seconds=(len(submissions) - i) / args.rate)
+        submission['created_time'] = created.strftime('%Y-%m-%d %H:%M:%S')
+
+    workdir = tempfile.mkdtemp(prefix='pipeline-bench-')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ['AWS_DEFAULT_REGION'] = 'eu-north-1'
+
+    with mock_aws():
+        import boto3
+        dynamodb = boto3.client('dynamodb', region_name='eu-north-1')
+        for table, key in (('tbl_reddit_processed', 'id'), ('tbl_reddit_rollups', 'rollup_id')):
+            dynamodb.create_table(TableName=table, BillingMode='PAY_PER_REQUEST',
+                                  KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'}],
+                                  AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'}])
+        s3 = boto3.client('s3', region_name='eu-north-1')
+        s3.create_bucket(Bucket='reddit-processed-athena-results',
+                         CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+
+        import kinesis_processing_2 as consumer
+        import reddit_lambda
+        import record_codec
+        import rollups
+        from kinesis_consumer import FileCheckpointStore, consume_shard
+        from kinesis_producer import BatchingKinesisProducer
+        from parquet_writer import ParquetDatasetWriter
+        from record_schema import DeadLetterSink
+
+        # Local outputs instead of S3, Glue and the working directory
+        dataset_root = os.path.join(workdir, 'processed')
+        consumer.parquet_writer = ParquetDatasetWriter(dataset_root, max_buffer_seconds=consumer.parquet_rollover_seconds,
+                                                       spool_path=os.path.join(workdir, 'parquet.spool'))
+        consumer.dead_letters = DeadLetterSink(os.path.join(workdir, 'dead_letters.jsonl'))
+        consumer.author_activity.snapshot_path = os.path.join(workdir, 'author_activity.snapshot')
+        consumer.seen_ids.snapshot_path = os.path.join(workdir, 'seen_ids.snapshot')
+        consumer.rollups.snapshot_path = os.path.join(workdir, 'rollups.snapshot')
+        consumer.use_batch_preprocessing = args.preprocessing == 'batch'
+        if args.conditional_writes:
+            from dynamodb_writer import DynamoDBBatchWriter
+            consumer.dynamodb_writer.close()
+            consumer.dynamodb_writer = DynamoDBBatchWriter('tbl_reddit_processed', dynamodb=consumer.dynamodb_client,
+                                                           conditional=True)
+        consumer.record_log.every = max(consumer.record_log.every, args.records)
+
+        # Producer into the in-memory shard
+        kinesis = InMemoryKinesis()
+        producer = BatchingKinesisProducer('reddit-bde', kinesis_client=kinesis)
+        # A --redeliver share of the records is sent twice, as after retries or a stream reconnect
+        rng = random.Random(args.seed)
+        stream = submissions + [s for s in submissions if rng.random() < args.redeliver]
+        start = time.perf_counter()
+        for submission in stream:
+            producer.put(record_codec.encode_record(submission, args.encoding), submission['id'])
+        producer.close()
+        kinesis.closed = True
+        report(f"producer ({args.encoding})", len(stream), time.perf_counter() - start)
+
+        # The real consumer loop, reading the shard in get_records batches
+        start = time.perf_counter()
+        processed = consume_shard('reddit-bde', kinesis.shard_id, consumer.process_batch,
+                                  FileCheckpointStore(os.path.join(workdir, 'checkpoints')),
+                                  initial_position='TRIM_HORIZON', kinesis_client=kinesis,
+                                  checkpoint_barrier=consumer.wait_for_writes,
+                                  scheduler_options={'min_limit': args.batch_size, 'max_limit': args.batch_size},
+                                  metrics=consumer.metrics)
+        consumer.dynamodb_writer.close()
+        # Emit the windows still open at the end of the corpus too
+        for row in consumer.rollups.close():
+            consumer.rollup_writer.put(rollups.dynamodb_item(row))
+        consumer.rollup_writer.close()
+        consumer.parquet_writer.close()
+        report(f"consumer ({args.preprocessing})", processed, time.perf_counter() - start)
+
+        # Incremental Lambda exports until every window has been exported
+        athena = LocalAthena(dataset_root, s3)
+        reddit_lambda.state_path = os.path.join(workdir, 'export_state.json')
+        reddit_lambda.typed_source = True
+        first = min(s['created_time'] for s in submissions)
+        reddit_lambda.LocalStateStore(reddit_lambda.state_path).set({
+            'high_water_mark': (datetime.strptime(first, '%Y-%m-%d %H:%M:%S')
+                                - timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')})
+        invocations = []
+        start = time.perf_counter()
+        while True:
+            invocation_start = time.perf_counter()
+            response = reddit_lambda.lambda_handler({'mode': 'incremental'}, None,
+                                                    athena_client=athena, s3_client=s3)
+            invocations.append(time.perf_counter() - invocation_start)
+            if response['statusCode'] != 200:
+                raise SystemExit(f"lambda_handler failed: {response['body']}")
+            if not response['body'].get('more_pending'):
+                break
+        exported_rows = sum(execution['rows'] for execution in athena.executions.values())
+        report('lambda_handler (incremental)', exported_rows, time.perf_counter() - start)
+
+        # Every valid record must end up in DynamoDB and in the exported CSVs exactly once
+        stored = sum(page['Count'] for page in dynamodb.get_paginator('scan').paginate(
+            TableName='tbl_reddit_processed', Select='COUNT'))
+        rollup_items = [item for page in dynamodb.get_paginator('scan').paginate(TableName='tbl_reddit_rollups')
+                        for item in page['Items']]
+        exported_lines = 0
+        for page in s3.get_paginator('list_objects_v2').paginate(
+                Bucket='reddit-processed-athena-results', Prefix=reddit_lambda.export_prefix):
+            for obj in page.get('Contents', []):
+                body = s3.get_object(Bucket='reddit-processed-athena-results', Key=obj['Key'])['Body'].read()
+                exported_lines += body.count(b'\n') - 1
+
+    snapshot = consumer.metrics.snapshot()
+    print("\nper-batch stage latency (ms)       count      p50      p99      max")
+    for histogram in snapshot['histograms']:
+        print(f"  {histogram['labels'].get('stage', histogram['name']):<30} {histogram['count']:>7} "
+              f"{histogram['p50'] * 1e3:8.2f} {histogram['p99'] * 1e3:8.2f} {histogram['max'] * 1e3:8.2f}")
+    print(f"  {'lambda_handler':<30} {len(invocations):>7} {percentile(invocations, 0.5) * 1e3:8.2f} "
+          f"{percentile(invocations, 0.99) * 1e3:8.2f} {max(invocations) * 1e3:8.2f}")
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1024 if sys.platform != 'darwin' else peak / 1024 / 1024
+    duplicates = consumer.seen_ids.stats()['hits']
+    valid = processed - duplicates - consumer.dead_letters.count
+    rolled_up = sum(int(item['post_count']['N']) for item in rollup_items if item['window']['S'] == '5m')
+    print(f"\nrollups: {len(rollup_items)} rows, {len(json.dumps(rollup_items)) / 1024:.0f} KB, "
+          f"{rolled_up} records in the 5m windows, {consumer.rollups.late_records} late")
+    print(f"peak RSS: {peak_mb:.0f} MB, dead letters: {consumer.dead_letters.count}, "
+          f"duplicates skipped: {duplicates} ({consumer.seen_ids.stats()['hit_rate']:.1%}), stored in DynamoDB: {stored}, "
+          f"exported: {exported_lines} rows in {len(invocations)} Lambda runs, work directory: {workdir}")
+    print(f"parquet: {consumer.parquet_writer.stats()['files_written']} files")
+    if not stored == exported_lines == valid == rolled_up + consumer.rollups.late_records:
+        raise SystemExit(1)
+
+
+BENCHMARKS = {
+    'author-activity': bench_author_activity,
+    'codec': bench_codec,
+    'dedup': bench_dedup,
+    'pipeline': bench_pipeline,
+    'preprocessing': bench_preprocessing,
+    'producer': bench_producer,
+    'sentiment': bench_sentiment,
+    'spark-cleaning': bench_spark_cleaning,
+    'tokenizer': bench_tokenizer,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the Reddit pipeline")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus', help="JSON lines file of recorded submissions")
+    parser.add_argument('--save-corpus', help="Write the generated submissions to this file")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--rate', type=int, default=50, help="Simulated posts per second")
+    parser.add_argument('--latency', type=float, default=0.01, help="Stub round trip in seconds")
+    parser.add_argument('--conditional-writes', action='store_true',
+                        help="Write with conditional PutItem in the pipeline benchmark")
+    parser.add_argument('--redeliver', type=float, default=0.05, help="Share of records delivered twice")
+    parser.add_argument('--encoding', choices=['json', 'msgpack', 'packed'], default='json',
+                        help="record_codec encoding of the pipeline payloads")
+    parser.add_argument('--preprocessing', choices=['batch', 'record'], default='batch',
+                        help="preprocess_batch or preprocess_record in the pipeline benchmark")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
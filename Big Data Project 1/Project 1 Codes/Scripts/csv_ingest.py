@@ -0,0 +1,129 @@
+import argparse
+import csv
+import logging
+
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+from pyspark.sql import types as T
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Columns of the per-subreddit post exports, as stored in dev_ds_playground.social_posts
+SOCIAL_POSTS_SCHEMA = T.StructType([
+    T.StructField('ID', T.StringType()),
+    T.StructField('is_Original', T.BooleanType()),
+    T.StructField('Flair', T.StringType()),
+    T.StructField('num_comments', T.IntegerType()),
+    T.StructField('Title', T.StringType()),
+    T.StructField('Subreddit', T.StringType()),
+    T.StructField('Body', T.StringType()),
+    T.StructField('URL', T.StringType()),
+    T.StructField('Upvotes', T.IntegerType()),
+    T.StructField('Comments', T.StringType()),
+    T.StructField('creation_date', T.TimestampType()),
+    T.StructField('Text', T.StringType()),
+    T.StructField('Sentiment', T.StringType()),
+])
+
+# Some exports were written from pandas with NaN counts, so "13.0" is read as a
+# double and cast to the integer type afterwards
+READ_TYPES = {
+    'num_comments': T.DoubleType(),
+    'Upvotes': T.DoubleType(),
+}
+
+TIMESTAMP_FORMAT = 'yyyy-MM-dd HH:mm:ss'
+
+
+def discover_files(spark, pattern, exclude=()):
+    """Files matching a glob on any Hadoop filesystem (file://, hdfs://, s3a://), minus excluded names."""
+    jvm = spark._jvm
+    path = jvm.org.apache.hadoop.fs.Path(pattern)
+    filesystem = path.getFileSystem(spark._jsc.hadoopConfiguration())
+    statuses = filesystem.globStatus(path) or []
+    excluded = set(exclude)
+    files = sorted(status.getPath().toString() for status in statuses if status.isFile())
+    return [name for name in files if name.rsplit('/', 1)[-1] not in excluded]
+
+
+def read_header(spark, path):
+    """Column names from the first line of a CSV file, without starting a Spark job."""
+    jvm = spark._jvm
+    file_path = jvm.org.apache.hadoop.fs.Path(path)
+    stream = file_path.getFileSystem(spark._jsc.hadoopConfiguration()).open(file_path)
+    try:
+        line = jvm.java.io.BufferedReader(jvm.java.io.InputStreamReader(stream, 'UTF-8')).readLine() or ''
+    finally:
+        stream.close()
+    return next(csv.reader([line.lstrip('\ufeff')]), [])
+
+
+def file_schema(header, schema=SOCIAL_POSTS_SCHEMA):
+    """
+    Schema to read a file with the given header. Known columns are matched
+    case-insensitively (some exports call it is_original), so files may order
+    them differently; unknown ones such as the pandas index are read as strings
+    and dropped. Returns the schema and the known columns found.
+    """
+    known = {field.name.lower(): field for field in schema}
+    fields = []
+    found = set()
+    for i, name in enumerate(header):
+        field = known.get(name.strip().lower())
+        if field is None or field.name in found:
+            fields.append(T.StructField(f"_ignored_{i}", T.StringType()))
+            continue
+        fields.append(T.StructField(field.name, READ_TYPES.get(field.name, field.dataType)))
+        found.add(field.name)
+    return T.StructType(fields), found
+
+
+def read_social_posts(spark, pattern, exclude=(), schema=SOCIAL_POSTS_SCHEMA):
+    """
+    Read every CSV export matching pattern into one typed DataFrame.
+
+    Files are grouped by header and each group is read with one
+    spark.read.csv call and an explicit schema, so there is no schema
+    inference pass and every file is parsed by its own task, in parallel.
+    Bodies span several lines, hence multiLine. Columns missing from a
+    file are null.
+    """
+    files = discover_files(spark, pattern, exclude)
+    if not files:
+        raise FileNotFoundError(f"No CSV files match {pattern}")
+
+    groups = {}
+    for path in files:
+        groups.setdefault(tuple(read_header(spark, path)), []).append(path)
+    logging.info("Reading %d CSV files with %d distinct headers", len(files), len(groups))
+
+    posts = None
+    for header, paths in groups.items():
+        read_schema, found = file_schema(header, schema)
+        df = spark.read.csv(paths, schema=read_schema, header=True, multiLine=True, escape='"',
+                            timestampFormat=TIMESTAMP_FORMAT)
+        df = df.select(*[(F.col(field.name) if field.name in found else F.lit(None))
+                         .cast(field.dataType).alias(field.name) for field in schema])
+        posts = df if posts is None else posts.unionByName(df)
+    return posts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the subreddit CSV exports into a Hive table")
+    parser.add_argument('pattern', help="Glob of the CSV files, e.g. 'hdfs:///data/reddit/*.csv'")
+    parser.add_argument('--table', default='dev_ds_playground.social_posts')
+    parser.add_argument('--exclude', nargs='*', default=[], help="File names to skip")
+    args = parser.parse_args(argv)
+
+    spark = SparkSession.builder.appName("SocialPostsIngest").enableHiveSupport().getOrCreate()
+
+    posts = read_social_posts(spark, args.pattern, args.exclude)
+    posts.write.saveAsTable(args.table, mode='overwrite')
+    logging.info("Wrote %d posts to %s", spark.table(args.table).count(), args.table)
+
+    spark.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import math
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+SNAPSHOT_VERSION = 1
+
+
+def key_hash(key):
+    """Stable 64-bit hash of a key, the same in every process and run."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class BloomFilter:
+    """
+    Set membership in a fixed bit array. Lookups never miss a key that was
+    added and wrongly report an unseen key with probability error_rate once
+    capacity keys have been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def indexes(self, hashed):
+        # Double hashing derives every bit position from one 64-bit hash
+        h1 = hashed & 0xFFFFFFFF
+        h2 = (hashed >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def contains(self, hashed, indexes=None):
+        bits = self.bits
+        return all(bits[index >> 3] & (1 << (index & 7)) for index in indexes or self.indexes(hashed))
+
+    def add(self, hashed, indexes=None):
+        bits = self.bits
+        for index in indexes or self.indexes(hashed):
+            bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+
+class SeenIds:
+    """
+    Remember recently seen record ids so redelivered records can be skipped.
+
+    mode='lru' keeps the ids themselves, oldest first, so answers are exact;
+    at most capacity ids are kept and ids older than window_seconds are
+    forgotten. mode='bloom' keeps a ring of Bloom filters, one per
+    bucket_seconds of the window (or per capacity / generations ids, if that
+    fills first), and drops whole filters as they expire. Memory is fixed,
+    but about error_rate of new ids are taken for duplicates.
+
+    add() records an id for good. filter_new() only marks ids as pending:
+    they are skipped while this process runs, but are not in the LRU or Bloom
+    filters, or any snapshot, until confirm() says their records were written.
+    A pipeline calls mark_queued() once a batch's writes are queued, and at
+    its checkpoint barrier takes the queued ids with take_queued() before
+    waiting for the writers and confirms them afterwards. An id is therefore
+    only persisted once its write is durable, whichever thread checkpoints.
+
+    With snapshot_path set, the confirmed ids are loaded on start and
+    save_snapshot() writes them back.
+    """
+
+    def __init__(self, mode='lru', capacity=1_000_000, window_seconds=24 * 3600, generations=4,
+                 error_rate=0.001, snapshot_path=None, snapshot_interval=60):
+        if mode not in ('lru', 'bloom'):
+            raise ValueError("mode must be 'lru' or 'bloom'")
+        self.mode = mode
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.generations = generations
+        self.bucket_seconds = window_seconds / generations if window_seconds else None
+        self.error_rate = error_rate
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._last_snapshot = time.time()
+        self.clear()
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    def clear(self):
+        """Forget every id."""
+        self._ids = OrderedDict()  # LRU mode, id -> first seen
+        self._filters = deque()  # Bloom mode, (generation_start, BloomFilter)
+        self._pending = {}  # Marked by filter_new but not confirmed, id -> first seen
+        self._queued = []  # Pending ids whose writes are queued
+
+    def _new_filter(self, now):
+        # Split the error budget so a lookup across every live filter stays near error_rate
+        bloom = BloomFilter(max(1, self.capacity // self.generations), self.error_rate / self.generations)
+        self._filters.append((now, bloom))
+        # Past capacity the oldest generation goes, like the oldest ids of the LRU
+        while len(self._filters) > self.generations:
+            self._filters.popleft()
+        return bloom
+
+    def _evict(self, now):
+        if self.window_seconds:
+            # Pending ids whose writes never came, e.g. records that were dead-lettered
+            cutoff = now - self.window_seconds
+            for key in [key for key, seen in self._pending.items() if seen <= cutoff]:
+                del self._pending[key]
+        if self.mode == 'lru':
+            ids = self._ids
+            cutoff = now - self.window_seconds if self.window_seconds else None
+            while ids and (len(ids) > self.capacity or (cutoff is not None and next(iter(ids.values())) <= cutoff)):
+                ids.popitem(last=False)
+        elif self.window_seconds:
+            cutoff = now - self.window_seconds
+            while self._filters and self._filters[0][0] + self.bucket_seconds <= cutoff:
+                self._filters.popleft()
+
+    def _seen(self, key):
+        """Whether key is pending or confirmed. Call with the lock held."""
+        self.lookups += 1
+        if key in self._pending:
+            seen = True
+        elif self.mode == 'lru':
+            seen = key in self._ids
+        else:
+            hashed = key_hash(key)
+            indexes = self._filters[-1][1].indexes(hashed) if self._filters else None
+            # Filters of one generation size share bit positions, so they are computed once
+            seen = any(bloom.contains(hashed, indexes) for _, bloom in self._filters)
+        if seen:
+            self.hits += 1
+        return seen
+
+    def _confirm(self, key, now):
+        """Add key to the LRU or the current Bloom filter. Call with the lock held."""
+        if self.mode == 'lru':
+            self._ids[key] = now
+            return
+        start, current = self._filters[-1] if self._filters else (None, None)
+        if current is None or current.count >= current.capacity or \
+                (self.bucket_seconds and start + self.bucket_seconds <= now):
+            current = self._new_filter(now)
+        current.add(key_hash(key))
+
+    def add(self, key, timestamp=None):
+        """Record one id as confirmed and return True if it is a duplicate."""
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._evict(now)
+            if self._seen(key):
+                return True
+            self._confirm(key, now)
+            return False
+
+    def filter_new(self, items, key_name='id', timestamp=None):
+        """
+        Items whose key was not seen before, in order. Their keys are marked
+        pending, so a duplicate inside items is dropped as well.
+        """
+        now = time.time() if timestamp is None else timestamp
+        fresh = []
+        with self._lock:
+            self._evict(now)
+            for item in items:
+                key = item[key_name]
+                if not self._seen(key):
+                    self._pending[key] = now
+                    fresh.append(item)
+        return fresh
+
+    def mark_queued(self, keys):
+        """Note that the writes of these pending ids are queued."""
+        with self._lock:
+            self._queued.extend(keys)
+
+    def take_queued(self):
+        """The ids queued so far, to confirm once the writers have been waited on."""
+        with self._lock:
+            keys, self._queued = self._queued, []
+        return keys
+
+    def confirm(self, keys):
+        """Move pending ids whose records are durably written into the LRU or Bloom filters."""
+        with self._lock:
+            for key in keys:
+                seen = self._pending.pop(key, None)
+                if seen is not None:
+                    self._confirm(key, seen)
+
+    def discard(self, keys):
+        """Forget pending ids whose processing failed, so a redelivery is processed again."""
+        with self._lock:
+            for key in keys:
+                self._pending.pop(key, None)
+
+    def stats(self):
+        """Lookups, hits and the hit rate since start."""
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'tracked': len(self._ids) if self.mode == 'lru' else sum(b.count for _, b in self._filters),
+                'pending': len(self._pending),
+            }
+
+    def memory_bytes(self):
+        """Approximate memory held by the ids or filters."""
+        with self._lock:
+            pending = sys.getsizeof(self._pending) + sum(sys.getsizeof(key) for key in self._pending)
+            if self.mode == 'bloom':
+                return pending + sum(bloom.memory_bytes() for _, bloom in self._filters)
+            return pending + sys.getsizeof(self._ids) + sum(sys.getsizeof(key) for key in self._ids)
+
+    def maybe_snapshot(self):
+        """Write a snapshot if snapshot_interval has passed since the last one."""
+        if self.snapshot_path and time.time() - self._last_snapshot >= self.snapshot_interval:
+            self.save_snapshot()
+
+    def save_snapshot(self, path=None):
+        """Write the confirmed ids to local disk, replacing the previous snapshot atomically."""
+        path = path or self.snapshot_path
+        with self._lock:
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'mode': self.mode,
+                'capacity': self.capacity,
+                'generations': self.generations,
+                'error_rate': self.error_rate,
+                'ids': self._ids,
+                'filters': self._filters,
+            }
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._last_snapshot = time.time()
+
+    def load_snapshot(self, path):
+        """Restore ids written by save_snapshot with the same settings."""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        settings = (self.mode, self.capacity, self.generations, self.error_rate)
+        if state.get('version') != SNAPSHOT_VERSION or \
+                (state['mode'], state['capacity'], state['generations'], state['error_rate']) != settings:
+            logging.warning("Ignoring seen id snapshot %s written with other settings", path)
+            return
+        with self._lock:
+            self._ids = state['ids']
+            self._filters = state['filters']
+            self._evict(time.time())
+        logging.info("Loaded %s seen ids from %s", self.mode, path)
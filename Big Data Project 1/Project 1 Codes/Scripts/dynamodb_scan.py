@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+RETRYABLE_ERRORS = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+}
+
+
+class TokenBucket:
+    """
+    Rate limiter in capacity units per second.
+    A scan page's cost is only known after it is read, so consume() lets the
+    balance go negative and the next acquire() waits until it is paid back.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Wait until earlier reads are paid back."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 0:
+                    return
+                wait = -self._tokens / self.rate
+            self.sleep(wait)
+
+    def consume(self, units):
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+
+
+def plain_value(value, integral=False):
+    """
+    Turn DynamoDB's Decimal, set and Binary values into plain Python types.
+    Numbers become float, so an attribute keeps one type across items and
+    Spark can infer its schema; with integral set, whole numbers become int.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if integral and value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(plain_value(item, integral) for item in value)
+    if isinstance(value, list):
+        return [plain_value(item, integral) for item in value]
+    if isinstance(value, dict):
+        return {key: plain_value(item, integral) for key, item in value.items()}
+    if hasattr(value, 'value') and isinstance(value.value, bytes):
+        return value.value
+    return value
+
+
+def projection_params(columns):
+    """ProjectionExpression with placeholders, so reserved words like `name` work."""
+    if not columns:
+        return {}
+    names = {f"#c{i}": column for i, column in enumerate(columns)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+
+def scan_segment(table_name, segment, total_segments, columns=None, units_per_second=None,
+                 page_size=None, region_name='eu-north-1', endpoint_url=None, dynamodb_client=None,
+                 max_retries=8, integer_attributes=()):
+    """
+    Yield the items of one parallel scan segment as plain dicts.
+    Pages are throttled to units_per_second read capacity units when it is set.
+    Numbers are floats, except whole numbers of integer_attributes such as
+    numeric key attributes.
+    """
+    client = dynamodb_client or boto3.client('dynamodb', region_name=region_name, endpoint_url=endpoint_url)
+    deserializer = TypeDeserializer()
+    limiter = TokenBucket(units_per_second) if units_per_second else None
+
+    params = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'ReturnConsumedCapacity': 'TOTAL',
+    }
+    params.update(projection_params(columns))
+    if page_size:
+        params['Limit'] = page_size
+
+    retries = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        try:
+            response = client.scan(**params)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in RETRYABLE_ERRORS or retries >= max_retries:
+                raise
+            retries += 1
+            time.sleep(min(10.0, 0.1 * 2 ** retries))
+            continue
+        retries = 0
+
+        if limiter:
+            limiter.consume(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+        for item in response.get('Items', []):
+            yield {key: plain_value(deserializer.deserialize(value), key in integer_attributes)
+                   for key, value in item.items()}
+
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def integral_fields(schema):
+    """Names of the fields of a Spark schema that hold whole numbers."""
+    return [field.name for field in schema.fields
+            if field.dataType.typeName() in ('byte', 'short', 'integer', 'long')]
+
+
+def table_read_capacity(table_name, region_name='eu-north-1', endpoint_url=None, dynamodb_client=None):
+    """Provisioned read capacity of a table, None for on-demand tables."""
+    client = dynamodb_client or boto3.client('dynamodb', region_name=region_name, endpoint_url=endpoint_url)
+    table = client.describe_table(TableName=table_name)['Table']
+    units = table.get('ProvisionedThroughput', {}).get('ReadCapacityUnits', 0)
+    return units or None
+
+
+def read_dynamodb_table(spark, table_name, schema=None, columns=None, total_segments=None,
+                        read_capacity_fraction=0.5, read_capacity_units=None, page_size=None,
+                        region_name='eu-north-1', endpoint_url=None):
+    """
+    Load a DynamoDB table into a DataFrame with a parallel scan.
+
+    Each Spark partition scans one of total_segments segments (default: the
+    default parallelism), so the table is read by every executor at once.
+    Only `columns` (default: the schema's fields) are read from DynamoDB.
+    Passing a schema also avoids inferring types from the scanned items.
+    Numbers of its integer fields are read as int and all others as double.
+    Without a schema every number is read as a double, and the returned
+    DataFrame is cached so the table is scanned only once: call unpersist()
+    on it when done.
+    Together the segments use at most read_capacity_fraction of the table's
+    provisioned read capacity, or read_capacity_units if given; on-demand
+    tables are not throttled unless read_capacity_units is set.
+    """
+    from pyspark import StorageLevel
+
+    total_segments = total_segments or spark.sparkContext.defaultParallelism
+    if columns is None and schema is not None:
+        columns = schema.fieldNames()
+    if read_capacity_units is None:
+        provisioned = table_read_capacity(table_name, region_name, endpoint_url)
+        read_capacity_units = provisioned * read_capacity_fraction if provisioned else None
+    units_per_segment = read_capacity_units / total_segments if read_capacity_units else None
+    logging.info("Scanning %s in %d segments, %s RCU per segment", table_name, total_segments,
+                 units_per_segment or 'unlimited')
+
+    integer_attributes = frozenset(integral_fields(schema)) if schema is not None else ()
+
+    def scan_partition(segments):
+        for segment in segments:
+            yield from scan_segment(table_name, segment, total_segments, columns, units_per_segment,
+                                    page_size, region_name, endpoint_url, integer_attributes=integer_attributes)
+
+    items = spark.sparkContext.parallelize(range(total_segments), total_segments).mapPartitions(scan_partition)
+    if schema is not None:
+        names = schema.fieldNames()
+        return spark.createDataFrame(items.map(lambda item: tuple(item.get(name) for name in names)), schema)
+
+    # Without a schema the attribute names and types come from the items themselves.
+    # The items are cached for those passes, then the DataFrame the caller gets.
+    items = items.persist()
+    names = sorted(items.flatMap(lambda item: item.keys()).distinct().collect())
+    df = spark.createDataFrame(items.map(lambda item: tuple(item.get(name) for name in names)), names,
+                               samplingRatio=1.0).persist(StorageLevel.MEMORY_AND_DISK)
+    df.count()
+    items.unpersist()
+    return df
@@ -0,0 +1,249 @@
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+# DynamoDB accepts at most 25 put requests per BatchWriteItem call
+MAX_BATCH_SIZE = 25
+
+# Error codes that are worth retrying with backoff
+RETRYABLE_ERRORS = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable',
+}
+
+
+class DynamoDBBatchWriter:
+    """
+    Buffer records and write them to DynamoDB with BatchWriteItem.
+
+    Records are grouped into batches of up to 25 items. Full batches are handed
+    to a background thread, so the caller can fetch and preprocess the next
+    Kinesis batch while the previous one is being written. Unprocessed items
+    returned by DynamoDB are retried with exponential backoff.
+
+    BatchWriteItem cannot take a condition and overwrites existing items. With
+    conditional=True each item is written with its own PutItem, on
+    conditional_workers threads, only if no item with its key exists yet, so
+    a redelivered record never replaces the first copy. Rejected items are
+    counted as items_duplicate.
+
+    Items that could not be written, because retries ran out or DynamoDB
+    rejected the request, are kept and returned by the next wait() or
+    close(), so the caller can avoid checkpointing past them.
+    """
+
+    def __init__(self, table_name, dynamodb=None, region_name='eu-north-1',
+                 batch_size=MAX_BATCH_SIZE, max_retries=8, base_backoff=0.05,
+                 max_backoff=5.0, max_pending_batches=16, key_name='id',
+                 conditional=False, conditional_workers=8):
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+
+        # The resource API serializes plain Python types (str, Decimal, list, ...)
+        # so it accepts the same items as Table.put_item
+        self.dynamodb = dynamodb or boto3.resource('dynamodb', region_name=region_name)
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.key_name = key_name
+        self.conditional = conditional
+
+        self._table = self.dynamodb.Table(table_name) if conditional else None
+        self._put_pool = ThreadPoolExecutor(conditional_workers, 'dynamodb-put') if conditional else None
+        self._buffer = {}
+        self._buffer_lock = threading.Lock()
+        self._failed = []  # Items given up on since the last wait()
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._lock = threading.Lock()
+        self._stats = {
+            'flushes': 0,
+            'items_written': 0,
+            'items_failed': 0,
+            'items_duplicate': 0,
+            'retries': 0,
+            'total_flush_seconds': 0.0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+        }
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='dynamodb-writer', daemon=True)
+        self._worker.start()
+
+    def put(self, item):
+        """Add an item to the current batch, handing it off once it is full."""
+        if self._closed:
+            raise RuntimeError("DynamoDBBatchWriter is closed")
+
+        with self._buffer_lock:
+            # BatchWriteItem rejects duplicate keys in one request, keep the latest version
+            self._buffer[item[self.key_name]] = item
+            if len(self._buffer) < self.batch_size:
+                return
+            batch = self._take_buffer()
+        self._queue.put(batch)
+
+    def flush(self):
+        """Hand off the current partial batch to the background writer."""
+        with self._buffer_lock:
+            batch = self._take_buffer()
+        if batch:
+            # Blocks when the writer falls too far behind, which applies backpressure
+            self._queue.put(batch)
+
+    def _take_buffer(self):
+        batch = list(self._buffer.values())
+        self._buffer = {}
+        return batch
+
+    def wait(self):
+        """
+        Flush the buffer and block until every queued batch has been handled.
+        Returns the items that could not be written since the last wait.
+        """
+        self.flush()
+        self._queue.join()
+        with self._lock:
+            failed, self._failed = self._failed, []
+        return failed
+
+    def close(self):
+        """
+        Write everything that is still buffered and stop the background thread.
+        Returns the items that could not be written, like wait().
+        """
+        if self._closed:
+            return []
+        failed = self.wait()
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        if self._put_pool is not None:
+            self._put_pool.shutdown()
+        return failed
+
+    def stats(self):
+        """Return a snapshot of the flush latency and throughput counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending_batches'] = self._queue.qsize()
+        if stats['flushes']:
+            stats['avg_flush_seconds'] = stats['total_flush_seconds'] / stats['flushes']
+        else:
+            stats['avg_flush_seconds'] = 0.0
+        if stats['total_flush_seconds'] > 0:
+            stats['items_per_second'] = stats['items_written'] / stats['total_flush_seconds']
+        else:
+            stats['items_per_second'] = 0.0
+        return stats
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                self._write_batch(batch)
+            except Exception as e:
+                # Never let the worker die, otherwise wait() would block forever
+                logging.error("Error writing batch to DynamoDB: %s", e)
+                with self._lock:
+                    self._stats['items_failed'] += len(batch)
+                    self._failed.extend(batch)
+            finally:
+                self._queue.task_done()
+
+    def _write_batch(self, batch):
+        if self.conditional:
+            return self._write_conditional(batch)
+
+        start = time.perf_counter()
+        requests = [{'PutRequest': {'Item': item}} for item in batch]
+        retries = 0
+
+        while requests:
+            try:
+                response = self.dynamodb.batch_write_item(RequestItems={self.table_name: requests})
+                requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            except ClientError as e:
+                if e.response['Error']['Code'] not in RETRYABLE_ERRORS:
+                    # Items of earlier attempts are written, only the remaining ones failed
+                    logging.error("DynamoDB batch write failed: %s", e)
+                    break
+                logging.warning("DynamoDB batch write throttled: %s", e)
+
+            if requests:
+                if retries >= self.max_retries:
+                    break
+                self._sleep_backoff(retries)
+                retries += 1
+
+        elapsed = time.perf_counter() - start
+        written = len(batch) - len(requests)
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['items_written'] += written
+            self._stats['items_failed'] += len(requests)
+            self._failed.extend(request['PutRequest']['Item'] for request in requests)
+            self._stats['retries'] += retries
+            self._stats['total_flush_seconds'] += elapsed
+            self._stats['last_flush_seconds'] = elapsed
+            self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+
+        if requests:
+            logging.error("Gave up on %d items after %d retries", len(requests), retries)
+        logging.debug("Flushed %d items to DynamoDB in %.3fs", written, elapsed)
+
+    def _write_conditional(self, batch):
+        start = time.perf_counter()
+        outcomes = list(self._put_pool.map(self._put_if_absent, batch))
+        elapsed = time.perf_counter() - start
+        failed_items = [item for item, (outcome, _) in zip(batch, outcomes) if outcome == 'failed']
+        failed = len(failed_items)
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['items_written'] += sum(1 for outcome, _ in outcomes if outcome == 'written')
+            self._stats['items_duplicate'] += sum(1 for outcome, _ in outcomes if outcome == 'duplicate')
+            self._stats['items_failed'] += failed
+            self._failed.extend(failed_items)
+            self._stats['retries'] += sum(retries for _, retries in outcomes)
+            self._stats['total_flush_seconds'] += elapsed
+            self._stats['last_flush_seconds'] = elapsed
+            self._stats['max_flush_seconds'] = max(self._stats['max_flush_seconds'], elapsed)
+
+        if failed:
+            logging.error("Gave up on %d conditional puts after %d retries", failed, self.max_retries)
+        logging.debug("Wrote %d items to DynamoDB conditionally in %.3fs", len(batch), elapsed)
+
+    def _put_if_absent(self, item):
+        """PutItem unless the key exists, returning the outcome and the number of retries."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._table.put_item(Item=item, ConditionExpression='attribute_not_exists(#key)',
+                                     ExpressionAttributeNames={'#key': self.key_name})
+                return 'written', attempt
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code == 'ConditionalCheckFailedException':
+                    return 'duplicate', attempt
+                if code not in RETRYABLE_ERRORS:
+                    logging.error("Conditional put of %s failed: %s", item.get(self.key_name), e)
+                    return 'failed', attempt
+                if attempt < self.max_retries:
+                    self._sleep_backoff(attempt)
+        return 'failed', self.max_retries
+
+    def _sleep_backoff(self, attempt):
+        # Exponential backoff with jitter so parallel writers don't retry in lockstep
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        time.sleep(delay * random.uniform(0.5, 1.0))
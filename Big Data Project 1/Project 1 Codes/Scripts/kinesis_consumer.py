@@ -0,0 +1,439 @@
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Checkpoint value stored once a closed shard has been read to the end
+SHARD_END = 'SHARD_END'
+
+# Largest Limit accepted by GetRecords
+MAX_GET_RECORDS_LIMIT = 10000
+
+# Latest fetch metrics of every shard consumed by this process
+shard_metrics = {}
+
+# The shard whose records each thread is processing
+_current = threading.local()
+
+
+def current_shard_id():
+    """
+    Id of the shard whose records process_records, or whose checkpoint_barrier,
+    is running in this thread, None outside consume_shard.
+    """
+    return getattr(_current, 'shard_id', None)
+
+
+class AdaptiveFetchScheduler:
+    """
+    Choose the Limit and the delay before the next get_records call of a shard.
+
+    While the shard is lagging (MillisBehindLatest above lag_threshold_ms) the
+    limit doubles up to max_limit and the next read happens immediately. Once
+    the consumer has caught up the limit shrinks back towards min_limit and
+    reads are spaced to stay within the per-shard read quota. Empty reads and
+    throttling errors back off exponentially.
+    """
+
+    def __init__(self, min_limit=100, max_limit=MAX_GET_RECORDS_LIMIT, lag_threshold_ms=1000,
+                 min_idle_delay=0.2, max_idle_delay=1.0, throttle_delay=0.5,
+                 max_throttle_delay=10.0, rate_window=5.0):
+        self.min_limit = min_limit
+        self.max_limit = min(max_limit, MAX_GET_RECORDS_LIMIT)
+        self.lag_threshold_ms = lag_threshold_ms
+        self.min_idle_delay = min_idle_delay
+        self.max_idle_delay = max_idle_delay
+        self.throttle_delay = throttle_delay
+        self.max_throttle_delay = max_throttle_delay
+        self.rate_window = rate_window
+
+        self.limit = min_limit
+        self.millis_behind_latest = None
+        self.records_per_second = 0.0
+        self.fetches = 0
+        self.records = 0
+        self.empty_reads = 0
+        self.throttles = 0
+        self._consecutive_empty = 0
+        self._consecutive_throttles = 0
+        self._window_start = time.time()
+        self._window_records = 0
+
+    def record_fetch(self, record_count, millis_behind_latest=None):
+        """Update the schedule after a successful read and return the delay in seconds."""
+        self.fetches += 1
+        self.records += record_count
+        self.millis_behind_latest = millis_behind_latest
+        self._consecutive_throttles = 0
+        self._update_rate(record_count)
+
+        lagging = millis_behind_latest is not None and millis_behind_latest > self.lag_threshold_ms
+
+        if record_count == 0:
+            self.empty_reads += 1
+            self._consecutive_empty += 1
+            if lagging:
+                # Empty reads can happen inside a gap in the stream, keep reading
+                return 0.0
+            self.limit = self.min_limit
+            return min(self.max_idle_delay, self.min_idle_delay * (2 ** (self._consecutive_empty - 1)))
+
+        self._consecutive_empty = 0
+        if lagging or record_count >= self.limit:
+            self.limit = min(self.max_limit, self.limit * 2)
+            return 0.0
+
+        # Caught up, keep to the 5 reads per second per shard quota
+        self.limit = max(self.min_limit, self.limit // 2)
+        return self.min_idle_delay
+
+    def record_throttle(self):
+        """Shrink the limit after ProvisionedThroughputExceededException and return the delay."""
+        self.throttles += 1
+        self._consecutive_throttles += 1
+        self.limit = max(self.min_limit, self.limit // 2)
+        delay = min(self.max_throttle_delay, self.throttle_delay * (2 ** (self._consecutive_throttles - 1)))
+        # Jitter so shards throttled together don't retry together
+        return delay * random.uniform(0.5, 1.0)
+
+    def metrics(self):
+        """Return the lag, throughput and throttle counters."""
+        return {
+            'limit': self.limit,
+            'millis_behind_latest': self.millis_behind_latest,
+            'records_per_second': self.records_per_second,
+            'fetches': self.fetches,
+            'records': self.records,
+            'empty_reads': self.empty_reads,
+            'throttles': self.throttles,
+        }
+
+    def _update_rate(self, record_count):
+        self._window_records += record_count
+        elapsed = time.time() - self._window_start
+        if elapsed >= self.rate_window:
+            self.records_per_second = self._window_records / elapsed
+            self._window_start = time.time()
+            self._window_records = 0
+
+
+class FileCheckpointStore:
+    """
+    Keep one small JSON file per shard in a local directory.
+    Each shard is only written by the worker that owns it, so threads and
+    processes never contend for the same file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, shard_id):
+        return os.path.join(self.directory, f"{shard_id}.json")
+
+    def get(self, shard_id):
+        """Return the last checkpointed sequence number for a shard, or None."""
+        try:
+            with open(self._path(shard_id)) as f:
+                return json.load(f)['sequence_number']
+        except FileNotFoundError:
+            return None
+
+    def set(self, shard_id, sequence_number):
+        """Save a checkpoint, replacing the file atomically."""
+        path = self._path(shard_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'sequence_number': sequence_number, 'updated_at': time.time()}, f)
+        os.replace(tmp_path, path)
+
+
+class SQLiteCheckpointStore:
+    """Keep checkpoints for a stream in a local SQLite database."""
+
+    def __init__(self, path, stream_name):
+        self.path = path
+        self.stream_name = stream_name
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints ('
+                'stream_name TEXT NOT NULL, '
+                'shard_id TEXT NOT NULL, '
+                'sequence_number TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'PRIMARY KEY (stream_name, shard_id))'
+            )
+
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe to share
+        # between threads and to pickle into worker processes
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, shard_id):
+        """Return the last checkpointed sequence number for a shard, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT sequence_number FROM checkpoints WHERE stream_name = ? AND shard_id = ?',
+                (self.stream_name, shard_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, shard_id, sequence_number):
+        """Insert or update the checkpoint for a shard."""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)',
+                (self.stream_name, shard_id, sequence_number, time.time())
+            )
+
+
+def list_shards(kinesis_client, stream_name):
+    """Return every shard of the stream, following pagination."""
+    shards = []
+    response = kinesis_client.list_shards(StreamName=stream_name)
+    shards.extend(response['Shards'])
+    while response.get('NextToken'):
+        response = kinesis_client.list_shards(NextToken=response['NextToken'])
+        shards.extend(response['Shards'])
+    return shards
+
+
+def eligible_shards(shards, checkpoint_store):
+    """
+    Return the shards that can be read now.
+    A shard is skipped once it has been read to the end, and a child shard
+    created by a split or merge only becomes eligible after all of its
+    parents are finished, so records are processed in order.
+    """
+    shard_ids = {shard['ShardId'] for shard in shards}
+    finished = {shard_id for shard_id in shard_ids if checkpoint_store.get(shard_id) == SHARD_END}
+
+    eligible = []
+    for shard in shards:
+        if shard['ShardId'] in finished:
+            continue
+        parents = [shard.get('ParentShardId'), shard.get('AdjacentParentShardId')]
+        # Parents that are no longer listed have expired past the retention period
+        if all(parent is None or parent not in shard_ids or parent in finished for parent in parents):
+            eligible.append(shard)
+    return eligible
+
+
+def has_parent_in(shard, shards):
+    """Return True if a parent of the shard is still part of the stream."""
+    shard_ids = {s['ShardId'] for s in shards}
+    return any(shard.get(key) in shard_ids for key in ('ParentShardId', 'AdjacentParentShardId'))
+
+
+def get_shard_iterator(kinesis_client, stream_name, shard_id, sequence_number=None,
+                       initial_position='LATEST'):
+    """Resume after a checkpoint if there is one, otherwise start at initial_position."""
+    if sequence_number:
+        response = kinesis_client.get_shard_iterator(
+            StreamName=stream_name,
+            ShardId=shard_id,
+            ShardIteratorType='AFTER_SEQUENCE_NUMBER',
+            StartingSequenceNumber=sequence_number
+        )
+    else:
+        response = kinesis_client.get_shard_iterator(
+            StreamName=stream_name,
+            ShardId=shard_id,
+            ShardIteratorType=initial_position
+        )
+    return response['ShardIterator']
+
+
+def consume_shard(stream_name, shard_id, process_records, checkpoint_store,
+                  initial_position='LATEST', deadline=None, kinesis_client=None,
+                  region_name='eu-north-1', checkpoint_barrier=None, checkpoint_interval=10,
+                  scheduler_options=None, metrics=None):
+    """
+    Read one shard until it is closed or the deadline passes.
+
+    process_records is called with each non-empty batch of records. Checkpoints
+    are saved every checkpoint_interval seconds and when the loop exits. If
+    checkpoint_barrier is given it is called first, so a checkpoint is only
+    saved once the records before it have been durably written.
+    The pace of reads is set by an AdaptiveFetchScheduler built from
+    scheduler_options, and its metrics are published in shard_metrics.
+    With a metrics.MetricsRegistry the get_records time, records, bytes and
+    throttles are counted as well.
+    current_shard_id() returns shard_id while process_records and
+    checkpoint_barrier run. If checkpoint_barrier raises, no checkpoint is
+    saved and the exception ends the shard's consumer.
+    Returns the number of records processed.
+    """
+    kinesis_client = kinesis_client or boto3.client('kinesis', region_name=region_name)
+    scheduler = AdaptiveFetchScheduler(**(scheduler_options or {}))
+
+    last_sequence_number = checkpoint_store.get(shard_id)
+    shard_iterator = get_shard_iterator(kinesis_client, stream_name, shard_id,
+                                        last_sequence_number, initial_position)
+    checkpointed_sequence_number = last_sequence_number
+    last_checkpoint_time = time.time()
+    processed = 0
+
+    def checkpoint(sequence_number):
+        if checkpoint_barrier:
+            _current.shard_id = shard_id
+            try:
+                checkpoint_barrier()
+            finally:
+                _current.shard_id = None
+        checkpoint_store.set(shard_id, sequence_number)
+
+    while shard_iterator is not None:
+        if deadline is not None and time.time() >= deadline:
+            break
+
+        try:
+            fetch_start = time.perf_counter()
+            response = kinesis_client.get_records(ShardIterator=shard_iterator, Limit=scheduler.limit)
+            if metrics is not None:
+                metrics.observe('stage_seconds', time.perf_counter() - fetch_start, stage='get_records')
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if metrics is not None:
+                metrics.inc('errors', type=code)
+            if code == 'ExpiredIteratorException':
+                shard_iterator = get_shard_iterator(kinesis_client, stream_name, shard_id,
+                                                    last_sequence_number, initial_position)
+                continue
+            if code == 'ProvisionedThroughputExceededException':
+                delay = scheduler.record_throttle()
+                logging.warning("Throttled reading shard %s, retrying in %.2fs", shard_id, delay)
+                shard_metrics[shard_id] = scheduler.metrics()
+                time.sleep(delay)
+                continue
+            raise
+
+        records = response['Records']
+        shard_iterator = response.get('NextShardIterator')
+        if metrics is not None:
+            metrics.inc('records_received', len(records))
+            metrics.inc('bytes_received', sum(len(record['Data']) for record in records))
+        delay = scheduler.record_fetch(len(records), response.get('MillisBehindLatest'))
+        shard_metrics[shard_id] = scheduler.metrics()
+
+        if records:
+            _current.shard_id = shard_id
+            try:
+                process_records(records)
+            finally:
+                _current.shard_id = None
+            processed += len(records)
+            last_sequence_number = records[-1]['SequenceNumber']
+
+        if (last_sequence_number != checkpointed_sequence_number
+                and time.time() - last_checkpoint_time >= checkpoint_interval):
+            checkpoint(last_sequence_number)
+            checkpointed_sequence_number = last_sequence_number
+            last_checkpoint_time = time.time()
+
+        if shard_iterator is not None and delay > 0:
+            # Only wait when the shard is idle, lagging shards are read back to back
+            time.sleep(delay)
+
+    if shard_iterator is None:
+        # The shard was closed by a split or merge and has been fully read
+        logging.info("Reached the end of shard %s", shard_id)
+        checkpoint(SHARD_END)
+    elif last_sequence_number != checkpointed_sequence_number:
+        checkpoint(last_sequence_number)
+
+    return processed
+
+
+def run_consumer(stream_name, process_records, checkpoint_store, time_limit=None,
+                 executor='thread', max_workers=None, initial_position='LATEST',
+                 kinesis_client=None, region_name='eu-north-1', checkpoint_barrier=None,
+                 discovery_interval=30, **shard_options):
+    """
+    Consume every shard of a stream in parallel until the time limit passes.
+
+    The shard list is refreshed every discovery_interval seconds so children
+    created by resharding are picked up once their parents are finished.
+    With executor='process' each shard runs in its own process, in which case
+    process_records, checkpoint_barrier and checkpoint_store must be picklable.
+    Returns the total number of records processed.
+    """
+    if executor not in ('thread', 'process'):
+        raise ValueError("executor must be 'thread' or 'process'")
+
+    kinesis_client = kinesis_client or boto3.client('kinesis', region_name=region_name)
+    deadline = time.time() + time_limit.total_seconds() if time_limit else None
+
+    if max_workers is None:
+        max_workers = 64 if executor == 'thread' else (os.cpu_count() or 1)
+
+    if executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        # Spawn fresh interpreters, forked children would inherit dead writer threads
+        pool = ProcessPoolExecutor(max_workers=max_workers,
+                                   mp_context=multiprocessing.get_context('spawn'))
+
+    running = {}
+    total_processed = 0
+
+    with pool:
+        while deadline is None or time.time() < deadline:
+            shards = list_shards(kinesis_client, stream_name)
+            ready = [shard for shard in eligible_shards(shards, checkpoint_store)
+                     if shard['ShardId'] not in running]
+
+            if len(running) + len(ready) > max_workers:
+                logging.warning("%d shards are ready but only %d workers are available",
+                                len(running) + len(ready), max_workers)
+
+            for shard in ready[:max_workers - len(running)]:
+                shard_id = shard['ShardId']
+                # Children of a split or merge start where their parents ended
+                position = 'TRIM_HORIZON' if has_parent_in(shard, shards) else initial_position
+                options = dict(shard_options, initial_position=position, deadline=deadline,
+                               checkpoint_barrier=checkpoint_barrier)
+                if executor == 'thread':
+                    # boto3 clients are thread safe, so threads can share one
+                    options['kinesis_client'] = kinesis_client
+                else:
+                    options['region_name'] = region_name
+                logging.info("Starting consumer for shard %s", shard_id)
+                running[shard_id] = pool.submit(consume_shard, stream_name, shard_id,
+                                                process_records, checkpoint_store, **options)
+
+            timeout = discovery_interval
+            if deadline is not None:
+                timeout = max(0, min(timeout, deadline - time.time()))
+            if running:
+                wait(list(running.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)
+
+            if shard_metrics:
+                logging.info("Shard metrics: %s", shard_metrics)
+
+            for shard_id, future in list(running.items()):
+                if future.done():
+                    del running[shard_id]
+                    try:
+                        total_processed += future.result()
+                    except Exception as e:
+                        # The shard is picked up again from its checkpoint on the next pass
+                        logging.error("Consumer for shard %s failed: %s", shard_id, e)
+
+        for shard_id, future in running.items():
+            try:
+                total_processed += future.result()
+            except Exception as e:
+                logging.error("Consumer for shard %s failed: %s", shard_id, e)
+
+    return total_processed
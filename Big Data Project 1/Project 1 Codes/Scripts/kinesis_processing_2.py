@@ -1,34 +1,40 @@
 import boto3
-import json
-import re
 import pandas as pd
-import time
+from collections import deque
 from datetime import datetime, timezone, timedelta
-from textblob import TextBlob
 import numpy as np
 from decimal import Decimal
+import glob
 import logging
+import os
+import threading
+
+from anomaly_detection import StreamingAnomalyDetector
+from author_activity import AuthorActivityStore
+from dedup import SeenIds
+from dynamodb_writer import DynamoDBBatchWriter
+from kinesis_consumer import SQLiteCheckpointStore, current_shard_id, run_consumer
+from metrics import MetricsRegistry, RuntimeProfiler, SampledLog
+from record_codec import decode_record
+from record_schema import DeadLetterSink, validate_payload, validate_processed
+
+try:
+    from parquet_writer import GluePartitionRegistrar, ParquetDatasetWriter, processed_row
+except ImportError:  # pyarrow is only needed when parquet_output is set
+    GluePartitionRegistrar = ParquetDatasetWriter = processed_row = None
+from rollups import WindowedRollups, dynamodb_item
+from sentiment import SentimentScorer
+from stopwords import STOP_WORDS
+from text_normalization import normalize_title, normalize_titles, tokenize, tokenize_batch
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Custom stopwords list
-stop_words = {
-    'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 'and', 'any', 'are', 'aren\'t', 'as',
-    'at', 'be', 'because', 'been', 'before', 'being', 'below', 'between', 'both', 'but', 'by', 'can\'t', 'cannot',
-    'could', 'couldn\'t', 'did', 'didn\'t', 'do', 'does', 'doesn\'t', 'doing', 'don\'t', 'down', 'during', 'each',
-    'few', 'for', 'from', 'further', 'had', 'hadn\'t', 'has', 'hasn\'t', 'have', 'haven\'t', 'having', 'he', 'he\'d',
-    'he\'ll', 'he\'s', 'her', 'here', 'here\'s', 'hers', 'herself', 'him', 'himself', 'his', 'how', 'how\'s', 'i', 
-    'i\'d', 'i\'ll', 'i\'m', 'i\'ve', 'if', 'in', 'into', 'is', 'isn\'t', 'it', 'it\'s', 'its', 'itself', 'let\'s',
-    'me', 'more', 'most', 'mustn\'t', 'my', 'myself', 'no', 'nor', 'not', 'of', 'off', 'on', 'once', 'only', 'or', 
-    'other', 'ought', 'our', 'ours', 'ourselves', 'out', 'over', 'own', 'same', 'shan\'t', 'she', 'she\'d', 'she\'ll', 
-    'she\'s', 'should', 'shouldn\'t', 'so', 'some', 'such', 'than', 'that', 'that\'s', 'the', 'their', 'theirs', 
-    'them', 'themselves', 'then', 'there', 'there\'s', 'these', 'they', 'they\'d', 'they\'ll', 'they\'re', 'they\'ve', 
-    'this', 'those', 'through', 'to', 'too', 'under', 'until', 'up', 'very', 'was', 'wasn\'t', 'we', 'we\'d', 'we\'ll',
-    'we\'re', 'we\'ve', 'were', 'weren\'t', 'what', 'what\'s', 'when', 'when\'s', 'where', 'where\'s', 'which', 'while', 
-    'who', 'who\'s', 'whom', 'why', 'why\'s', 'with', 'won\'t', 'would', 'wouldn\'t', 'you', 'you\'d', 'you\'ll', 
-    'you\'re', 'you\'ve', 'your', 'yours', 'yourself', 'yourselves'
-}
+# Stopwords shared with the Spark text cleaning
+stop_words = STOP_WORDS
+
+# Intern title tokens in batches, so buffered records share one string per word
+intern_title_tokens = True
 
 # Set up AWS clients
 kinesis_client = boto3.client('kinesis', region_name='eu-north-1')  
@@ -37,18 +43,137 @@ dynamodb_client = boto3.resource('dynamodb', region_name='eu-north-1')
 kinesis_stream_name = 'reddit-bde' 
 dynamodb_table_name = 'tbl_reddit_processed' 
 
+# Per-shard checkpoints so a restart resumes where the last run stopped
+checkpoint_db_path = 'kinesis_checkpoints.db'
+# 'thread' or 'process', processes spread preprocessing across cores
+shard_executor = 'thread'
+
 dynamodb_table = dynamodb_client.Table(dynamodb_table_name)
 
-# Initialize a dictionary to track author activity
-author_activity = {}
+# Batched writer, flushes groups of 25 items in the background. With
+# conditional_writes each item is its own PutItem that never overwrites an
+# existing id, so a duplicate that gets past seen_ids (e.g. after seen_ids.snapshot
+# is lost) keeps its first version. That costs about a third of the consumer's
+# throughput (see benchmarks.py pipeline), so it is off by default.
+conditional_writes = False
+dynamodb_writer = DynamoDBBatchWriter(dynamodb_table_name, dynamodb=dynamodb_client,
+                                      conditional=conditional_writes)
+
+# Records that fail schema validation are kept here instead of being written
+dead_letters = DeadLetterSink('dead_letters.jsonl')
+
+# Typed Parquet copy of the processed records, read by Athena as tbl_reddit_processed_typed.
+# A local directory or an S3 URI such as 's3://reddit-processed-parquet/processed/',
+# None to only write DynamoDB. Create the table first, partitions are added to it
+# as they are written, then backfill the older rows (see parquet_writer.main).
+# Between checkpoints rows are spooled to parquet_spool_path and only written
+# as Parquet every parquet_rollover_seconds or 50000 rows, so the dataset gets
+# a few large files rather than one per partition per checkpoint. The table
+# has no id dedup: rows written after the last saved checkpoint of a run that
+# crashed are written again when Kinesis redelivers them.
+parquet_output = None
+parquet_spool_path = 'parquet.spool'
+parquet_rollover_seconds = 900
+parquet_writer = None
+if parquet_output:
+    if ParquetDatasetWriter is None:
+        raise ImportError("parquet_output needs pyarrow, install it or set parquet_output = None")
+    # New subreddit/dt partitions are added to the Glue table as they are written
+    partition_registrar = GluePartitionRegistrar('default', 'tbl_reddit_processed_typed')
+    parquet_writer = ParquetDatasetWriter(parquet_output, on_new_partitions=partition_registrar.register,
+                                          max_buffer_seconds=parquet_rollover_seconds,
+                                          spool_path=parquet_spool_path)
+
+# Cached title sentiment, 'lexicon' matches TextBlob polarity without building a blob per title
+sentiment_backend = 'lexicon'
+sentiment_scorer = SentimentScorer(sentiment_backend)
+
+# Track author activity, snapshotted to disk so counts survive restarts.
+# A Count-Min Sketch keeps memory at about 4 MB however many authors post
+# during the run, and may overcount slightly. Use mode='exact' with
+# window_seconds for exact counts of recent posts only.
+author_activity = AuthorActivityStore(
+    mode='sketch',
+    window_seconds=None,
+    snapshot_path='author_activity.snapshot',
+    snapshot_interval=60
+)
+
+# Ids seen in the last day. Kinesis redelivers records after retries and the
+# Reddit stream re-emits posts on reconnect; those are skipped before any
+# preprocessing, so they are not scored, written or counted for their author
+# again. mode='bloom' bounds memory at the cost of skipping about error_rate of
+# new posts. Only ids confirmed by wait_for_writes are kept in the snapshot.
+seen_ids = SeenIds(
+    mode='lru',
+    capacity=1_000_000,
+    window_seconds=24 * 3600,
+    snapshot_path='seen_ids.snapshot',
+    snapshot_interval=60
+)
+
+# The most recent anomalies, older ones are only in the log and the metrics
+anomalies = deque(maxlen=10_000)
+
+# Running z-score baselines across the whole stream, set per_subreddit=True for per-subreddit baselines
+anomaly_detector = StreamingAnomalyDetector(
+    columns=['score', 'num_comments', 'popularity_score'],
+    threshold=3,  # Z-score > 3 is an anomaly
+    method='welford',
+    per_subreddit=False,
+    sink=anomalies.append
+)
 
-# List to store anomalies
-anomalies = []
+# Per-subreddit and time_of_day rollups of the stream: post count, comment and
+# upvote sums, mean sentiment, top authors and top titles by popularity_score,
+# over 5-minute tumbling and 1-hour sliding windows of created_time. Each
+# finished window is one small row in rollup_table_name, so dashboards read
+# those instead of scanning the raw table. Open windows are kept in the
+# snapshot and finished by the next run, with the records of each shard up to
+# its last checkpoint, as the rest are redelivered. Every shard has its own
+# watermark, so a lagging shard holds windows open rather than being dropped.
+# The windows merge every shard, which only one process can do: shard_executor
+# = 'process' needs rollups_enabled = False.
+rollups_enabled = True
+rollup_table_name = 'tbl_reddit_rollups'
+rollups = WindowedRollups(
+    windows={'5m': (300, None), '1h': (3600, 300)},
+    group_by=('subreddit', 'time_of_day'),
+    allowed_lateness=600,
+    top_authors=5,
+    top_titles=10,
+    snapshot_path='rollups.snapshot',
+    snapshot_interval=60
+)
+rollup_writer = DynamoDBBatchWriter(rollup_table_name, dynamodb=dynamodb_client, key_name='rollup_id')
 
-def preprocess_record(record):
+# Preprocess whole get_records batches with vectorized pandas operations
+use_batch_preprocessing = True
+
+# Per-stage timings and record, byte and error counters, written every
+# metrics_interval seconds as Prometheus text (or JSON for a .json path).
+# Each shard process writes its own file, consumer_metrics.<pid>.prom,
+# with a pid label on every series.
+metrics = MetricsRegistry('reddit_consumer')
+metrics_output = 'consumer_metrics.prom'
+metrics_interval = 15
+
+# Log one processed record in every 1000 instead of each one
+record_log = SampledLog(every=1000)
+
+# Profile process_batch with 'cprofile' or 'pyinstrument'. Toggle it with
+# `kill -USR1 <pid>`, or set CONSUMER_PROFILE=1 to profile from the start.
+profiler = RuntimeProfiler('consumer.prof', backend='cprofile')
+profile_on_start = os.environ.get('CONSUMER_PROFILE') == '1'
+
+# Reference point for converting timestamps to integer microseconds
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def preprocess_record(record, now=None):
     """
     Preprocess a single record from Kinesis data.
     Applies all preprocessing steps to the incoming data.
+    `now` is the reference time for post_age_minutes, defaulting to the current time.
     """
     # Convert created_time to ISO 8601 string
     created_time_str = record['created_time']
@@ -67,23 +192,20 @@ def preprocess_record(record):
     record['score'] = record.get('score', 0)
     record['num_comments'] = record.get('num_comments', 0)
     
-    # Normalize title and flair text by converting to lowercase
-    record['title'] = record['title'].lower()
+    # Normalize title and flair text by converting to lowercase, and remove punctuation from title
+    record['title'] = normalize_title(record['title'])
     if record.get('flair_text'):
         record['flair_text'] = record['flair_text'].lower()
     
-    # Remove punctuation from title
-    record['title'] = re.sub(r'[^\w\s]', '', record['title'])
-    
     # Tokenize title and remove stopwords
-    record['title_tokens'] = [word for word in record['title'].split() if word not in stop_words]
+    record['title_tokens'] = tokenize(record['title'], stop_words)
     
     # Sentiment analysis on title
-    blob = TextBlob(record['title'])
-    record['sentiment'] = blob.sentiment.polarity  # Ranges from -1 (negative) to 1 (positive)
+    with metrics.timer(stage='sentiment'):
+        record['sentiment'] = sentiment_scorer.polarity(record['title'])  # Ranges from -1 (negative) to 1 (positive)
     
     # Calculate post age in minutes
-    post_age_minutes = (datetime.now(timezone.utc) - created_time_obj).total_seconds() / 60
+    post_age_minutes = ((now or datetime.now(timezone.utc)) - created_time_obj).total_seconds() / 60
     record['post_age_minutes'] = post_age_minutes
     
     # Create popularity score
@@ -95,60 +217,187 @@ def preprocess_record(record):
     # Determine time of day
     record['time_of_day'] = 'day' if 6 <= created_time_obj.hour < 18 else 'night'
     
-    # Track author activity (incremental tracking, store in a separate dictionary)
-    author_activity[record['author']] = author_activity.get(record['author'], 0) + 1
-    record['author_activity_count'] = author_activity[record['author']]
+    # Track author activity (incremental tracking, store in a separate store)
+    record['author_activity_count'] = author_activity.increment(record['author'])
     
     return record
 
-def detect_anomalies(data):
-    # Convert DataFrame to ensure correct data types
-    df = pd.DataFrame(data)
-    
-    # Convert relevant columns from Decimal to float
-    df['score'] = df['score'].astype(float)
-    df['num_comments'] = df['num_comments'].astype(float)
-    df['popularity_score'] = df['popularity_score'].astype(float)
+def preprocess_batch(records, now=None):
+    """
+    Preprocess a whole batch of records from Kinesis data.
+    Produces the same records as calling preprocess_record on each one with the
+    same `now`, but parses timestamps and derives the numeric and categorical
+    columns with vectorized pandas/NumPy operations.
+    """
+    if not records:
+        return records
+    now = now or datetime.now(timezone.utc)
 
-    # Calculate Z-scores for relevant columns
-    for column in ['score', 'num_comments', 'popularity_score']:
-        z_scores = np.abs((df[column] - df[column].mean()) / df[column].std())
-        anomaly_indices = np.where(z_scores > 3)[0]  # Z-score > 3 is an anomaly
+    created_times = [record['created_time'] for record in records]
+    titles = [record['title'] for record in records]
+    if not all(isinstance(value, str) for value in created_times + titles):
+        # Datetime objects and missing values take the per-record path
+        return [preprocess_record(record, now=now) for record in records]
 
-        for index in anomaly_indices:
-            print(f"Anomaly detected in record {df.iloc[index]['id']}: {df.iloc[index]}")
+    df = pd.DataFrame({
+        'created_time': created_times,
+        'score': [record.get('score', 0) for record in records],
+        'num_comments': [record.get('num_comments', 0) for record in records],
+        'upvote_ratio': [record.get('upvote_ratio', 0) for record in records],
+        'thumbnail': [record.get('thumbnail') for record in records],
+        'title': titles,
+    })
 
-def get_records_from_kinesis(shard_iterator):
-    """Retrieve records from the Kinesis stream."""
-    response = kinesis_client.get_records(ShardIterator=shard_iterator, Limit=100)
-    return response['Records'], response['NextShardIterator']
+    numeric_columns = ['score', 'num_comments', 'upvote_ratio']
+    if any(df[column].dtype.kind not in 'iuf' or df[column].isna().any() for column in numeric_columns):
+        # Missing or non-numeric values fail the same way per record
+        return [preprocess_record(record, now=now) for record in records]
+
+    try:
+        created = pd.to_datetime(df['created_time'], format='%Y-%m-%d %H:%M:%S', utc=True)
+    except (ValueError, TypeError):
+        # Let preprocess_record raise the same error it always has
+        return [preprocess_record(record, now=now) for record in records]
+
+    # Convert created_time to ISO 8601 string
+    created_time_strs = created.dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
+
+    # Calculate post age in minutes from integer microseconds, like timedelta.total_seconds()
+    created_us = created.dt.tz_convert(None).to_numpy().astype('datetime64[us]').astype(np.int64)
+    now_us = (now - EPOCH) // timedelta(microseconds=1)
+    post_age_minutes = ((now_us - created_us) / 1e6 / 60).tolist()
+
+    # Create popularity score
+    popularity_scores = ((df['score'] * df['upvote_ratio']) + (df['num_comments'] * 0.5)).tolist()
+
+    # Determine if post is media or text
+    post_types = np.where(df['thumbnail'].to_numpy() != 'self', 'media', 'text').tolist()
+
+    # Determine time of day
+    hours = created.dt.hour.to_numpy()
+    times_of_day = np.where((hours >= 6) & (hours < 18), 'day', 'night').tolist()
+
+    # Normalize title by converting to lowercase and removing punctuation, then tokenize
+    titles = normalize_titles(titles)
+    title_tokens = tokenize_batch(titles, stop_words, intern=intern_title_tokens)
+
+    # Sentiment analysis on titles, reposts are served from the cache
+    with metrics.timer(stage='sentiment'):
+        sentiments = sentiment_scorer.polarities(titles)
+
+    for i, record in enumerate(records):
+        record['created_time'] = created_time_strs[i]
+        record['score'] = record.get('score', 0)
+        record['num_comments'] = record.get('num_comments', 0)
+        record['title'] = titles[i]
+        if record.get('flair_text'):
+            record['flair_text'] = record['flair_text'].lower()
+        record['title_tokens'] = title_tokens[i]
+        record['sentiment'] = sentiments[i]
+        record['post_age_minutes'] = post_age_minutes[i]
+        record['popularity_score'] = popularity_scores[i]
+        record['post_type'] = post_types[i]
+        record['time_of_day'] = times_of_day[i]
+
+        # Track author activity in arrival order
+        record['author_activity_count'] = author_activity.increment(record['author'])
+
+    return records
+
+def detect_anomalies(data):
+    """
+    Score each processed record against the running baselines.
+    The detector appends anomalies to `anomalies`, which keeps the most recent ones.
+    """
+    for record in data:
+        for anomaly in anomaly_detector.update(record):
+            metrics.inc('anomalies', column=anomaly['column'])
+            logging.warning("Anomaly detected in record %s: %s=%s (z-score %.2f)",
+                            anomaly['id'], anomaly['column'], anomaly['value'], anomaly['z_score'])
 
 def process_data(records):
     """
     Process and preprocess the data from Kinesis records.
     """
-    data = []
-    for record in records:
-        # Decode Kinesis data (assuming JSON format)
-        payload = json.loads(record['Data'])
-        
-        # Preprocess each record
-        processed_record = preprocess_record(payload)
-        
-        # Save to DynamoDB
-        save_to_dynamodb(processed_record)
-        
-        # Log the processed record to the console
-        logging.info("Processed Record: %s", processed_record)
-        
-        # Add processed record to the list
-        data.append(processed_record)
-    
+    # Decode Kinesis data, JSON or one of the compact encodings from record_codec,
+    # and set aside payloads that don't match the producer's schema
+    payloads = []
+    with metrics.timer(stage='decode'):
+        for record in records:
+            try:
+                payload = decode_record(record['Data'])
+            except Exception as e:
+                metrics.inc('errors', type='undecodable')
+                dead_letters.put({'data': record['Data'], 'sequence_number': record.get('SequenceNumber')},
+                                 [f"undecodable: {e}"])
+                continue
+            row, errors = validate_payload(payload)
+            if errors:
+                metrics.inc('errors', type='invalid_payload')
+                dead_letters.put(payload, errors)
+            else:
+                payloads.append(row)
+
+    # Drop records that were already processed
+    with metrics.timer(stage='dedup'):
+        fresh = seen_ids.filter_new(payloads)
+    metrics.inc('dedup_lookups', len(payloads))
+    metrics.inc('duplicates_skipped', len(payloads) - len(fresh))
+
+    ids = [payload['id'] for payload in fresh]
+    try:
+        data = process_payloads(fresh)
+    except Exception:
+        # Let a redelivery of these records through again
+        seen_ids.discard(ids)
+        raise
+    # Their writes (or dead letters) are queued, wait_for_writes confirms them
+    seen_ids.mark_queued(ids)
+    return data
+
+def process_payloads(payloads):
+    """
+    Preprocess, validate and queue the writes of new, valid payloads.
+    """
+    # Preprocess the records, as one batch or one at a time
+    with metrics.timer(stage='preprocess'):
+        if use_batch_preprocessing:
+            data = preprocess_batch(payloads)
+        else:
+            data = [preprocess_record(payload) for payload in payloads]
+
+    # Enforce the typed schema, records that don't fit go to the dead-letter file
+    valid = []
+    with metrics.timer(stage='validate'):
+        for record in data:
+            row, errors = validate_processed(record)
+            if errors:
+                metrics.inc('errors', type='invalid_record')
+                dead_letters.put(record, errors)
+            else:
+                valid.append(row)
+    data = valid
+
+    # Typed rows for the Parquet dataset, taken before floats become Decimal
+    if parquet_writer is not None:
+        with metrics.timer(stage='parquet'):
+            parquet_writer.write([processed_row(record) for record in data])
+
+    with metrics.timer(stage='save_to_dynamodb'):
+        for processed_record in data:
+            # Save to DynamoDB
+            save_to_dynamodb(processed_record)
+
+            # Log a sample of the processed records to the console
+            record_log.log("Processed Record: %s", processed_record)
+
+    metrics.inc('records_processed', len(data))
     return data
 
 def save_to_dynamodb(record):
     """
-    Save a processed record to DynamoDB, converting float types to Decimal.
+    Queue a processed record for DynamoDB, converting float types to Decimal.
+    The record is written by the batched writer in the background.
     """
     # Convert float values in the record to Decimal
     for key, value in record.items():
@@ -156,46 +405,191 @@ def save_to_dynamodb(record):
             record[key] = Decimal(str(value))  
 
     try:
-        # Create a new item in the DynamoDB table
-        dynamodb_table.put_item(Item=record)
-        print(f"Saved to DynamoDB: {record['id']}")
+        # Add the item to the current batch
+        dynamodb_writer.put(record)
     except Exception as e:
-        print(f"Error saving to DynamoDB: {e}")
+        metrics.inc('errors', type='dynamodb')
+        logging.error("Error saving to DynamoDB: %s", e)
+
+# Shard whose snapshots the stores of this shard process hold
+snapshot_shard_id = None
+
+def use_shard_snapshots(shard_id):
+    """
+    Give the stores of a shard process snapshots of their own shard, so the
+    processes don't overwrite each other's. A process handed a new shard
+    saves the previous one's state and loads the new one's.
+    """
+    global snapshot_shard_id
+    if shard_id == snapshot_shard_id:
+        return
+    stores = [(author_activity, 'author_activity.snapshot'), (seen_ids, 'seen_ids.snapshot')]
+    if rollups_enabled:
+        stores.append((rollups, 'rollups.snapshot'))
+    for store, path in stores:
+        if snapshot_shard_id is not None:
+            store.save_snapshot()
+        store.clear()
+        store.snapshot_path = f"{path}.{shard_id}"
+        if os.path.exists(store.snapshot_path):
+            store.load_snapshot(store.snapshot_path)
+    if parquet_writer is not None:
+        parquet_writer.use_spool(f"{parquet_spool_path}.{shard_id}")
+    snapshot_shard_id = shard_id
+
+def process_metrics_path(pid):
+    """Metrics file of one shard process."""
+    root, extension = os.path.splitext(metrics_output)
+    return f"{root}.{pid}{extension}"
+
+def use_process_metrics():
+    """Export the metrics of a shard process to its own file, once per process."""
+    if 'pid' in metrics.labels:
+        return
+    metrics.labels['pid'] = str(os.getpid())
+    metrics.start_exporter(process_metrics_path(os.getpid()), metrics_interval)
+
+# Shards that queued writes since the last wait_for_writes, and shards that must
+# not checkpoint because writes queued while they ran were given up on
+write_shards = set()
+failed_write_shards = set()
+write_shards_lock = threading.Lock()
+
+class WritesFailed(Exception):
+    """Records could not be written, so the shard must not be checkpointed past them."""
+
+def process_batch(records):
+    """
+    Process one get_records batch from a shard.
+    """
+    if shard_executor == 'process':
+        use_shard_snapshots(current_shard_id())
+        use_process_metrics()
+    with write_shards_lock:
+        write_shards.add(current_shard_id())
+    with profiler.section():
+        # Process the retrieved records
+        processed_data = process_data(records)
+        # Hand off the partial batch so it is written while the next batch is fetched
+        dynamodb_writer.flush()
+        # Detect anomalies
+        with metrics.timer(stage='detect_anomalies'):
+            detect_anomalies(processed_data)
+        # Aggregate into the windows and write the ones that closed
+        if rollups_enabled:
+            with metrics.timer(stage='rollups'):
+                rows = rollups.add_batch(processed_data, source=current_shard_id())
+                for row in rows:
+                    rollup_writer.put(dynamodb_item(row))
+            metrics.inc('rollups_emitted', len(rows))
+
+def wait_for_writes():
+    """
+    Block until every queued record has been written, used before checkpointing.
+
+    Records the DynamoDB writer gave up on are not confirmed in seen_ids, so a
+    redelivery processes them again, and every shard that queued writes since
+    the last wait raises WritesFailed at its next checkpoint instead of saving
+    it. consume_shard then stops and the shard is read again from its last
+    checkpoint. Rollup rows that failed are queued again for the next wait.
+    """
+    # Ids queued before the wait are durable after it, from every shard thread
+    with write_shards_lock:
+        shards = set(write_shards)
+        write_shards.clear()
+    queued_ids = seen_ids.take_queued()
+    failed = dynamodb_writer.wait()
+    if parquet_writer is not None:
+        # Written to Parquet or to the spool, either survives a restart
+        parquet_writer.checkpoint()
+    for row in rollup_writer.wait():
+        rollup_writer.put(row)
+    if failed:
+        failed_ids = {item['id'] for item in failed}
+        logging.error("%d records could not be written to DynamoDB, not checkpointing shards %s",
+                      len(failed_ids), sorted(shards, key=str))
+        seen_ids.discard(failed_ids)
+        with write_shards_lock:
+            failed_write_shards.update(shards)
+    seen_ids.confirm(queued_ids)
+    with write_shards_lock:
+        shard_id = current_shard_id()
+        if shard_id in failed_write_shards:
+            failed_write_shards.discard(shard_id)
+            # Before the snapshots, which would hold state of records that will be redelivered
+            raise WritesFailed(f"Writes of shard {shard_id} failed, replaying it from its last checkpoint")
+    if rollups_enabled:
+        # Only this shard is checkpointed, the others' records stay out of the snapshot
+        rollups.commit(shard_id)
+    if shard_executor == 'process' and snapshot_shard_id is not None:
+        # A shard process has no shutdown step, so every checkpoint saves its state
+        seen_ids.save_snapshot()
+        author_activity.save_snapshot()
+        if rollups_enabled:
+            rollups.save_snapshot()
+        metrics.write(process_metrics_path(os.getpid()))
+    seen_ids.maybe_snapshot()
+    if rollups_enabled:
+        rollups.maybe_snapshot()
 
 def main():
-    # Get the stream description to retrieve the shard ID
-    response = kinesis_client.describe_stream(StreamName=kinesis_stream_name)
-    shard_id = response['StreamDescription']['Shards'][0]['ShardId']
-
-    # Get the initial shard iterator
-    shard_iterator_response = kinesis_client.get_shard_iterator(
-        StreamName=kinesis_stream_name,
-        ShardId=shard_id,
-        ShardIteratorType='LATEST'  # 'TRIM_HORIZON' to read all data from the beginning
-    )
-    
-    shard_iterator = shard_iterator_response['ShardIterator']
+    if rollups_enabled and shard_executor == 'process':
+        # Each shard process would emit its own partial rows under the same rollup_id
+        raise ValueError("Rollups need shard_executor = 'thread', or set rollups_enabled = False")
 
-    # Set the start time for the 2-minutes limit
-    start_time = datetime.now(timezone.utc)
+    # Consume every shard in parallel, resuming each one from its checkpoint
+    checkpoint_store = SQLiteCheckpointStore(checkpoint_db_path, kinesis_stream_name)
     time_limit = timedelta(minutes=55)
 
-    while True:
-        # Check if the time limit has been reached
-        if datetime.now(timezone.utc) - start_time >= time_limit:
-            logging.info("2-minutes processing time limit reached. Exiting.")
-            break
-
-        # Get records from Kinesis
-        records, shard_iterator = get_records_from_kinesis(shard_iterator)
-        if records:
-            # Process the retrieved records
-            processed_data = process_data(records)
-            # Detect anomalies
-            detect_anomalies(processed_data)
-        
-        # Sleep for a short period to avoid hitting the Kinesis limit
-        time.sleep(1)
+    if shard_executor == 'thread':
+        metrics.start_exporter(metrics_output, metrics_interval)
+    else:
+        # Shard processes export their own metrics, drop the files of earlier runs' processes
+        for path in glob.glob(process_metrics_path('*')):
+            os.remove(path)
+    profiler.install_signal()
+    if profile_on_start:
+        profiler.start()
+
+    total_processed = run_consumer(
+        kinesis_stream_name,
+        process_batch,
+        checkpoint_store,
+        time_limit=time_limit,
+        executor=shard_executor,
+        initial_position='LATEST',  # 'TRIM_HORIZON' to read all data from the beginning
+        kinesis_client=kinesis_client if shard_executor == 'thread' else None,
+        checkpoint_barrier=wait_for_writes,
+        # Shard processes have their own registry, only threads report get_records here
+        metrics=metrics if shard_executor == 'thread' else None
+    )
+    logging.info("55-minute processing time limit reached after %d records. Exiting.", total_processed)
+
+    # Write any remaining buffered records and the author counts before exiting
+    failed = dynamodb_writer.close()
+    if failed:
+        logging.error("%d records could not be written to DynamoDB on shutdown", len(failed))
+        seen_ids.discard(item['id'] for item in failed)
+    if parquet_writer is not None:
+        parquet_writer.close()
+        logging.info("Parquet writer stats: %s", parquet_writer.stats())
+    if shard_executor == 'thread':
+        # Shard processes save their own per-shard snapshots
+        author_activity.save_snapshot()
+        seen_ids.confirm(seen_ids.take_queued())
+        seen_ids.save_snapshot()
+    rollup_writer.close()
+    if rollups_enabled:
+        rollups.save_snapshot()
+        logging.info("Late records left out of the rollups: %d", rollups.late_records)
+    logging.info("Duplicate records skipped: %s", seen_ids.stats())
+    logging.info("DynamoDB writer stats: %s", dynamodb_writer.stats())
+    logging.info("Dead-lettered records: %d", dead_letters.count)
+
+    if profiler.enabled:
+        profiler.stop()
+    if shard_executor == 'thread':
+        metrics.stop_exporter(metrics_output)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,185 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+# PutRecords limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+
+# Errors that apply to the whole PutRecords call and are worth retrying
+RETRYABLE_ERRORS = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'InternalFailure',
+    'ServiceUnavailable',
+    'KMSThrottlingException',
+}
+
+
+class BatchingKinesisProducer:
+    """
+    Send records to Kinesis with PutRecords from a background thread.
+
+    put() only adds the record to a bounded queue, so the caller (for example
+    the PRAW submission stream) is decoupled from the network. The sender
+    drains the queue into batches of up to 500 records or 5 MB, waiting at most
+    `linger` seconds for a batch to fill, and retries only the entries that
+    PutRecords reports as failed.
+    """
+
+    def __init__(self, stream_name, kinesis_client=None, region_name='eu-north-1',
+                 queue_size=10000, linger=0.2, max_retries=8, base_backoff=0.1, max_backoff=5.0):
+        self.stream_name = stream_name
+        self.kinesis_client = kinesis_client or boto3.client('kinesis', region_name=region_name)
+        self.linger = linger
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'records_sent': 0,
+            'records_failed': 0,
+            'bytes_sent': 0,
+            'batches': 0,
+            'retries': 0,
+            'send_seconds': 0.0,
+        }
+        self._started = time.perf_counter()
+        self._closed = False
+        self._sender = threading.Thread(target=self._run, name='kinesis-producer', daemon=True)
+        self._sender.start()
+
+    def put(self, data, partition_key):
+        """Queue one record, blocking while the queue is full."""
+        if self._closed:
+            raise RuntimeError("BatchingKinesisProducer is closed")
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        size = len(data) + len(partition_key.encode('utf-8'))
+        if size > MAX_RECORD_BYTES:
+            logging.error("Dropping record for %s, %d bytes is over the 1 MB limit", partition_key, size)
+            with self._lock:
+                self._stats['records_failed'] += 1
+            return
+        self._queue.put((data, partition_key, size))
+
+    def flush(self):
+        """Block until every queued record has been sent or given up on."""
+        self._queue.join()
+
+    def close(self):
+        """Send everything that is queued and stop the sender thread."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._sender.join()
+
+    def stats(self):
+        """Return a snapshot of the throughput and failure counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        elapsed = time.perf_counter() - self._started
+        stats['records_per_second'] = stats['records_sent'] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            batch_bytes = item[2]
+            stop = False
+            deadline = time.monotonic() + self.linger
+
+            # Keep filling the batch until it is full or the linger time is up
+            while len(batch) < MAX_BATCH_RECORDS:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                if batch_bytes + item[2] > MAX_BATCH_BYTES:
+                    # Send what we have, the record starts the next batch
+                    self._send_and_mark_done(batch)
+                    batch, batch_bytes = [], 0
+                batch.append(item)
+                batch_bytes += item[2]
+
+            self._send_and_mark_done(batch)
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _send_and_mark_done(self, batch):
+        try:
+            self._send(batch)
+        except Exception as e:
+            # Never let the sender die, otherwise flush() would block forever
+            logging.error("Error sending %d records to Kinesis: %s", len(batch), e)
+            with self._lock:
+                self._stats['records_failed'] += len(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _send(self, batch):
+        start = time.perf_counter()
+        pending = batch
+        retries = 0
+
+        while pending:
+            entries = [{'Data': data, 'PartitionKey': key} for data, key, _ in pending]
+            try:
+                response = self.kinesis_client.put_records(StreamName=self.stream_name, Records=entries)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in RETRYABLE_ERRORS:
+                    raise
+                logging.warning("PutRecords throttled: %s", e)
+                failed = pending
+            else:
+                # Results come back in request order, only failed entries have an ErrorCode
+                failed = [item for item, result in zip(pending, response['Records'])
+                          if result.get('ErrorCode')]
+                sent = len(pending) - len(failed)
+                with self._lock:
+                    self._stats['records_sent'] += sent
+                    self._stats['bytes_sent'] += sum(item[2] for item in pending) - sum(item[2] for item in failed)
+                logging.debug("Sent %d records to %s, %d failed", sent, self.stream_name, len(failed))
+
+            pending = failed
+            if pending:
+                if retries >= self.max_retries:
+                    break
+                self._sleep_backoff(retries)
+                retries += 1
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['retries'] += retries
+            self._stats['records_failed'] += len(pending)
+            self._stats['send_seconds'] += time.perf_counter() - start
+        if pending:
+            logging.error("Gave up on %d records after %d retries", len(pending), retries)
+
+    def _sleep_backoff(self, attempt):
+        # Exponential backoff with jitter
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        time.sleep(delay * random.uniform(0.5, 1.0))
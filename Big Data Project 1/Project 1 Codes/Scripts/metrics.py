@@ -0,0 +1,306 @@
+import bisect
+import cProfile
+import json
+import logging
+import os
+import pstats
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:  # pyinstrument is optional, cProfile is always available
+    pyinstrument = None
+
+# Upper bounds in seconds of the stage duration buckets, from sub-millisecond
+# decode times to multi-second DynamoDB flushes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style, with estimated quantiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _label_text(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+class MetricsRegistry:
+    """
+    Counters and duration histograms for the consumer's hot path.
+
+    Stages are timed per batch rather than per record, so the overhead is a
+    lock and a bisect per get_records call. Everything can be written to a
+    Prometheus text file (for the node exporter's textfile collector) or a
+    JSON file, once with write() or periodically with start_exporter().
+    `labels` are added to every series, e.g. a pid that tells the files of
+    several processes apart.
+    """
+
+    def __init__(self, namespace='reddit_consumer', buckets=DEFAULT_BUCKETS, labels=None):
+        self.namespace = namespace
+        self.buckets = buckets
+        self.labels = dict(labels or {})
+        self.started = time.time()
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+        self._stop_exporter = threading.Event()
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value, usually seconds, in a histogram."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name='stage_seconds', **labels):
+        """Time the block into a histogram, e.g. timer(stage='decode')."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Plain dict of every counter and histogram summary."""
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [dict({'name': name, 'labels': dict(labels)}, **histogram.snapshot())
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+        return {'uptime_seconds': time.time() - self.started, 'labels': dict(self.labels),
+                'counters': counters, 'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        const = tuple(sorted(self.labels.items()))
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                metric = f"{self.namespace}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{metric}{_label_text(const + labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_label_text(const + labels, ('le', bound))} {cumulative}")
+                    lines.append(f"{metric}_sum{_label_text(const + labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_label_text(const + labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write to path, as JSON for *.json and Prometheus text otherwise, replacing it atomically."""
+        text = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            f.write(text)
+        os.replace(temporary, path)
+
+    def start_exporter(self, path, interval=15):
+        """Write the metrics to path every interval seconds from a background thread."""
+        def run():
+            while not self._stop_exporter.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logging.error("Could not write metrics to %s: %s", path, e)
+
+        self._stop_exporter.clear()
+        self._exporter = threading.Thread(target=run, name='metrics-exporter', daemon=True)
+        self._exporter.start()
+
+    def stop_exporter(self, path=None):
+        """Stop the background exporter, writing a final copy to path if given."""
+        self._stop_exporter.set()
+        if self._exporter is not None:
+            self._exporter.join()
+            self._exporter = None
+        if path:
+            self.write(path)
+
+
+class SampledLog:
+    """
+    Log one in every `every` calls instead of each one, with the number of
+    skipped messages, so per-record logging costs a counter increment.
+    """
+
+    def __init__(self, every=1000, level=logging.INFO):
+        self.every = every
+        self.level = level
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def log(self, message, *args):
+        with self._lock:
+            self._calls += 1
+            calls = self._calls
+        if self.every <= 1 or calls % self.every == 1:
+            logging.log(self.level, "[sampled 1/%d, %d so far] " + message, self.every, calls, *args)
+
+
+class RuntimeProfiler:
+    """
+    Profiler that can be switched on and off while the consumer runs.
+
+    Code to profile runs inside section(), which costs one flag check while
+    profiling is off. Only one section is profiled at a time, by one shared
+    profiler: since Python 3.12 cProfile registers a process-wide monitoring
+    tool, so profilers enabled in two shard threads at once raise ValueError.
+    Sections that start while another is profiled run unprofiled, so with
+    several shards the output samples their sections rather than adding them
+    all up. stop() writes output_path (pstats for cProfile, a text report for
+    pyinstrument). install_signal() lets `kill -USR1 <pid>` toggle profiling.
+    """
+
+    def __init__(self, output_path='consumer.prof', backend='cprofile'):
+        if backend == 'pyinstrument' and pyinstrument is None:
+            raise ImportError("The pyinstrument backend requires the pyinstrument package")
+        if backend not in ('cprofile', 'pyinstrument'):
+            raise ValueError("backend must be 'cprofile' or 'pyinstrument'")
+        self.output_path = output_path
+        self.backend = backend
+        self.enabled = False
+        self.sections = 0
+        self.skipped_sections = 0
+        self._profiler = None
+        self._lock = threading.Lock()
+        # Held by the thread whose section is being profiled
+        self._active = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._profiler = cProfile.Profile() if self.backend == 'cprofile' else pyinstrument.Profiler()
+            self.sections = self.skipped_sections = 0
+            self.enabled = True
+        logging.info("Profiling started with %s", self.backend)
+
+    def stop(self):
+        """Stop profiling and write what was collected to output_path."""
+        with self._lock:
+            self.enabled = False
+        # Wait for the section being profiled, if any, to finish
+        with self._active:
+            profiler, self._profiler = self._profiler, None
+        if not self.sections:
+            logging.info("Profiling stopped, nothing was profiled")
+            return
+        if self.backend == 'cprofile':
+            pstats.Stats(profiler).dump_stats(self.output_path)
+        else:
+            with open(self.output_path, 'w') as f:
+                f.write(profiler.output_text())
+        logging.info("Profiling stopped, %d sections written to %s (%d ran while another was profiled)",
+                     self.sections, self.output_path, self.skipped_sections)
+
+    def toggle(self, *_):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def install_signal(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """Toggle profiling on a signal. Must be called from the main thread."""
+        if signum is not None:
+            signal.signal(signum, self.toggle)
+
+    @contextmanager
+    def section(self):
+        if not self.enabled:
+            yield
+            return
+        if not self._active.acquire(blocking=False):
+            with self._lock:
+                self.skipped_sections += 1
+            yield
+            return
+        try:
+            profiler = self._profiler
+            if not self.enabled or profiler is None:
+                yield
+                return
+            self.sections += 1
+            if self.backend == 'cprofile':
+                profiler.enable()
+            else:
+                profiler.start()
+            try:
+                yield
+            finally:
+                if self.backend == 'cprofile':
+                    profiler.disable()
+                else:
+                    profiler.stop()
+        finally:
+            self._active.release()
@@ -0,0 +1,417 @@
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from urllib.parse import unquote
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+# Typed columns of the records written by kinesis_processing_2, partitioned
+# by subreddit and the UTC date of created_time
+PROCESSED_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('author', pa.string()),
+    ('title', pa.string()),
+    ('title_tokens', pa.list_(pa.string())),
+    ('created_time', pa.timestamp('s')),
+    ('score', pa.int64()),
+    ('num_comments', pa.int64()),
+    ('upvote_ratio', pa.float64()),
+    ('sentiment', pa.float64()),
+    ('post_age_minutes', pa.float64()),
+    ('popularity_score', pa.float64()),
+    ('author_activity_count', pa.int64()),
+    ('is_self_post', pa.bool_()),
+    ('over_18', pa.bool_()),
+    ('stickied', pa.bool_()),
+    ('edited', pa.bool_()),
+    ('flair_text', pa.string()),
+    ('thumbnail', pa.string()),
+    ('post_type', pa.string()),
+    ('time_of_day', pa.string()),
+    ('subreddit', pa.string()),
+    ('dt', pa.string()),
+])
+
+# Rows of the reddit_batch_processing.py export
+BATCH_SCHEMA = pa.schema([
+    ('title', pa.string()),
+    ('score', pa.int64()),
+    ('url', pa.string()),
+    ('comments', pa.int64()),
+    ('subreddit', pa.string()),
+    ('dt', pa.string()),
+])
+
+PARTITION_COLUMNS = ('subreddit', 'dt')
+
+# Athena type names for the arrow types used above
+ATHENA_TYPES = {
+    pa.string(): 'string',
+    pa.int64(): 'bigint',
+    pa.float64(): 'double',
+    pa.bool_(): 'boolean',
+    pa.timestamp('s'): 'timestamp',
+    pa.list_(pa.string()): 'array<string>',
+}
+
+
+def processed_row(record):
+    """
+    Convert a processed record to PROCESSED_SCHEMA values.
+    Accepts records before or after save_to_dynamodb turned floats into Decimal.
+    """
+    row = {}
+    for field in PROCESSED_SCHEMA:
+        value = record.get(field.name)
+        if isinstance(value, Decimal):
+            value = float(value) if field.type == pa.float64() else int(value)
+        row[field.name] = value
+
+    created_time = record.get('created_time')
+    if isinstance(created_time, str):
+        created_time = datetime.strptime(created_time, '%Y-%m-%d %H:%M:%S')
+    elif isinstance(created_time, datetime) and created_time.tzinfo is not None:
+        created_time = created_time.astimezone(timezone.utc).replace(tzinfo=None)
+    row['created_time'] = created_time
+    row['dt'] = created_time.strftime('%Y-%m-%d') if created_time else None
+
+    # PRAW's edited is False or the edit timestamp
+    row['edited'] = bool(record.get('edited'))
+    return row
+
+
+def athena_ddl(table_name, location, schema=PROCESSED_SCHEMA, partition_columns=PARTITION_COLUMNS):
+    """CREATE EXTERNAL TABLE statement for a dataset written by ParquetDatasetWriter."""
+    columns = ',\n    '.join(f"`{field.name}` {ATHENA_TYPES[field.type]}"
+                             for field in schema if field.name not in partition_columns)
+    partitions = ', '.join(f"`{name}` {ATHENA_TYPES[schema.field(name).type]}" for name in partition_columns)
+    return (f"CREATE EXTERNAL TABLE IF NOT EXISTS {table_name} (\n    {columns}\n)\n"
+            f"PARTITIONED BY ({partitions})\n"
+            f"STORED AS PARQUET\n"
+            f"LOCATION '{location}'\n"
+            f"TBLPROPERTIES ('parquet.compression'='SNAPPY')")
+
+
+class GluePartitionRegistrar:
+    """
+    Add partitions to a Glue/Athena table as the writer creates them, so the
+    table needs no MSCK REPAIR before queries and never scans a partition list.
+    """
+
+    def __init__(self, database, table, glue_client=None, region_name='eu-north-1'):
+        self.database = database
+        self.table = table
+        self._glue = glue_client
+        self.region_name = region_name
+        self._storage = None
+        self._known = set()
+        self._lock = threading.Lock()
+
+    @property
+    def glue(self):
+        if self._glue is None:
+            import boto3
+            self._glue = boto3.client('glue', region_name=self.region_name)
+        return self._glue
+
+    def register(self, partitions):
+        """Create the (value, ...) partitions that were not seen before, ignoring existing ones."""
+        with self._lock:
+            new = [values for values in partitions if values not in self._known]
+            if not new:
+                return
+            if self._storage is None:
+                self._storage = self.glue.get_table(DatabaseName=self.database, Name=self.table)['Table']
+            table = self._storage
+            keys = [key['Name'] for key in table['PartitionKeys']]
+            location = table['StorageDescriptor']['Location'].rstrip('/')
+
+            for start in range(0, len(new), 100):
+                inputs = []
+                for values in new[start:start + 100]:
+                    descriptor = dict(table['StorageDescriptor'])
+                    path = '/'.join(f"{key}={value}" for key, value in zip(keys, values))
+                    descriptor['Location'] = f"{location}/{path}/"
+                    inputs.append({'Values': list(values), 'StorageDescriptor': descriptor})
+                response = self.glue.batch_create_partition(
+                    DatabaseName=self.database, TableName=self.table, PartitionInputList=inputs)
+                for error in response.get('Errors', []):
+                    if error['ErrorDetail']['ErrorCode'] != 'AlreadyExistsException':
+                        logging.error("Could not add partition %s: %s", error['PartitionValues'],
+                                      error['ErrorDetail'].get('ErrorMessage'))
+            self._known.update(new)
+
+
+class ParquetDatasetWriter:
+    """
+    Buffer rows and write them as a hive-partitioned Parquet dataset.
+
+    `root` is a local directory or an s3:// URI. Each flush writes one new file
+    per partition (subreddit=.../dt=...) with snappy compression and min/max
+    statistics for every row group, with rows sorted by created_time when the
+    schema has it, so Athena and Spark can skip whole files and row groups.
+    Rows are flushed once max_buffered_rows are waiting, and by flush()/close().
+    on_new_partitions, if given, is called after each flush with the partition
+    value tuples written to, e.g. GluePartitionRegistrar.register.
+
+    A stream consumer calls checkpoint() before each Kinesis checkpoint. With
+    spool_path set, the rows are then only written to Parquet once
+    max_buffered_rows are waiting or the oldest has waited max_buffer_seconds;
+    until then they are appended to the local spool file, so a checkpoint
+    every few seconds does not turn into thousands of tiny files. A spool
+    left by a crash is written when the writer starts. Files are named after
+    the spool, so writing it again replaces the files of an interrupted
+    write instead of adding copies.
+
+    The dataset has no id dedup: rows written by a checkpoint whose
+    Kinesis checkpoint was never saved, because the process died in
+    between, are written again when the records are redelivered.
+    """
+
+    def __init__(self, root, schema=PROCESSED_SCHEMA, partition_columns=PARTITION_COLUMNS,
+                 filesystem=None, max_buffered_rows=50000, row_group_size=128 * 1024,
+                 compression='snappy', on_new_partitions=None, region_name='eu-north-1',
+                 max_buffer_seconds=None, spool_path=None):
+        if filesystem is None:
+            if root.startswith('s3://'):
+                # An explicit region avoids a HeadBucket call to look it up
+                filesystem, root = pafs.S3FileSystem(region=region_name), root[len('s3://'):]
+            elif '://' in root:
+                filesystem, root = pafs.FileSystem.from_uri(root)
+            else:
+                filesystem = pafs.LocalFileSystem()
+        self.root = root
+        self.filesystem = filesystem
+        self.schema = schema
+        self.partition_columns = list(partition_columns)
+        self.max_buffered_rows = max_buffered_rows
+        self.row_group_size = row_group_size
+        self.file_options = ds.ParquetFileFormat().make_write_options(
+            compression=compression, write_statistics=True)
+        self.partitioning = ds.partitioning(
+            pa.schema([schema.field(name) for name in self.partition_columns]), flavor='hive')
+        self.sort_keys = [('created_time', 'ascending')] if 'created_time' in schema.names else None
+        self.on_new_partitions = on_new_partitions
+        self.max_buffer_seconds = max_buffer_seconds
+        self.spool_path = spool_path
+
+        self._rows = []
+        self._spooled = 0  # Rows at the start of _rows that are in the spool
+        self._oldest = None  # Monotonic time the oldest buffered row arrived
+        self._file_id = uuid.uuid4().hex  # Names the files of the next flush
+        self._lock = threading.Lock()
+        self.files_written = 0
+        self.rows_written = 0
+
+        if spool_path and os.path.exists(spool_path):
+            self._load_spool()
+
+    def write(self, rows):
+        """
+        Queue rows (dicts matching the schema). Without a spool they are
+        flushed once the buffer is full, with one it is left to checkpoint().
+        """
+        with self._lock:
+            if rows and self._oldest is None:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            if self.spool_path is None and len(self._rows) >= self.max_buffered_rows:
+                self._flush_locked()
+
+    def flush(self):
+        """Write every buffered row."""
+        with self._lock:
+            self._flush_locked()
+
+    def checkpoint(self):
+        """
+        Make every buffered row durable: write them to Parquet without a spool
+        or once they are due, and append them to the spool otherwise.
+        """
+        with self._lock:
+            due = len(self._rows) >= self.max_buffered_rows or (
+                self.max_buffer_seconds is not None and self._oldest is not None
+                and time.monotonic() - self._oldest >= self.max_buffer_seconds)
+            if self.spool_path is None or due:
+                self._flush_locked()
+            else:
+                self._spool_locked()
+
+    def _spool_locked(self):
+        rows = self._rows[self._spooled:]
+        if not rows:
+            return
+        new_spool = not self._spooled and not os.path.exists(self.spool_path)
+        with open(self.spool_path, 'ab') as f:
+            if new_spool:
+                pickle.dump({'file_id': self._file_id}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spooled = len(self._rows)
+
+    def _load_spool(self):
+        rows = []
+        with open(self.spool_path, 'rb') as f:
+            try:
+                header = pickle.load(f)
+                while True:
+                    rows.extend(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError):
+                # A chunk cut short by a crash was never checkpointed, it is redelivered
+                pass
+        if not isinstance(header, dict) or 'file_id' not in header:
+            logging.warning("Ignoring Parquet spool %s without a header", self.spool_path)
+            os.remove(self.spool_path)
+            return
+        logging.info("Writing %d rows left in the Parquet spool %s", len(rows), self.spool_path)
+        with self._lock:
+            self._rows = rows
+            self._spooled = len(rows)
+            self._file_id = header['file_id']
+            self._flush_locked()
+
+    def use_spool(self, spool_path):
+        """Write the buffered rows, then spool to another file, e.g. of another shard."""
+        self.flush()
+        self.spool_path = spool_path
+        if spool_path and os.path.exists(spool_path):
+            self._load_spool()
+
+    def _flush_locked(self):
+        if not self._rows:
+            if self.spool_path and os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        table = pa.Table.from_pylist(self._rows, schema=self.schema)
+        # Partitions sorted and written in order, so the same rows always get the same file names
+        table = table.sort_by([(name, 'ascending') for name in self.partition_columns] + (self.sort_keys or []))
+
+        written = []
+        ds.write_dataset(
+            table,
+            self.root,
+            format='parquet',
+            filesystem=self.filesystem,
+            partitioning=self.partitioning,
+            basename_template=f"part-{self._file_id}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            file_options=self.file_options,
+            max_rows_per_group=self.row_group_size,
+            min_rows_per_group=min(self.row_group_size, table.num_rows),
+            file_visitor=lambda written_file: written.append(written_file.path),
+            use_threads=False,
+        )
+        self.files_written += len(written)
+        self.rows_written += table.num_rows
+        logging.info("Wrote %d rows to %d Parquet files under %s", table.num_rows, len(written), self.root)
+        self._rows = []
+        self._spooled = 0
+        self._oldest = None
+        self._file_id = uuid.uuid4().hex
+        if self.spool_path and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+        if self.on_new_partitions is not None:
+            partitions = set()
+            for path in written:
+                # .../subreddit=pics/dt=2024-10-01/part-....parquet
+                segments = path.split('/')[-1 - len(self.partition_columns):-1]
+                partitions.add(tuple(unquote(segment.partition('=')[2]) for segment in segments))
+            try:
+                self.on_new_partitions(sorted(partitions))
+            except Exception as e:
+                # The files are written, a failed registration must not stop the writer
+                logging.error("Could not register partitions %s: %s", sorted(partitions), e)
+
+    def close(self):
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'rows_written': self.rows_written, 'files_written': self.files_written,
+                    'buffered': len(self._rows)}
+
+
+def backfill_from_dynamodb(writer, table_name, before=None, total_segments=4, dead_letters=None,
+                           region_name='eu-north-1', dynamodb_client=None):
+    """
+    Copy the processed records already in DynamoDB into the Parquet dataset,
+    validated like the consumer's. With before set, only records created
+    before that 'YYYY-MM-DD HH:MM:SS' time, the ones the consumer will not
+    write itself. Returns (rows written, rows rejected).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from dynamodb_scan import scan_segment
+    from record_schema import validate_processed
+
+    def copy_segment(segment):
+        written = rejected = 0
+        batch = []
+        for item in scan_segment(table_name, segment, total_segments, region_name=region_name,
+                                 dynamodb_client=dynamodb_client):
+            row, errors = validate_processed(item)
+            if errors:
+                rejected += 1
+                if dead_letters is not None:
+                    dead_letters.put(item, errors)
+                continue
+            if before and row['created_time'] >= before:
+                continue
+            batch.append(processed_row(row))
+            if len(batch) >= 1000:
+                writer.write(batch)
+                written += len(batch)
+                batch = []
+        writer.write(batch)
+        return written + len(batch), rejected
+
+    with ThreadPoolExecutor(total_segments) as pool:
+        counts = list(pool.map(copy_segment, range(total_segments)))
+    writer.flush()
+    return sum(written for written, _ in counts), sum(rejected for _, rejected in counts)
+
+
+def main(argv=None):
+    import argparse
+    import boto3
+    from athena_runner import AthenaQueryRunner
+    from record_schema import DeadLetterSink
+
+    parser = argparse.ArgumentParser(description="Set up the typed Parquet table read by reddit_lambda")
+    parser.add_argument('location', help="Dataset root, e.g. s3://reddit-processed-parquet/processed/")
+    parser.add_argument('--database', default='default')
+    parser.add_argument('--table', default='tbl_reddit_processed_typed')
+    parser.add_argument('--create-table', action='store_true', help="Run the CREATE EXTERNAL TABLE in Athena")
+    parser.add_argument('--athena-output', default='s3://reddit-processed-athena-results/temp/')
+    parser.add_argument('--backfill', metavar='DYNAMODB_TABLE', help="Copy the records of this table")
+    parser.add_argument('--before', help="Only backfill records created before this time, "
+                                         "when the consumer started writing Parquet")
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--region', default='eu-north-1')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.create_table:
+        runner = AthenaQueryRunner(boto3.client('athena', region_name=args.region), args.database, args.athena_output)
+        result = runner.run(athena_ddl(f"{args.database}.{args.table}", args.location))
+        if not result.succeeded:
+            raise SystemExit(f"Could not create {args.table}: {result.reason}")
+        logging.info("Created %s.%s at %s", args.database, args.table, args.location)
+
+    if args.backfill:
+        registrar = GluePartitionRegistrar(args.database, args.table, region_name=args.region)
+        writer = ParquetDatasetWriter(args.location, on_new_partitions=registrar.register, region_name=args.region)
+        written, rejected = backfill_from_dynamodb(
+            writer, args.backfill, args.before, args.segments, DeadLetterSink('backfill_dead_letters.jsonl'),
+            region_name=args.region)
+        logging.info("Backfilled %d records from %s, %d failed validation", written, args.backfill, rejected)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,86 @@
+import argparse
+import logging
+
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import col
 
-def main():
+from dynamodb_scan import read_dynamodb_table
+
+def create_synthetic_table(table_name, count, endpoint_url, region_name='eu-north-1'):
+    """Create and fill a table on DynamoDB Local to try the reader against."""
+    import random
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', region_name=region_name, endpoint_url=endpoint_url)
+    table = dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        ProvisionedThroughput={'ReadCapacityUnits': 100, 'WriteCapacityUnits': 100}
+    )
+    table.wait_until_exists()
+    rng = random.Random(0)
+    with table.batch_writer() as batch:
+        for i in range(count):
+            batch.put_item(Item={
+                'id': f"post{i}",
+                'author': f"user_{rng.randint(0, count // 5)}",
+                'title': f"synthetic post {i}",
+                'subreddit': rng.choice(['AskReddit', 'pics', 'funny', 'worldnews']),
+                'score': int(rng.paretovariate(1.2)) - 1,
+                'num_comments': int(rng.paretovariate(1.5)) - 1,
+            })
+    logging.info("Created %s with %d items", table_name, count)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load a DynamoDB table into Spark with a parallel scan")
+    parser.add_argument('--table', default="tbl_RedditKinesis")
+    parser.add_argument('--columns', nargs='+', help="Attributes to read, all of them by default")
+    parser.add_argument('--segments', type=int, default=None, help="Parallel scan segments, default parallelism if unset")
+    parser.add_argument('--read-capacity-fraction', type=float, default=0.5,
+                        help="Share of the table's provisioned read capacity the scan may use")
+    parser.add_argument('--read-capacity-units', type=float, default=None,
+                        help="Read capacity for the whole scan, overrides the fraction")
+    parser.add_argument('--endpoint-url', help="DynamoDB Local endpoint, e.g. http://localhost:8000")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="Create the table with this many synthetic items first (DynamoDB Local only)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.synthetic:
+        if not args.endpoint_url:
+            parser.error("--synthetic needs --endpoint-url")
+        create_synthetic_table(args.table, args.synthetic, args.endpoint_url)
+
     # Create a Spark session
     spark = SparkSession.builder \
         .appName("DynamoDBProcessing") \
         .getOrCreate()
 
-    # Specify your DynamoDB table name
-    dynamodb_table_name = "tbl_RedditKinesis"
+    # Load data from DynamoDB, every Spark partition scans one segment
+    df = read_dynamodb_table(
+        spark,
+        args.table,
+        columns=args.columns,
+        total_segments=args.segments,
+        read_capacity_fraction=args.read_capacity_fraction,
+        read_capacity_units=args.read_capacity_units,
+        endpoint_url=args.endpoint_url
+    )
 
-    # Load data from DynamoDB
-    df = spark.read \
-        .format("dynamodb") \
-        .option("tableName", dynamodb_table_name) \
-        .load()
+    # Keep the scanned rows so the actions below don't scan the table again
+    df = df.persist(StorageLevel.MEMORY_AND_DISK)
+    logging.info("Loaded %d items", df.count())
 
     # Show the data
     df.show()
 
-    # Example processing: Filter records where score > 50
+    # Example processing: Filter records where score > 1
     filtered_df = df.filter(col("score") > 1)
     filtered_df.show()
 
+    df.unpersist()
     # Stop the Spark session
     spark.stop()
 
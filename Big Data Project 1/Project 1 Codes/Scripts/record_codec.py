@@ -0,0 +1,252 @@
+import json
+import struct
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, the json and packed encodings work without it
+    msgpack = None
+
+# First byte of every encoded record. JSON records start with '{', so records
+# written before these encodings existed are still recognised.
+JSON_HEADER = ord('{')
+MSGPACK_HEADER = 0x01
+PACKED_HEADER = 0x02
+
+# Field layouts by schema id. A schema id is never reused: changing a layout
+# means adding a new id, so consumers can always decode older records.
+SCHEMAS = {
+    1: ('minimal', [
+        ('id', 'str'), ('author', 'str'), ('title', 'text'), ('subreddit', 'str'),
+        ('created_time', 'time'), ('score', 'int'), ('num_comments', 'int'),
+    ]),
+    2: ('extended', [
+        ('id', 'str'), ('author', 'str'), ('title', 'text'), ('subreddit', 'str'),
+        ('created_time', 'time'), ('score', 'int'), ('num_comments', 'int'),
+        ('is_self_post', 'bool'), ('flair_text', 'str'), ('upvote_ratio', 'float'),
+        ('edited', 'bool_or_float'), ('over_18', 'bool'), ('thumbnail', 'str'), ('stickied', 'bool'),
+    ]),
+}
+
+# Schema id for each set of payload keys
+SCHEMA_IDS = {frozenset(name for name, _ in fields): schema_id
+              for schema_id, (_, fields) in SCHEMAS.items()}
+
+ENCODINGS = ('json', 'msgpack', 'packed')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Preset dictionary for compressing titles in the packed encoding. It is part
+# of the format: changing it requires a new schema id.
+TITLE_ZDICT = (
+    b" the a to of and in is for my on it this you with what i that was how be are do "
+    b"have at your just not from can me new one about all they so but like when if "
+    b"first why has an by out get we he she today after time people day year years "
+    b"who any help does im dont its game post question anyone best good got make "
+    b"know need think help finally some world life love than been more made"
+)
+
+_FLOAT = struct.Struct('>d')
+_TIME = struct.Struct('>I')
+
+
+def is_supported(encoding):
+    """Return True if this process can write the given encoding."""
+    return encoding in ('json', 'packed') or (encoding == 'msgpack' and msgpack is not None)
+
+
+def schema_for(record):
+    """Return the schema id matching the record's keys, or None."""
+    return SCHEMA_IDS.get(frozenset(record))
+
+
+def encode_record(record, encoding='json'):
+    """
+    Encode a payload dict for Kinesis.
+    Records that don't match a known schema exactly are written as JSON, so
+    decoding always returns the original dict.
+    """
+    if encoding == 'json':
+        return json.dumps(record).encode('utf-8')
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+    if encoding == 'msgpack' and msgpack is None:
+        raise ImportError("The msgpack encoding requires the msgpack package")
+
+    schema_id = schema_for(record)
+    if schema_id is None:
+        return json.dumps(record).encode('utf-8')
+    fields = SCHEMAS[schema_id][1]
+
+    try:
+        if encoding == 'msgpack':
+            values = [record[name] for name, _ in fields]
+            return bytes((MSGPACK_HEADER, schema_id)) + msgpack.packb(values, use_bin_type=True)
+        return bytes((PACKED_HEADER, schema_id)) + _pack(record, fields)
+    except (TypeError, ValueError, OverflowError, struct.error):
+        # A value outside the fixed layout, e.g. an int over 64 bits or a lone
+        # surrogate in a title, fall back to JSON
+        return json.dumps(record).encode('utf-8')
+
+
+def decode_record(data):
+    """Decode a Kinesis payload written by encode_record, or plain JSON."""
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data:
+        raise ValueError("Empty record")
+
+    header = data[0]
+    if header == MSGPACK_HEADER or header == PACKED_HEADER:
+        schema_id = data[1]
+        if schema_id not in SCHEMAS:
+            raise ValueError(f"Unknown record schema {schema_id}, upgrade the consumer")
+        fields = SCHEMAS[schema_id][1]
+        if header == MSGPACK_HEADER:
+            if msgpack is None:
+                raise ImportError("Decoding msgpack records requires the msgpack package")
+            values = msgpack.unpackb(data[2:], raw=False)
+            return dict(zip((name for name, _ in fields), values))
+        return _unpack(data, 2, fields)
+
+    # Anything else is JSON, possibly with leading whitespace
+    return json.loads(data)
+
+
+def _write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_bytes(out, raw):
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _compress_title(raw):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, TITLE_ZDICT)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def _decompress_title(raw):
+    return zlib.decompressobj(-15, TITLE_ZDICT).decompress(raw)
+
+
+def _pack(record, fields):
+    # Layout: null bitmap, then each non-null field in schema order
+    out = bytearray((len(fields) + 7) // 8)
+    for index, (name, kind) in enumerate(fields):
+        value = record[name]
+        if value is None:
+            out[index // 8] |= 1 << (index % 8)
+            continue
+
+        if kind == 'str':
+            if not isinstance(value, str):
+                raise TypeError(name)
+            _write_bytes(out, value.encode('utf-8'))
+        elif kind == 'text':
+            if not isinstance(value, str):
+                raise TypeError(name)
+            raw = value.encode('utf-8')
+            compressed = _compress_title(raw)
+            # Short titles often don't compress, keep whichever is smaller
+            if len(compressed) < len(raw):
+                out.append(1)
+                _write_bytes(out, compressed)
+            else:
+                out.append(0)
+                _write_bytes(out, raw)
+        elif kind == 'time':
+            # fromisoformat is much faster than strptime, the check keeps the round trip exact
+            parsed = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+            if parsed.strftime(TIME_FORMAT) != value:
+                raise ValueError(name)
+            out += _TIME.pack(int(parsed.timestamp()))
+        elif kind == 'int':
+            if type(value) is not int:
+                raise TypeError(name)
+            # Zigzag so small negative scores stay small
+            _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif kind == 'bool':
+            if type(value) is not bool:
+                raise TypeError(name)
+            out.append(int(value))
+        elif kind == 'float':
+            if type(value) is not float:
+                raise TypeError(name)
+            out += _FLOAT.pack(value)
+        elif kind == 'bool_or_float':
+            # PRAW's `edited` is False or the edit timestamp
+            if type(value) is bool:
+                out.append(int(value))
+            elif type(value) is float:
+                out.append(2)
+                out += _FLOAT.pack(value)
+            else:
+                raise TypeError(name)
+    return bytes(out)
+
+
+def _unpack(data, pos, fields):
+    bitmap_size = (len(fields) + 7) // 8
+    bitmap = data[pos:pos + bitmap_size]
+    pos += bitmap_size
+    record = {}
+
+    for index, (name, kind) in enumerate(fields):
+        if bitmap[index // 8] & (1 << (index % 8)):
+            record[name] = None
+            continue
+
+        if kind == 'str':
+            length, pos = _read_varint(data, pos)
+            record[name] = data[pos:pos + length].decode('utf-8')
+            pos += length
+        elif kind == 'text':
+            compressed = data[pos]
+            length, pos = _read_varint(data, pos + 1)
+            raw = data[pos:pos + length]
+            pos += length
+            record[name] = (_decompress_title(raw) if compressed else raw).decode('utf-8')
+        elif kind == 'time':
+            seconds = _TIME.unpack_from(data, pos)[0]
+            pos += _TIME.size
+            record[name] = datetime.fromtimestamp(seconds, timezone.utc).strftime(TIME_FORMAT)
+        elif kind == 'int':
+            value, pos = _read_varint(data, pos)
+            record[name] = (value >> 1) if not value & 1 else -((value + 1) >> 1)
+        elif kind == 'bool':
+            record[name] = bool(data[pos])
+            pos += 1
+        elif kind == 'float':
+            record[name] = _FLOAT.unpack_from(data, pos)[0]
+            pos += _FLOAT.size
+        elif kind == 'bool_or_float':
+            tag = data[pos]
+            pos += 1
+            if tag == 2:
+                record[name] = _FLOAT.unpack_from(data, pos)[0]
+                pos += _FLOAT.size
+            else:
+                record[name] = bool(tag)
+    return record
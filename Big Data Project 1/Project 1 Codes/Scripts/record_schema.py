@@ -0,0 +1,200 @@
+import json
+import logging
+import math
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Fields of a processed record: name -> (type, required). Every record written
+# to DynamoDB and Parquet has exactly these fields with these types, so
+# readers never have to cast or filter out malformed values.
+PROCESSED_FIELDS = {
+    'id': ('str', True),
+    'author': ('str', True),
+    'title': ('str', True),
+    'title_tokens': ('str_list', True),
+    'subreddit': ('str', True),
+    'created_time': ('time', True),
+    'score': ('int', True),
+    'num_comments': ('int', True),
+    'upvote_ratio': ('float', True),
+    'sentiment': ('float', True),
+    'post_age_minutes': ('float', True),
+    'popularity_score': ('float', True),
+    'author_activity_count': ('int', True),
+    'is_self_post': ('bool', False),
+    'over_18': ('bool', False),
+    'stickied': ('bool', False),
+    'edited': ('bool', False),
+    'flair_text': ('str', False),
+    'thumbnail': ('str', False),
+    'post_type': ('str', True),
+    'time_of_day': ('str', True),
+}
+
+# Fields of a payload from reddit_producer's 'extended' schema, checked before
+# preprocessing so one malformed record cannot fail a whole batch
+PAYLOAD_FIELDS = {
+    'id': ('str', True),
+    'author': ('str', True),
+    'title': ('str', True),
+    'subreddit': ('str', True),
+    'created_time': ('time', True),
+    'score': ('int', True),
+    'num_comments': ('int', True),
+    'upvote_ratio': ('float', True),
+    'is_self_post': ('bool', False),
+    'flair_text': ('str', False),
+    'edited': ('bool', False),
+    'over_18': ('bool', False),
+    'thumbnail': ('str', False),
+    'stickied': ('bool', False),
+}
+
+# Extra checks on values that already have the right type
+RANGES = {
+    'upvote_ratio': (0.0, 1.0),
+    'sentiment': (-1.0, 1.0),
+    'author_activity_count': (1, None),
+}
+CHOICES = {
+    'post_type': {'media', 'text'},
+    'time_of_day': {'day', 'night'},
+}
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise TypeError("expected an integer, got a boolean")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (float, Decimal)) and math.isfinite(value) and value == int(value):
+        return int(value)
+    raise TypeError(f"expected an integer, got {value!r}")
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise TypeError("expected a number, got a boolean")
+    if isinstance(value, (int, float, Decimal)):
+        value = float(value)
+        if math.isfinite(value):
+            return value
+    raise TypeError(f"expected a finite number, got {value!r}")
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    # PRAW's `edited` is False or the edit timestamp
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return value != 0
+    raise TypeError(f"expected a boolean, got {value!r}")
+
+
+def _to_str(value):
+    if isinstance(value, str):
+        return value
+    raise TypeError(f"expected a string, got {value!r}")
+
+
+def _to_str_list(value):
+    if isinstance(value, (list, tuple)) and all(isinstance(item, str) for item in value):
+        return list(value)
+    raise TypeError(f"expected a list of strings, got {value!r}")
+
+
+def _to_time(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime(TIME_FORMAT)
+    if isinstance(value, str):
+        datetime.strptime(value, TIME_FORMAT)  # Raises ValueError if malformed
+        return value
+    raise TypeError(f"expected a '{TIME_FORMAT}' timestamp, got {value!r}")
+
+
+CONVERTERS = {
+    'int': _to_int,
+    'float': _to_float,
+    'bool': _to_bool,
+    'str': _to_str,
+    'str_list': _to_str_list,
+    'time': _to_time,
+}
+
+
+def validate(record, fields):
+    """
+    Coerce a record to a field spec such as PROCESSED_FIELDS.
+    Returns (row, errors): the typed row with unknown fields dropped, and a
+    list of problems. The row should only be used when errors is empty.
+    """
+    if not isinstance(record, dict):
+        return {}, [f"expected an object, got {type(record).__name__}"]
+    row = {}
+    errors = []
+    for name, (kind, required) in fields.items():
+        value = record.get(name)
+        if value is None or (value == '' and kind != 'str'):
+            if required:
+                errors.append(f"{name}: missing")
+            row[name] = None
+            continue
+        try:
+            value = CONVERTERS[kind](value)
+        except (TypeError, ValueError) as e:
+            errors.append(f"{name}: {e}")
+            continue
+
+        low, high = RANGES.get(name, (None, None))
+        if (low is not None and value < low) or (high is not None and value > high):
+            errors.append(f"{name}: {value!r} is out of range")
+        elif name in CHOICES and value not in CHOICES[name]:
+            errors.append(f"{name}: {value!r} is not one of {sorted(CHOICES[name])}")
+        row[name] = value
+
+    if row.get('id') == '' or row.get('subreddit') == '':
+        errors.append("id and subreddit must not be empty")
+    return row, errors
+
+
+def validate_payload(payload):
+    """Check a decoded Kinesis payload before preprocessing, see validate."""
+    return validate(payload, PAYLOAD_FIELDS)
+
+
+def validate_processed(record):
+    """Check a processed record before it is written, see validate."""
+    return validate(record, PROCESSED_FIELDS)
+
+
+class DeadLetterSink:
+    """
+    Append records that failed validation to a local JSON lines file, with the
+    reasons, so they can be inspected and replayed instead of being silently
+    dropped by queries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def put(self, record, errors):
+        entry = {
+            'received_at': datetime.now(timezone.utc).strftime(TIME_FORMAT),
+            'errors': errors,
+            'record': record,
+        }
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+            self.count += 1
+        # Undecodable payloads may be a list, a string or null rather than an object
+        record_id = record.get('id') if isinstance(record, dict) else None
+        logging.warning("Dead-lettered record %s: %s", record_id, '; '.join(errors))
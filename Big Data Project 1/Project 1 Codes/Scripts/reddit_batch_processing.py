@@ -4,11 +4,17 @@ import os
 import json
 import io  # To use StringIO for in-memory data
 import csv  # To create CSV format
+import argparse
+import logging
 from datetime import datetime
 from botocore.exceptions import NoCredentialsError
 
+from s3_export import DEFAULT_PART_SIZE, MultipartUploadWriter
+
+FIELDNAMES = ['title', 'score', 'url', 'comments']
+
 def get_secret():
-    secret_name = "redddit-user-secret" 
+    secret_name = "redddit-user-secret"
     region_name = "eu-north-1"
 
     # Create a Secrets Manager client
@@ -26,74 +32,186 @@ def get_secret():
         print(f"Error retrieving secret: {e}")
     return None
 
-# Fetch the secrets
-secrets = get_secret()
-if not secrets:
-    raise NoCredentialsError("Could not load secrets")
-
-# Set up Reddit API using secrets
-reddit = praw.Reddit(client_id=secrets['reddit_client_id'],
-                     client_secret=secrets['reddit_client_secret'],
-                     user_agent=secrets['reddit_user_agent'])
-
-# Set up AWS environment variables
-os.environ['AWS_ACCESS_KEY_ID'] = secrets['aws_access_key_id']
-os.environ['AWS_SECRET_ACCESS_KEY'] = secrets['aws_secret_access_key']
-os.environ['AWS_DEFAULT_REGION'] = secrets['aws_default_region']
-
-# Initialize S3 client
-s3 = boto3.client('s3', region_name='eu-north-1')
-bucket_name = 'reddit-batch-data-bde'  # Ensure this is a unique bucket name
-filename = f"reddit_batch_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"  # Dynamic filename with timestamp
-
-# Fetch top 20,000 posts from subreddit
-subreddit = reddit.subreddit('learnpython')
-subreddit_data = []
-
-for post in subreddit.hot(limit=30000):
-    data = {
+def post_to_row(post):
+    return {
         'title': post.title,
         'score': post.score,
         'url': post.url,
         'comments': post.num_comments
     }
-    subreddit_data.append(data)
-
-# Use StringIO to create an in-memory CSV file
-csv_buffer = io.StringIO()
-csv_writer = csv.DictWriter(csv_buffer, fieldnames=['title', 'score', 'url', 'comments'])
-csv_writer.writeheader()
-
-# Write only the first 100 posts to the CSV for testing purposes
-for data in subreddit_data[:100]:  # You can change this limit as needed
-    csv_writer.writerow(data)
-
-## Upload the CSV file directly from memory to S3
-try:
-    s3.put_object(Bucket=bucket_name, Key=filename, Body=csv_buffer.getvalue())
-    print(f"Uploaded {filename} to S3 bucket {bucket_name}")
-except Exception as e:
-    print(f"Error uploading file to S3: {e}")
-
-# Kinesis setup (this part remains unchanged)
-kinesis = boto3.client('kinesis', region_name='eu-north-1')
-
-# Stream Reddit data to Kinesis
-for post in subreddit.hot(limit=10):
-    data = {
-        'title': post.title,
-        'score': post.score,
-        'url': post.url,
-        'comments': post.num_comments
-    }
-    kinesis.put_record(
-        StreamName='reddit-stream',
-        Data=json.dumps(data),
-        PartitionKey='partition_key'
-    )
 
-# Kinesis: Get stream description and print Shard IDs
-response = kinesis.describe_stream(StreamName='reddit-stream')
-shards = response['StreamDescription']['Shards']
-for shard in shards:
-    print(f"Shard ID: {shard['ShardId']}")
+class CSVRowEncoder:
+    """Turn dict rows into UTF-8 CSV bytes, one row at a time."""
+
+    def __init__(self, fieldnames):
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, fieldnames=fieldnames)
+
+    def _take(self):
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self):
+        self._writer.writeheader()
+        return self._take()
+
+    def row(self, row):
+        self._writer.writerow(row)
+        return self._take()
+
+def export_hot_posts(subreddit, upload, limit):
+    """
+    Stream up to `limit` hot posts of a subreddit into a CSV multipart upload.
+
+    Posts are read lazily from PRAW and written as they arrive, so memory
+    stays at about one upload part. If the upload was resumed with saved
+    progress, the listing continues after its last post. Returns the number
+    of rows in the object.
+    """
+    encoder = CSVRowEncoder(FIELDNAMES)
+    progress = upload.progress or {'rows': 0, 'after': None}
+    if upload.progress is None:
+        # A new upload, or one resumed before anything was uploaded
+        upload.write(encoder.header(), progress)
+
+    params = {'after': progress['after']} if progress['after'] else {}
+    rows = progress['rows']
+    for post in subreddit.hot(limit=max(0, limit - rows), params=params):
+        rows += 1
+        upload.write(encoder.row(post_to_row(post)), {'rows': rows, 'after': post.fullname})
+
+    upload.complete()
+    return rows
+
+def export_hot_posts_parquet(subreddit, writer, limit, state_path=None, rows_per_file=10000):
+    """
+    Stream up to `limit` hot posts into a Parquet dataset partitioned by subreddit and date.
+
+    Every rows_per_file posts are written as finished files and the listing
+    position is saved to state_path, so an interrupted run resumes after the
+    last written file. Returns the number of rows written.
+    """
+    progress = {'rows': 0, 'after': None, 'dt': datetime.now().strftime('%Y-%m-%d')}
+    if state_path and os.path.exists(state_path):
+        with open(state_path) as f:
+            saved = json.load(f)
+        if isinstance(saved, dict) and set(progress) <= set(saved):
+            progress = saved
+        else:
+            logging.warning("Ignoring %s, it is not a Parquet export state", state_path)
+
+    def save_progress():
+        if state_path:
+            tmp_path = state_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(progress, f)
+            os.replace(tmp_path, state_path)
+
+    params = {'after': progress['after']} if progress['after'] else {}
+    batch = []
+    for post in subreddit.hot(limit=max(0, limit - progress['rows']), params=params):
+        row = post_to_row(post)
+        row['subreddit'] = str(subreddit)
+        row['dt'] = progress['dt']
+        batch.append(row)
+        if len(batch) >= rows_per_file:
+            writer.write(batch)
+            writer.flush()
+            progress.update(rows=progress['rows'] + len(batch), after=post.fullname)
+            save_progress()
+            batch = []
+
+    writer.write(batch)
+    writer.flush()
+    if state_path and os.path.exists(state_path):
+        os.remove(state_path)
+    return progress['rows'] + len(batch)
+
+def stream_sample_to_kinesis(subreddit, stream_name='reddit-stream', limit=10):
+    # Kinesis setup (this part remains unchanged)
+    kinesis = boto3.client('kinesis', region_name='eu-north-1')
+
+    # Stream Reddit data to Kinesis
+    for post in subreddit.hot(limit=limit):
+        kinesis.put_record(
+            StreamName=stream_name,
+            Data=json.dumps(post_to_row(post)),
+            PartitionKey='partition_key'
+        )
+
+    # Kinesis: Get stream description and print Shard IDs
+    response = kinesis.describe_stream(StreamName=stream_name)
+    shards = response['StreamDescription']['Shards']
+    for shard in shards:
+        print(f"Shard ID: {shard['ShardId']}")
+
+def export_csv(subreddit, args):
+    # An interrupted run resumes its upload, so reuse the key saved with it
+    key = args.key
+    if key is None and os.path.exists(args.state_file):
+        with open(args.state_file) as f:
+            key = json.load(f).get('key')
+    key = key or f"reddit_batch_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"  # Dynamic filename with timestamp
+
+    # Initialize S3 client
+    s3 = boto3.client('s3', region_name='eu-north-1')
+
+    upload = MultipartUploadWriter(args.bucket, key, s3_client=s3,
+                                   part_size=args.part_size_mb * 1024 * 1024, state_path=args.state_file)
+    try:
+        rows = export_hot_posts(subreddit, upload, args.limit)
+        print(f"Uploaded {rows} posts to s3://{args.bucket}/{key}")
+    except Exception as e:
+        print(f"Error uploading file to S3, rerun to resume: {e}")
+        raise
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export hot posts of a subreddit to S3 as CSV or Parquet")
+    parser.add_argument('--subreddit', default='learnpython')
+    parser.add_argument('--limit', type=int, default=30000)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--bucket', default='reddit-batch-data-bde')
+    parser.add_argument('--parquet-root', default='s3://reddit-batch-data-bde/parquet/',
+                        help="Dataset root for --format parquet, partitioned by subreddit and date")
+    parser.add_argument('--key', help="Object key, defaults to a timestamped name")
+    parser.add_argument('--part-size-mb', type=int, default=DEFAULT_PART_SIZE // (1024 * 1024))
+    parser.add_argument('--state-file',
+                        help="Progress file used to resume an interrupted export, "
+                             "reddit_batch_export.<format>.state.json by default")
+    parser.add_argument('--kinesis-sample', type=int, default=10, help="Posts to also send to Kinesis, 0 to skip")
+    args = parser.parse_args(argv)
+    # The CSV upload and the Parquet export save differently shaped progress
+    args.state_file = args.state_file or f"reddit_batch_export.{args.format}.state.json"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Fetch the secrets
+    secrets = get_secret()
+    if not secrets:
+        raise NoCredentialsError()
+
+    # Set up Reddit API using secrets
+    reddit = praw.Reddit(client_id=secrets['reddit_client_id'],
+                         client_secret=secrets['reddit_client_secret'],
+                         user_agent=secrets['reddit_user_agent'])
+
+    # Set up AWS environment variables
+    os.environ['AWS_ACCESS_KEY_ID'] = secrets['aws_access_key_id']
+    os.environ['AWS_SECRET_ACCESS_KEY'] = secrets['aws_secret_access_key']
+    os.environ['AWS_DEFAULT_REGION'] = secrets['aws_default_region']
+
+    subreddit = reddit.subreddit(args.subreddit)
+    if args.format == 'parquet':
+        from parquet_writer import BATCH_SCHEMA, ParquetDatasetWriter
+        writer = ParquetDatasetWriter(args.parquet_root, schema=BATCH_SCHEMA)
+        rows = export_hot_posts_parquet(subreddit, writer, args.limit, state_path=args.state_file)
+        print(f"Wrote {rows} posts to {args.parquet_root}")
+    else:
+        export_csv(subreddit, args)
+
+    if args.kinesis_sample:
+        stream_sample_to_kinesis(subreddit, limit=args.kinesis_sample)
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,93 @@
 import boto3
+import codecs
+import csv
+import io
+import json
 import logging
+import os
 import time
+import uuid
+from datetime import datetime, timedelta
+
+from botocore.exceptions import ClientError
+
+from athena_runner import AthenaQueryRunner
+from s3_export import MultipartUploadWriter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-def lambda_handler(event, context):
-    # Create a session and Athena client
-    session = boto3.Session(region_name="eu-north-1")
-    athena_client = session.client('athena')
-    s3_client = session.client('s3')
-
-    # Athena database name
-    database_name = 'default'
-    # Temporary output location for Athena results
-    temp_output_location = 's3://reddit-processed-athena-results/temp/'
-    # Final output file location
-    final_output_location = 's3://reddit-processed-athena-results/latest-data.csv'
-    bucket_name = 'reddit-processed-athena-results'
-    temp_folder = 'temp/'
-
-    # Define the query
-    query = '''
-    SELECT 
+# Athena database name
+database_name = 'default'
+# TYPED_SOURCE=1 reads the typed Parquet table written by kinesis_processing_2,
+# partitioned by subreddit and dt. Only switch once it has been created and
+# backfilled (parquet_writer.py --create-table --backfill), until then the
+# export reads the DynamoDB-backed table and casts its columns.
+typed_source = os.getenv('TYPED_SOURCE', '0') == '1'
+source_table = os.getenv('SOURCE_TABLE', '"default"."tbl_reddit_processed_typed"' if typed_source
+                         else '"default"."tbl_reddit_processed"')
+bucket_name = 'reddit-processed-athena-results'
+temp_folder = 'temp/'
+# Temporary output location for Athena results
+temp_output_location = f's3://{bucket_name}/{temp_folder}'
+# Final output file location of a full export
+final_output_location = f's3://{bucket_name}/latest-data.csv'
+
+# 'full' rescans the table into latest-data.csv, 'incremental' only exports new rows
+export_mode = os.getenv('EXPORT_MODE', 'full')
+# Incremental exports are appended under exports/dt=YYYY-MM-DD/
+export_prefix = 'exports/'
+# High-water mark of the last export, in S3 unless EXPORT_STATE_PATH names a local file
+state_key = 'state/export_state.json'
+state_path = os.getenv('EXPORT_STATE_PATH')
+# At most this much created_time is exported per run. On the typed table the dt partition
+# filter then bounds what each run scans; the DynamoDB-backed table is not partitioned, so
+# there every run still scans the whole table and only the exported rows are bounded
+max_window = timedelta(hours=float(os.getenv('EXPORT_MAX_WINDOW_HOURS', '24')))
+# Rows can reach the table a while after they were created, only export windows older than this
+late_arrival_grace = timedelta(minutes=float(os.getenv('EXPORT_LATE_ARRIVAL_MINUTES', '10')))
+# Checkpoint replays and lagging shards can land rows even later, so every run also re-scans
+# this much created_time before the mark and drops the rows earlier part files already hold
+export_overlap = timedelta(hours=float(os.getenv('EXPORT_OVERLAP_HOURS', '6')))
+# Give up on a query after this many seconds, leaving time for the copy before the Lambda timeout
+query_timeout = float(os.getenv('QUERY_TIMEOUT_SECONDS', '600'))
+# Let Athena reuse a result of the same query up to this many minutes old, 0 to always run it.
+# Temp results are kept when reuse is on, expire them with a lifecycle rule on temp/
+result_reuse_minutes = int(os.getenv('RESULT_REUSE_MINUTES', '0'))
+# Merge a day's part files into one object every this many incremental runs
+compact_every = int(os.getenv('EXPORT_COMPACT_EVERY', '24'))
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The typed table is written by kinesis_processing_2 after schema validation
+# (see record_schema), so every column already has its type and no row needs
+# filtering here. created_time is formatted as before for CSV readers.
+TYPED_EXPORT_COLUMNS = '''
+        date_format(created_time, '%Y-%m-%d %H:%i:%s') AS created_time,
+        sentiment,
+        upvote_ratio,
+        thumbnail,
+        author_activity_count,
+        edited,
+        over_18,
+        author,
+        title,
+        subreddit,
+        score,
+        num_comments,
+        is_self_post,
+        stickied,
+        time_of_day,
+        post_type,
+        id,
+        post_age_minutes,
+        popularity_score,
+        flair_text'''
+
+
+# The DynamoDB-backed table has no fixed types, so numbers are cast and rows
+# with missing or non-numeric values are left out
+LEGACY_EXPORT_COLUMNS = '''
         created_time,
         TRY_CAST(sentiment AS DECIMAL(38,9)) AS sentiment,
         TRY_CAST(upvote_ratio AS DECIMAL(38,9)) AS upvote_ratio,
@@ -42,89 +107,442 @@ def lambda_handler(event, context):
         id,
         TRY_CAST(post_age_minutes AS DECIMAL(38,9)) AS post_age_minutes,
         TRY_CAST(popularity_score AS DECIMAL(38,9)) AS popularity_score,
-        flair_text
-    FROM "default"."tbl_reddit_processed"
-    WHERE 
-        sentiment IS NOT NULL 
-        AND sentiment != '' 
-        AND TRY_CAST(sentiment AS DECIMAL(38,9)) IS NOT NULL  -- Filter out non-numeric values
-        AND upvote_ratio IS NOT NULL 
-        AND upvote_ratio != '' 
-        AND TRY_CAST(upvote_ratio AS DECIMAL(38,9)) IS NOT NULL
-        AND author_activity_count IS NOT NULL 
-        AND author_activity_count != '' 
-        AND TRY_CAST(author_activity_count AS DECIMAL(38,9)) IS NOT NULL
-        AND score IS NOT NULL 
-        AND score != '' 
-        AND TRY_CAST(score AS DECIMAL(38,9)) IS NOT NULL
-        AND num_comments IS NOT NULL 
-        AND num_comments != '' 
-        AND TRY_CAST(num_comments AS DECIMAL(38,9)) IS NOT NULL
-        AND post_age_minutes IS NOT NULL 
-        AND post_age_minutes != '' 
-        AND TRY_CAST(post_age_minutes AS DECIMAL(38,9)) IS NOT NULL
-        AND popularity_score IS NOT NULL 
-        AND popularity_score != '' 
-        AND TRY_CAST(popularity_score AS DECIMAL(38,9)) IS NOT NULL;
-    '''
-
-    # Execute the query
-    logging.info("Executing the query")
-    response = athena_client.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={'Database': database_name},
-        ResultConfiguration={'OutputLocation': temp_output_location}  # Store in a temp folder
+        flair_text'''
+
+LEGACY_ROW_FILTER = '\n        AND '.join(
+    f"TRY_CAST({column} AS DECIMAL(38,9)) IS NOT NULL"
+    for column in ('sentiment', 'upvote_ratio', 'author_activity_count', 'score', 'num_comments',
+                   'post_age_minutes', 'popularity_score'))
+
+
+def build_query(start=None, end=None):
+    """The export query, limited to created_time in (start, end] when given."""
+    if not typed_source:
+        query = f'''
+    SELECT {LEGACY_EXPORT_COLUMNS}
+    FROM {source_table}
+    WHERE {LEGACY_ROW_FILTER}'''
+        if start is not None:
+            # created_time is stored as 'YYYY-MM-DD HH:MM:SS', so string order is time order
+            query += f"\n        AND created_time > '{start.strftime(TIME_FORMAT)}'"
+            query += f"\n        AND created_time <= '{end.strftime(TIME_FORMAT)}'"
+        return query + ';'
+
+    query = f'''
+    SELECT {TYPED_EXPORT_COLUMNS}
+    FROM {source_table}'''
+    if start is not None:
+        # The dt partition filter prunes to the window's days before created_time is checked
+        query += f"""
+    WHERE dt BETWEEN '{start:%Y-%m-%d}' AND '{end:%Y-%m-%d}'
+        AND created_time > TIMESTAMP '{start.strftime(TIME_FORMAT)}'
+        AND created_time <= TIMESTAMP '{end.strftime(TIME_FORMAT)}'"""
+    return query + ';'
+
+
+def get_runner(athena_client):
+    """Query runner writing results to the temp folder."""
+    return AthenaQueryRunner(
+        athena_client,
+        database_name,
+        temp_output_location,  # Store in a temp folder
+        initial_poll=0.25,
+        max_poll=5.0,
+        timeout=query_timeout,
+        reuse_max_age_minutes=result_reuse_minutes
     )
 
-    # Get the query execution ID
-    query_execution_id = response['QueryExecutionId']
-    logging.info("ATHENA QUERY EXECUTION ID: " + query_execution_id)
 
-    status = 'RUNNING'
-    while status in ['RUNNING', 'QUEUED']:
-        logging.info(f"Current status: {status}")
-        response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-        status = response['QueryExecution']['Status']['State']
-        time.sleep(5)  # Wait for 5 seconds before polling again
+def delete_temp_result(s3_client, result):
+    """Remove a query's result CSV and metadata from the temp folder."""
+    source_bucket, source_key = result.output_bucket_key()
+    s3_client.delete_objects(Bucket=source_bucket, Delete={'Objects': [
+        {'Key': source_key}, {'Key': source_key + '.metadata'}], 'Quiet': True})
+
+
+def deliver(runner, result, s3_client, key, delivery='copy', max_rows=100, delete_source=True):
+    """
+    Hand a finished query's result to its destination.
+    'copy' copies the CSV to `key` server-side, 'stream' streams it there
+    through a multipart upload, and 'rows' returns up to max_rows typed rows
+    paged from get_query_results without writing anything. With
+    delete_source False the temp result is kept for the caller to remove.
+    Returns what to add to the response body.
+    """
+    logging.info(f"Temporary Athena result location: {result.output_location}")
+    if delivery == 'rows':
+        rows = []
+        for row in runner.iter_rows(result, page_size=min(max_rows + 1, 1000)):
+            if len(rows) >= max_rows:
+                break
+            rows.append(row)
+        return {'rows': rows}
+
+    # Reused results belong to an earlier run, so only delete temp files when reuse is off
+    keep_source = bool(result_reuse_minutes) or not delete_source
+    if delivery == 'stream':
+        start = time.perf_counter()
+        upload = MultipartUploadWriter(bucket_name, key, s3_client=s3_client)
+        try:
+            for chunk in runner.stream_result(result, s3_client):
+                upload.write(chunk)
+            upload.complete()
+        except Exception:
+            upload.abort()
+            raise
+        if not keep_source and not result.reused:
+            delete_temp_result(s3_client, result)
+        result.timings['copy_seconds'] = time.perf_counter() - start
+    else:
+        runner.copy_result(result, s3_client, bucket_name, key, delete_source=not keep_source)
+    return {'key': key}
+
+
+def failure(result):
+    logging.error('Query execution failed. Status: %s', result.state)
+    failure_reason = result.reason
+    logging.error(failure_reason)
+    return {
+        'statusCode': 500,
+        'body': {
+            'message': 'Query execution failed',
+            'reason': failure_reason,
+            'query_execution_id': result.query_execution_id,
+            'timings': result.timings
+        }
+    }
+
+
+class S3StateStore:
+    """Export state kept as a small JSON object in S3, survives across Lambda containers."""
+
+    def __init__(self, s3_client, bucket, key):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+
+    def get(self):
+        try:
+            return json.loads(self.s3.get_object(Bucket=self.bucket, Key=self.key)['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return {}
+            raise
+
+    def set(self, state):
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=json.dumps(state).encode('utf-8'))
+
 
-    # Check if the query execution succeeded
-    if status == 'SUCCEEDED':
-        logging.info("Query executed successfully. Fetching results...")
+class LocalStateStore:
+    """Export state kept in a local JSON file, for running outside Lambda."""
 
-        # Get the result file name from the output location
-        query_output_location = response['QueryExecution']['ResultConfiguration']['OutputLocation']
-        logging.info(f"Temporary Athena result location: {query_output_location}")
+    def __init__(self, path):
+        self.path = path
 
-        # Extract the key (file path) from the output location
-        temp_csv_key = query_output_location.split(f"{bucket_name}/")[-1]
+    def get(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
 
-        # Copy the result from the temp location to the desired file path (latest-data.csv)
-        copy_source = {'Bucket': bucket_name, 'Key': temp_csv_key}
-        s3_client.copy_object(CopySource=copy_source, Bucket=bucket_name, Key='latest-data.csv')
+    def set(self, state):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
 
-        # Optionally, clean up the temp files
-        s3_client.delete_object(Bucket=bucket_name, Key=temp_csv_key)
 
+def next_window(high_water_mark, now):
+    """
+    The created_time range to export after the high-water mark.
+    It is at most max_window long, ends late_arrival_grace before now and never
+    crosses midnight, so each export belongs to exactly one dt partition.
+    Returns None when there is nothing old enough to export.
+    """
+    # Whole seconds, as the mark is stored, or every run would export a sliver past it
+    latest = (now - late_arrival_grace).replace(microsecond=0)
+    if high_water_mark is None:
+        high_water_mark = latest - max_window
+    next_midnight = datetime.combine(high_water_mark.date() + timedelta(days=1), datetime.min.time())
+    end = min(high_water_mark + max_window, latest, next_midnight)
+    if end <= high_water_mark:
+        return None
+    return high_water_mark, end
+
+
+def partition_prefix(day):
+    return f"{export_prefix}dt={day}/"
+
+
+def part_window_end(key):
+    """End of the window a part file was exported for, None for other files."""
+    name = key.rsplit('/', 1)[-1]
+    if not (name.startswith('part-') and name.endswith('.csv')):
+        return None
+    return datetime.strptime(name[len('part-'):-len('.csv')].split('-')[1], '%Y%m%dT%H%M%S')
+
+
+def exported_ids(s3_client, start, skip_key=None):
+    """
+    Ids of the rows created in the overlap before `start` that earlier runs
+    already exported. They are read back from the files of the overlap's days,
+    leaving out parts whose window ended before the overlap and `skip_key`.
+    """
+    overlap_start = start - export_overlap
+    after = overlap_start.strftime(TIME_FORMAT)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    ids = set()
+    day = overlap_start.date()
+    while day <= start.date():
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=partition_prefix(day.isoformat())):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                window_end = part_window_end(key)
+                if key == skip_key or not key.endswith('.csv') or \
+                        (window_end is not None and window_end <= overlap_start):
+                    continue
+                body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+                reader = csv.DictReader(codecs.getreader('utf-8')(body))
+                ids.update(row['id'] for row in reader if row['created_time'] > after)
+        day += timedelta(days=1)
+    return ids
+
+
+def deliver_new_rows(result, s3_client, key, exported, before):
+    """
+    Stream a result CSV to `key` through a multipart upload, leaving out the
+    rows created up to `before` whose id is in `exported`. Returns the number
+    of rows left out.
+    """
+    start = time.perf_counter()
+    before = before.strftime(TIME_FORMAT)
+    source_bucket, source_key = result.output_bucket_key()
+    body = s3_client.get_object(Bucket=source_bucket, Key=source_key)['Body']
+    reader = csv.reader(codecs.getreader('utf-8')(body))
+    buffer = io.StringIO()
+    # Athena quotes every field, keep writing them that way
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    header = next(reader, None)
+    skipped = 0
+
+    upload = MultipartUploadWriter(bucket_name, key, s3_client=s3_client)
+    try:
+        if header is not None:
+            writer.writerow(header)
+            id_index, created_index = header.index('id'), header.index('created_time')
+            for row in reader:
+                if row[created_index] <= before and row[id_index] in exported:
+                    skipped += 1
+                    continue
+                writer.writerow(row)
+                if buffer.tell() >= 1024 * 1024:
+                    upload.write(buffer.getvalue().encode('utf-8'))
+                    buffer.seek(0)
+                    buffer.truncate()
+        upload.write(buffer.getvalue().encode('utf-8'))
+        upload.complete()
+    except Exception:
+        upload.abort()
+        raise
+    result.timings['copy_seconds'] = time.perf_counter() - start
+    return skipped
+
+
+def without_header(chunks):
+    """Yield the bytes of a CSV body after its first line."""
+    header_done = False
+    for chunk in chunks:
+        if not header_done:
+            newline = chunk.find(b'\n')
+            if newline < 0:
+                continue
+            header_done = True
+            chunk = chunk[newline + 1:]
+        yield chunk
+
+
+def compact_partition(s3_client, state_store, state, day, now=None):
+    """
+    Merge every CSV in one day's partition into a single new compacted file.
+
+    The merged object gets a new name and the files it replaces are recorded in
+    the state before it is written. A run interrupted after writing it deletes
+    them next time, one interrupted before leaves the sources untouched, so
+    rows are never lost or exported twice.
+    """
+    prefix = partition_prefix(day)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    # Earlier compacted files sort before parts, and parts are named by window, so rows stay in time order
+    sources = sorted(obj['Key'] for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+                     for obj in page.get('Contents', []) if obj['Key'].endswith('.csv'))
+    if len(sources) < 2:
+        return 0
+
+    target = f"{prefix}compacted-{(now or datetime.utcnow()):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.csv"
+    state['compacting'] = {'target': target, 'sources': sources}
+    state_store.set(state)
+
+    upload = MultipartUploadWriter(bucket_name, target, s3_client=s3_client)
+    try:
+        for index, key in enumerate(sources):
+            chunks = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].iter_chunks(1024 * 1024)
+            # Every file starts with the same header, keep the first one
+            for chunk in (chunks if index == 0 else without_header(chunks)):
+                upload.write(chunk)
+        upload.complete()
+    except Exception:
+        upload.abort()
+        raise
+
+    finish_compaction(s3_client, state_store, state)
+    logging.info("Compacted %d files into s3://%s/%s", len(sources), bucket_name, target)
+    return len(sources)
+
+
+def finish_compaction(s3_client, state_store, state):
+    """Delete the sources of a compaction once its merged object exists."""
+    compacting = state.get('compacting')
+    if not compacting:
+        return
+    target_written = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=compacting['target']).get('KeyCount', 0)
+    if target_written:
+        for start in range(0, len(compacting['sources']), 1000):
+            chunk = compacting['sources'][start:start + 1000]
+            s3_client.delete_objects(Bucket=bucket_name,
+                                     Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True})
+    state.pop('compacting')
+    state_store.set(state)
+
+
+def run_full_export(runner, s3_client, delivery='copy', max_rows=100):
+    """Rescan the whole table and replace latest-data.csv."""
+    result = runner.run(build_query())
+    if not result.succeeded:
+        return failure(result)
+
+    logging.info("Query executed successfully. Fetching results...")
+    body = deliver(runner, result, s3_client, 'latest-data.csv', delivery, max_rows)
+    if delivery != 'rows':
         logging.info(f"File copied to {final_output_location}")
+    logging.info("Query timings: %s", result.timings)
 
-        return {
-            'statusCode': 200,
-            'body': {
-                'message': 'Query result saved to latest-data.csv',
-                'query_execution_id': query_execution_id
-            }
-        }
+    body.update({
+        'message': 'Query result saved to latest-data.csv' if delivery != 'rows' else 'Query result rows',
+        'query_execution_id': result.query_execution_id,
+        'reused_result': result.reused,
+        'timings': result.timings
+    })
+    return {'statusCode': 200, 'body': body}
+
+
+def run_incremental_export(runner, s3_client, state_store, now=None, compact=False, delivery='copy'):
+    """
+    Export rows created since the high-water mark as a new part file, then
+    advance the mark.
+
+    The mark follows created_time, so a row landing after its window was
+    exported would be missed. Each run therefore re-scans export_overlap
+    before the window. Rows found there whose id is in a part file exported
+    earlier are dropped while the result is streamed to this run's part
+    file, so only the high-water mark has to be kept in the state.
+
+    The chosen window and the query's execution id are saved with the
+    high-water mark before the result is delivered. A run retried after a
+    failed delivery finds the same mark, exports the same window whatever
+    the time is now, and so reuses that result instead of scanning again.
+    The temp result is only removed once the mark moves on.
+    """
+    state = state_store.get()
+    # Ids were kept in the state by earlier versions
+    state.pop('exported_ids', None)
+    finish_compaction(s3_client, state_store, state)
+
+    now = now or datetime.utcnow()
+    mark = state.get('high_water_mark')
+    pending = state.get('pending_window')
+    if pending and pending['high_water_mark'] == mark:
+        # The window of a run that failed after its query, so the query text and result match
+        window = datetime.strptime(pending['start'], TIME_FORMAT), datetime.strptime(pending['end'], TIME_FORMAT)
     else:
-        logging.error('Query execution failed. Status: %s', status)
-        failure_reason = response['QueryExecution']['Status']['StateChangeReason']
-        logging.error(failure_reason)
-        return {
-            'statusCode': 500,
-            'body': {
-                'message': 'Query execution failed',
-                'reason': failure_reason
-            }
-        }
+        window = next_window(datetime.strptime(mark, TIME_FORMAT) if mark else None, now)
+    body = {'high_water_mark': mark}
+
+    if window is not None:
+        start, end = window
+        runner.cache = state.setdefault('query_cache', {})
+        result = runner.run(build_query(start - export_overlap, end), data_version=mark or 'initial')
+        if not result.succeeded:
+            return failure(result)
+        state['pending_window'] = {'high_water_mark': mark, 'start': start.strftime(TIME_FORMAT),
+                                   'end': end.strftime(TIME_FORMAT)}
+        state_store.set(state)
+
+        key = f"{partition_prefix(start.date().isoformat())}part-{start:%Y%m%dT%H%M%S}-{end:%Y%m%dT%H%M%S}.csv"
+        # A retry of this window may already have written its part, which must not count as earlier
+        exported = exported_ids(s3_client, start, skip_key=key) if mark else set()
+        if exported:
+            skipped = deliver_new_rows(result, s3_client, key, exported, start)
+            logging.info("Left out %d rows of the overlap that were already exported", skipped)
+        else:
+            deliver(runner, result, s3_client, key, 'stream' if delivery == 'stream' else 'copy',
+                    delete_source=False)
+
+        # Only advance the mark once the rows are safely in place
+        state['high_water_mark'] = end.strftime(TIME_FORMAT)
+        state['exports_since_compaction'] = state.get('exports_since_compaction', 0) + 1
+        # Results of the old mark can't be reused any more
+        state['query_cache'] = {}
+        state.pop('pending_window', None)
+        state_store.set(state)
+        if not result_reuse_minutes:
+            delete_temp_result(s3_client, result)
+        logging.info("Exported rows created in (%s, %s] to s3://%s/%s", start, end, bucket_name, key)
+        logging.info("Query timings: %s", result.timings)
+        body.update({
+            'message': 'Incremental export saved',
+            'key': key,
+            'high_water_mark': state['high_water_mark'],
+            'query_execution_id': result.query_execution_id,
+            'reused_result': result.reused,
+            'timings': result.timings,
+            'more_pending': next_window(end, now) is not None,
+        })
+    else:
+        body['message'] = 'No new rows to export yet'
+
+    # Compact days that are finished. Days the next run's overlap re-scans keep
+    # their parts, which tell which rows of the overlap were already exported
+    if compact or state.get('exports_since_compaction', 0) >= compact_every:
+        mark = state.get('high_water_mark')
+        first_open_day = (datetime.strptime(mark, TIME_FORMAT) - export_overlap).date().isoformat() if mark else None
+        paginator = s3_client.get_paginator('list_objects_v2')
+        days = sorted({prefix['Prefix'][len(export_prefix) + 3:-1]
+                       for page in paginator.paginate(Bucket=bucket_name, Prefix=export_prefix, Delimiter='/')
+                       for prefix in page.get('CommonPrefixes', [])})
+        compacted = sum(compact_partition(s3_client, state_store, state, day, now)
+                        for day in days if first_open_day is None or day < first_open_day)
+        state['exports_since_compaction'] = 0
+        state_store.set(state)
+        body['compacted_files'] = compacted
+
+    return {'statusCode': 200, 'body': body}
+
+
+def lambda_handler(event, context, athena_client=None, s3_client=None):
+    # Create a session and Athena client
+    session = boto3.Session(region_name="eu-north-1")
+    athena_client = athena_client or session.client('athena')
+    s3_client = s3_client or session.client('s3')
 
+    runner = get_runner(athena_client)
 
+    event = event or {}
+    mode = event.get('mode', export_mode)
+    delivery = event.get('delivery', 'copy')
+    if mode == 'full':
+        return run_full_export(runner, s3_client, delivery, event.get('max_rows', 100))
 
+    state_store = LocalStateStore(state_path) if state_path else S3StateStore(s3_client, bucket_name, state_key)
+    return run_incremental_export(runner, s3_client, state_store, compact=event.get('compact', False),
+                                  delivery=delivery)
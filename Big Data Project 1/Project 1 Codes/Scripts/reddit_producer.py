@@ -0,0 +1,219 @@
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from record_codec import ENCODINGS, encode_record, is_supported
+
+# praw, boto3 and dotenv are imported when a client is first needed, so
+# importing this module stays fast and does not touch the network
+
+DEFAULT_REGION = 'eu-north-1'
+
+# Payload builders by schema name, see register_schema
+PAYLOAD_SCHEMAS = {}
+
+
+def register_schema(name):
+    """Register a function that turns a PRAW submission into a payload dict."""
+    def decorator(builder):
+        PAYLOAD_SCHEMAS[name] = builder
+        return builder
+    return decorator
+
+
+def created_time_of(submission):
+    """Convert created_utc to a readable datetime format if valid."""
+    if submission.created_utc:
+        return datetime.utcfromtimestamp(submission.created_utc).strftime('%Y-%m-%d %H:%M:%S')
+    logging.warning("Submission %s has no created_utc timestamp.", submission.id)
+    return None
+
+
+@register_schema('minimal')
+def minimal_payload(submission):
+    """The fields sent by reddit_kinesis.py and reddit_stream_processing.py."""
+    return {
+        'id': submission.id,
+        'author': str(submission.author),
+        'title': submission.title,
+        'subreddit': str(submission.subreddit),
+        'created_time': created_time_of(submission),
+        'score': submission.score,
+        'num_comments': submission.num_comments
+    }
+
+
+@register_schema('extended')
+def extended_payload(submission):
+    """The fields sent by reddit_kinesis_1.py and read by kinesis_processing_2.py."""
+    data = minimal_payload(submission)
+    data.update({
+        'is_self_post': submission.is_self,
+        'flair_text': submission.link_flair_text,
+        'upvote_ratio': submission.upvote_ratio,
+        'edited': submission.edited,
+        'over_18': submission.over_18,
+        'thumbnail': submission.thumbnail,
+        'stickied': submission.stickied
+    })
+    return data
+
+
+@lru_cache(maxsize=None)
+def get_kinesis_client(region_name=DEFAULT_REGION, max_pool_connections=50):
+    """Return a Kinesis client shared by every producer in the process."""
+    import boto3
+    from botocore.config import Config
+
+    # One client per region reuses a single HTTP connection pool
+    config = Config(max_pool_connections=max_pool_connections, retries={'mode': 'adaptive'})
+    return boto3.client('kinesis', region_name=region_name, config=config)
+
+
+@lru_cache(maxsize=None)
+def get_reddit():
+    """Return a PRAW client built from the REDDIT_* environment variables or .env file."""
+    import praw
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return praw.Reddit(
+        client_id=os.getenv('REDDIT_CLIENT_ID'),
+        client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+        user_agent=os.getenv('REDDIT_USER_AGENT')
+    )
+
+
+class RedditProducer:
+    """
+    Stream new submissions from one or more subreddits into a Kinesis stream.
+
+    All subreddits are read through a single PRAW stream ("data+science").
+    In 'batched' mode records go through a BatchingKinesisProducer, in
+    'single' mode each one is sent with PutRecord followed by `delay` seconds.
+    Payloads are written with the record_codec `encoding`; consumers read
+    every encoding, so switching away from 'json' needs no consumer change.
+    """
+
+    def __init__(self, subreddits, stream_name, schema='extended', mode='batched', delay=0.0,
+                 encoding='json', region_name=DEFAULT_REGION, reddit=None, kinesis_client=None,
+                 **producer_options):
+        if schema not in PAYLOAD_SCHEMAS:
+            raise ValueError(f"Unknown schema {schema!r}, expected one of {sorted(PAYLOAD_SCHEMAS)}")
+        if mode not in ('batched', 'single'):
+            raise ValueError("mode must be 'batched' or 'single'")
+        if not is_supported(encoding):
+            raise ValueError(f"Encoding {encoding!r} is not available, expected one of {ENCODINGS}")
+        if isinstance(subreddits, str):
+            subreddits = [subreddits]
+
+        self.subreddits = list(subreddits)
+        self.stream_name = stream_name
+        self.schema = schema
+        self.build_payload = PAYLOAD_SCHEMAS[schema]
+        self.mode = mode
+        self.delay = delay
+        self.encoding = encoding
+        self.region_name = region_name
+        self.producer_options = producer_options
+        self._reddit = reddit
+        self._kinesis_client = kinesis_client
+        self._producer = None
+
+    @property
+    def reddit(self):
+        if self._reddit is None:
+            self._reddit = get_reddit()
+        return self._reddit
+
+    @property
+    def kinesis_client(self):
+        if self._kinesis_client is None:
+            self._kinesis_client = get_kinesis_client(self.region_name)
+        return self._kinesis_client
+
+    @property
+    def producer(self):
+        if self._producer is None and self.mode == 'batched':
+            from kinesis_producer import BatchingKinesisProducer
+            self._producer = BatchingKinesisProducer(self.stream_name, kinesis_client=self.kinesis_client,
+                                                     **self.producer_options)
+        return self._producer
+
+    def send(self, submission):
+        """Build the payload for a submission and send or queue it."""
+        data = self.build_payload(submission)
+        logging.debug("Data to send: %s", data)
+        encoded = encode_record(data, self.encoding)
+
+        if self.mode == 'batched':
+            self.producer.put(encoded, submission.id)
+            return
+
+        response = self.kinesis_client.put_record(
+            StreamName=self.stream_name,
+            Data=encoded,
+            PartitionKey=submission.id
+        )
+        logging.debug("Sent data to Kinesis: %s", response)
+
+    def submissions(self):
+        """Stream new submissions from every configured subreddit."""
+        return self.reddit.subreddit('+'.join(self.subreddits)).stream.submissions()
+
+    def run(self, duration=None):
+        """Send submissions until `duration` (a timedelta) passes, or forever. Returns the count."""
+        start_time = datetime.now()
+        sent = 0
+        logging.info("Streaming r/%s to %s (%s schema, %s encoding, %s mode)",
+                     '+'.join(self.subreddits), self.stream_name, self.schema, self.encoding, self.mode)
+        try:
+            for submission in self.submissions():
+                self.send(submission)
+                sent += 1
+
+                if duration is not None and datetime.now() - start_time > duration:
+                    logging.info("Stopping after running for %s.", duration)
+                    break
+
+                if self.delay:
+                    time.sleep(self.delay)
+        finally:
+            self.close()
+        return sent
+
+    def close(self):
+        """Send whatever is still queued."""
+        if self._producer is not None:
+            self._producer.close()
+            logging.info("Producer stats: %s", self._producer.stats())
+            self._producer = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream Reddit submissions into Kinesis")
+    parser.add_argument('--subreddits', nargs='+', default=['all'])
+    parser.add_argument('--stream', default='reddit-bde', help="Kinesis stream name")
+    parser.add_argument('--schema', choices=sorted(PAYLOAD_SCHEMAS), default='extended')
+    parser.add_argument('--mode', choices=['batched', 'single'], default='batched')
+    parser.add_argument('--encoding', choices=ENCODINGS, default=os.getenv('RECORD_ENCODING', 'json'),
+                        help="Record encoding, consumers must be on a version that reads it")
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds to wait after each submission")
+    parser.add_argument('--duration-minutes', type=float, default=None)
+    parser.add_argument('--region', default=DEFAULT_REGION)
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'INFO'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    duration = timedelta(minutes=args.duration_minutes) if args.duration_minutes else None
+
+    producer = RedditProducer(args.subreddits, args.stream, schema=args.schema, mode=args.mode,
+                              delay=args.delay, encoding=args.encoding, region_name=args.region)
+    producer.run(duration)
+
+
+if __name__ == '__main__':
+    main()
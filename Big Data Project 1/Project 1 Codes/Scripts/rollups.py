@@ -0,0 +1,373 @@
+import logging
+import math
+import os
+import pickle
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+SNAPSHOT_VERSION = 2
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Window name -> (size, slide) in seconds. A window is tumbling when slide is
+# None or equal to its size, and sliding otherwise.
+DEFAULT_WINDOWS = {
+    '5m': (300, None),
+    '1h': (3600, 300),
+}
+
+
+class SpaceSaving:
+    """
+    Approximate heavy hitters in at most capacity counters. Any key with more
+    than total / capacity occurrences is kept, and counts overestimate by at
+    most the smallest counter.
+    """
+
+    def __init__(self, capacity=50):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key, count=1):
+        counts = self.counts
+        if key in counts or len(counts) < self.capacity:
+            counts[key] = counts.get(key, 0) + count
+            return
+        # Replace the smallest counter, inheriting its count as the error bound
+        smallest = min(counts, key=counts.get)
+        counts[key] = counts.pop(smallest) + count
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        if len(self.counts) > self.capacity:
+            self.counts = dict(sorted(self.counts.items(), key=lambda item: -item[1])[:self.capacity])
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+
+class TopTitles:
+    """
+    The k titles with the highest popularity_score, each counted once at its
+    best score. Trimming only drops titles below the current k-th best, so
+    the result is exact while at most 2 * k titles are held.
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.best = {}
+
+    def add(self, title, score):
+        if score > self.best.get(title, -math.inf):
+            self.best[title] = score
+            if len(self.best) > 2 * self.k:
+                self._trim()
+
+    def merge(self, other):
+        for title, score in other.best.items():
+            self.add(title, score)
+
+    def _trim(self):
+        self.best = dict(sorted(self.best.items(), key=lambda item: -item[1])[:self.k])
+
+    def top(self):
+        return sorted(self.best.items(), key=lambda item: (-item[1], item[0]))[:self.k]
+
+
+class PaneAggregate:
+    """Count, sums and top lists of one group over one pane, mergeable into a window."""
+
+    def __init__(self, top_authors, top_titles):
+        self.count = 0
+        self.comments_sum = 0
+        self.score_sum = 0
+        self.sentiment_sum = 0.0
+        self.popularity_sum = 0.0
+        self.authors = SpaceSaving(top_authors * 10)
+        self.titles = TopTitles(top_titles)
+
+    def add(self, record):
+        self.count += 1
+        self.comments_sum += int(record['num_comments'])
+        self.score_sum += int(record['score'])
+        self.sentiment_sum += float(record['sentiment'])
+        popularity = float(record['popularity_score'])
+        self.popularity_sum += popularity
+        self.authors.add(record['author'])
+        self.titles.add(record['title'], popularity)
+
+    def merge(self, other):
+        self.count += other.count
+        self.comments_sum += other.comments_sum
+        self.score_sum += other.score_sum
+        self.sentiment_sum += other.sentiment_sum
+        self.popularity_sum += other.popularity_sum
+        self.authors.merge(other.authors)
+        self.titles.merge(other.titles)
+
+
+def parse_time(value):
+    """Seconds since the epoch of a UTC TIME_FORMAT string."""
+    return datetime.strptime(value, TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+
+def format_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(TIME_FORMAT)
+
+
+class WindowedRollups:
+    """
+    Tumbling and sliding window aggregates of processed records per group,
+    by default subreddit and time_of_day.
+
+    Records are assigned to panes of created_time, the greatest common
+    divisor of every window size and slide, and each window is the merge of
+    its panes, so a record is aggregated once however many windows overlap
+    it. Each source passed to add_batch, such as a shard, has its own
+    watermark trailing its newest created_time by allowed_lateness, and the
+    watermark of the rollups is the lowest of them, so a lagging shard holds
+    windows open instead of having its records dropped. A source that sent
+    nothing for idle_timeout seconds is left out until it sends again, and
+    for idle_timeout after the first batch the watermark stays put, so
+    sources that have not sent yet are not overtaken on start. With
+    idle_timeout None no source is ever left out. A window is emitted once
+    the watermark passes its end and panes no window needs any more are
+    dropped. Records older than the watermark are late, counted in
+    late_records and not aggregated.
+
+    Every emitted row has a stable rollup_id, so writing it again replaces
+    the old one. close() also emits unfinished windows, for a final flush.
+    With snapshot_path set, open panes are loaded on start and written by
+    save_snapshot(). Each source keeps the panes of its records apart until
+    commit(source), called at the Kinesis checkpoint of that shard, and only
+    committed panes and watermarks are written, so the records of shards that
+    have not checkpointed yet are left to their redelivery. Windows are
+    emitted from the committed and uncommitted panes together.
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, group_by=('subreddit', 'time_of_day'), allowed_lateness=600,
+                 top_authors=5, top_titles=10, idle_timeout=300, snapshot_path=None, snapshot_interval=60):
+        self.windows = {name: (size, slide or size) for name, (size, slide) in windows.items()}
+        for name, (size, slide) in self.windows.items():
+            if slide > size or size % slide:
+                raise ValueError(f"Window {name}: slide must divide the window size")
+        self.group_by = tuple(group_by)
+        self.allowed_lateness = allowed_lateness
+        self.idle_timeout = idle_timeout
+        self.top_authors = top_authors
+        self.top_titles = top_titles
+        self.pane_seconds = math.gcd(*[value for window in self.windows.values() for value in window])
+        self.retention = max(size for size, _ in self.windows.values())
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.late_records = 0
+        self._lock = threading.Lock()
+        self._last_snapshot = time.time()
+        self._started = None
+        self.clear()
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    def clear(self):
+        """Forget every pane."""
+        self._panes = {}  # pane_start -> {group: PaneAggregate}, of committed records
+        self._pending = {}  # source -> panes of its records since its last commit
+        self._watermark = None
+        self._sources = {}  # source -> [watermark, monotonic time of its last batch]
+        self._committed_marks = {}  # source -> its watermark at its last commit
+        self._emitted = {}  # window name -> end of the last emitted window
+
+    def add_batch(self, records, source=None):
+        """
+        Aggregate processed records from one source and return the rollup rows
+        of the windows they closed.
+        """
+        with self._lock:
+            panes = self._pending.setdefault(source, {})
+            newest = None
+            for record in records:
+                event_time = int(parse_time(record['created_time']))
+                if self._watermark is not None and event_time < self._watermark:
+                    self.late_records += 1
+                    continue
+                pane_start = event_time - event_time % self.pane_seconds
+                groups = panes.get(pane_start)
+                if groups is None:
+                    groups = panes[pane_start] = {}
+                group = tuple(record[column] for column in self.group_by)
+                aggregate = groups.get(group)
+                if aggregate is None:
+                    aggregate = groups[group] = PaneAggregate(self.top_authors, self.top_titles)
+                aggregate.add(record)
+                if newest is None or event_time > newest:
+                    newest = event_time
+
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            state = self._sources.setdefault(source, [None, now])
+            state[1] = now
+            if newest is not None and (state[0] is None or newest - self.allowed_lateness > state[0]):
+                state[0] = newest - self.allowed_lateness
+
+            # The lowest watermark of the active sources, and never moving back
+            active = [mark for mark, seen in self._sources.values()
+                      if mark is not None and (self.idle_timeout is None or now - seen < self.idle_timeout)]
+            if not active or (self.idle_timeout is not None and now - self._started < self.idle_timeout):
+                return []
+            if self._watermark is None or min(active) > self._watermark:
+                self._watermark = min(active)
+            return self._emit(self._watermark)
+
+    def commit(self, source=None):
+        """
+        Add the panes of a source to the snapshot, once its records will not be
+        redelivered.
+        """
+        with self._lock:
+            for pane_start, groups in self._pending.pop(source, {}).items():
+                committed = self._panes.setdefault(pane_start, {})
+                for group, aggregate in groups.items():
+                    if group in committed:
+                        committed[group].merge(aggregate)
+                    else:
+                        committed[group] = aggregate
+            if source in self._sources:
+                self._committed_marks[source] = self._sources[source][0]
+
+    def close(self):
+        """Rows for every window that still holds records, including unfinished ones."""
+        with self._lock:
+            pane_starts = self._pane_starts()
+            if not pane_starts:
+                return []
+            newest = max(pane_starts) + self.pane_seconds
+            return self._emit(newest + self.retention)
+
+    def _pane_starts(self):
+        starts = set(self._panes)
+        for panes in self._pending.values():
+            starts.update(panes)
+        return starts
+
+    def _emit(self, watermark):
+        rows = []
+        pane_starts = self._pane_starts()
+        if not pane_starts:
+            return rows
+        first_pane, last_pane = min(pane_starts), max(pane_starts)
+        for name, (size, slide) in self.windows.items():
+            # Windows ending after the last emitted one and covering at least one pane
+            end = self._emitted.get(name)
+            if end is None:
+                end = first_pane - first_pane % slide
+            end += slide
+            while end <= watermark:
+                if end - size <= last_pane:
+                    rows.extend(self._window_rows(name, end - size, end))
+                self._emitted[name] = end
+                end += slide
+
+        # Drop panes that ended before every window still to be emitted starts
+        if len(self._emitted) < len(self.windows):
+            return rows
+        oldest_needed = min(self._emitted[name] + slide - size for name, (size, slide) in self.windows.items())
+        for panes in [self._panes, *self._pending.values()]:
+            for pane_start in [pane for pane in panes if pane + self.pane_seconds <= oldest_needed]:
+                del panes[pane_start]
+        return rows
+
+    def _window_rows(self, name, start, end):
+        merged = {}
+        for panes in [self._panes, *self._pending.values()]:
+            for pane_start in range(start, end, self.pane_seconds):
+                for group, aggregate in panes.get(pane_start, {}).items():
+                    window = merged.get(group)
+                    if window is None:
+                        window = merged[group] = PaneAggregate(self.top_authors, self.top_titles)
+                    window.merge(aggregate)
+
+        window_start, window_end = format_time(start), format_time(end)
+        rows = []
+        for group, window in sorted(merged.items()):
+            row = dict(zip(self.group_by, group))
+            row.update({
+                'rollup_id': '#'.join([name, *map(str, group), window_start]),
+                'window': name,
+                'window_start': window_start,
+                'window_end': window_end,
+                'post_count': window.count,
+                'comments_sum': window.comments_sum,
+                'score_sum': window.score_sum,
+                'sentiment_mean': round(window.sentiment_sum / window.count, 4),
+                'popularity_mean': round(window.popularity_sum / window.count, 4),
+                'top_authors': [[author, count] for author, count in window.authors.top(self.top_authors)],
+                'top_titles': [[title, round(score, 4)] for title, score in window.titles.top()],
+            })
+            rows.append(row)
+        return rows
+
+    def maybe_snapshot(self):
+        """Write a snapshot if snapshot_interval has passed since the last one."""
+        if self.snapshot_path and time.time() - self._last_snapshot >= self.snapshot_interval:
+            self.save_snapshot()
+
+    def save_snapshot(self, path=None):
+        """
+        Write the committed panes to local disk, replacing the previous snapshot
+        atomically.
+        """
+        path = path or self.snapshot_path
+        with self._lock:
+            # Uncommitted records may have moved the watermark, their redelivery must not be late
+            marks = [mark for mark in self._committed_marks.values() if mark is not None]
+            watermark = min([self._watermark, *marks]) if self._watermark is not None and marks else None
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'windows': self.windows,
+                'group_by': self.group_by,
+                'panes': self._panes,
+                'watermark': watermark,
+                'sources': dict(self._committed_marks),
+                'emitted': self._emitted,
+                'late_records': self.late_records,
+            }
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._last_snapshot = time.time()
+
+    def load_snapshot(self, path):
+        """Restore panes written by save_snapshot with the same windows and groups."""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != SNAPSHOT_VERSION or \
+                (state['windows'], state['group_by']) != (self.windows, self.group_by):
+            logging.warning("Ignoring rollup snapshot %s written with other settings", path)
+            return
+        with self._lock:
+            self._panes = state['panes']
+            self._pending = {}
+            self._watermark = state['watermark']
+            now = time.monotonic()
+            self._sources = {source: [mark, now] for source, mark in state['sources'].items()}
+            self._committed_marks = dict(state['sources'])
+            self._emitted = state['emitted']
+            self.late_records = state['late_records']
+        logging.info("Loaded %d rollup panes from %s", len(self._panes), path)
+
+
+def dynamodb_item(row):
+    """A rollup row with floats as Decimal, nested lists included, for DynamoDB."""
+    def convert(value):
+        if isinstance(value, float):
+            return Decimal(str(value))
+        if isinstance(value, list):
+            return [convert(item) for item in value]
+        return value
+    return {key: convert(value) for key, value in row.items()}
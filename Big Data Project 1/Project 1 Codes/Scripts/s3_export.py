@@ -0,0 +1,162 @@
+import base64
+import json
+import logging
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+# S3 requires every part except the last to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class MultipartUploadWriter:
+    """
+    Stream bytes to one S3 object through a multipart upload.
+
+    write() buffers data and uploads a part as soon as part_size bytes are
+    waiting, so memory stays at about one part whatever the object size.
+    Every part is exactly part_size bytes except the last.
+
+    With state_path set, the upload id is saved as soon as the upload is
+    created, and the uploaded parts, the bytes not yet uploaded and the
+    caller's `progress` after each part. A writer created again with the
+    same state_path continues that upload, and the caller resumes from
+    `progress`. Used as a context manager, the upload is completed on
+    success and left open for resuming on error.
+    """
+
+    def __init__(self, bucket, key, s3_client=None, part_size=DEFAULT_PART_SIZE, state_path=None,
+                 content_type='text/csv', region_name='eu-north-1'):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.bucket = bucket
+        self.key = key
+        self.s3 = s3_client or boto3.client('s3', region_name=region_name)
+        self.part_size = part_size
+        self.state_path = state_path
+        self.content_type = content_type
+
+        self.upload_id = None
+        self.parts = []
+        self.progress = None  # Caller's position as of the last byte written
+        self.resumed = False
+        self.bytes_uploaded = 0
+        self._buffer = bytearray()
+        self._closed = False
+
+        if state_path and os.path.exists(state_path):
+            self._resume()
+        if self.upload_id is None:
+            response = self.s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+            self.upload_id = response['UploadId']
+            # Saved before any part, so a crash never leaves an upload nobody knows about
+            self._save_state()
+            logging.info("Started multipart upload of s3://%s/%s", bucket, key)
+
+    def _resume(self):
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if not isinstance(state, dict) or 'upload_id' not in state or \
+                (state.get('bucket'), state.get('key'), state.get('part_size')) != (self.bucket, self.key, self.part_size):
+            logging.warning("Ignoring upload state %s for another object", self.state_path)
+            return
+
+        # Make sure the upload still exists, it may have been aborted or expired
+        try:
+            response = self.s3.list_parts(Bucket=self.bucket, Key=self.key, UploadId=state['upload_id'])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                raise
+            logging.warning("Multipart upload %s no longer exists, starting over", state['upload_id'])
+            return
+
+        uploaded = {part['PartNumber'] for part in response.get('Parts', [])}
+        missing = [part['PartNumber'] for part in state['parts'] if part['PartNumber'] not in uploaded]
+        if missing:
+            logging.warning("Parts %s of upload %s are missing, starting over", missing, state['upload_id'])
+            return
+
+        self.upload_id = state['upload_id']
+        self.parts = state['parts']
+        self.progress = state['progress']
+        self.bytes_uploaded = len(self.parts) * self.part_size
+        self._buffer = bytearray(base64.b64decode(state['buffer']))
+        self.resumed = True
+        logging.info("Resuming upload of s3://%s/%s after %d parts", self.bucket, self.key, len(self.parts))
+
+    def write(self, data, progress=None):
+        """Add bytes to the object. `progress` is what the caller needs to resume after them."""
+        if self._closed:
+            raise RuntimeError("MultipartUploadWriter is closed")
+        self._buffer += data
+        if progress is not None:
+            self.progress = progress
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+            self._save_state()
+
+    def _upload_part(self, body):
+        part_number = len(self.parts) + 1
+        if part_number > MAX_PARTS:
+            raise ValueError(f"Object is over {MAX_PARTS} parts, use a larger part_size")
+        response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                       PartNumber=part_number, Body=body)
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self.bytes_uploaded += len(body)
+        logging.debug("Uploaded part %d of s3://%s/%s", part_number, self.bucket, self.key)
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        state = {
+            'bucket': self.bucket,
+            'key': self.key,
+            'part_size': self.part_size,
+            'upload_id': self.upload_id,
+            'parts': self.parts,
+            'buffer': base64.b64encode(bytes(self._buffer)).decode('ascii'),
+            'progress': self.progress,
+        }
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def complete(self):
+        """Upload what is buffered as the last part and finish the object."""
+        if self._closed:
+            return
+        if self._buffer or not self.parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                          MultipartUpload={'Parts': self.parts})
+        self._closed = True
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        logging.info("Uploaded s3://%s/%s, %d bytes in %d parts",
+                     self.bucket, self.key, self.bytes_uploaded, len(self.parts))
+
+    def abort(self):
+        """Discard the upload and its saved state."""
+        if self._closed:
+            return
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self._closed = True
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.complete()
+        else:
+            logging.error("Upload of s3://%s/%s interrupted after %d parts, rerun to resume",
+                          self.bucket, self.key, len(self.parts))
+        return False
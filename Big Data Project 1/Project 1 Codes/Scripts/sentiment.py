@@ -0,0 +1,215 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from textblob import TextBlob
+
+# Allowed difference from TextBlob polarity on normalized titles, i.e. lowercased
+# with punctuation removed as preprocess_record does (observed difference is 0).
+# Raw text with apostrophes or hyphens goes through TextBlob's tokenizer and can differ.
+LEXICON_TOLERANCE = 1e-9
+
+
+class TextBlobSentiment:
+    """Score polarity by building a TextBlob for every title."""
+
+    def polarity(self, text):
+        return TextBlob(text).sentiment.polarity
+
+
+class LexiconSentiment:
+    """
+    Score polarity with a precompiled copy of the pattern lexicon used by TextBlob.
+
+    The lexicon is flattened once into plain dicts and the pattern assessment
+    rules (modifiers, negations, emoticons) are applied to whitespace tokens.
+    For normalized titles this matches TextBlob within LEXICON_TOLERANCE
+    without running the tokenizer or allocating a blob per title.
+    """
+
+    def __init__(self):
+        from textblob._text import EMOTICONS, PUNCTUATION
+        from textblob.en import sentiment as pattern_sentiment
+
+        # len() triggers the lazy load of en-sentiment.xml
+        len(pattern_sentiment)
+        self.negations = frozenset(pattern_sentiment.negations)
+        self.modifiers = tuple(pattern_sentiment.modifiers)
+        self.punctuation = PUNCTUATION
+
+        # word -> (polarity, subjectivity, intensity, is_modifier), only for words
+        # TextBlob can assess without a part-of-speech tag
+        self.lexicon = {}
+        for word, scores in dict.items(pattern_sentiment):
+            if None in scores:
+                p, s, i = scores[None]
+                is_modifier = any(pos in scores for pos in self.modifiers)
+                self.lexicon[word] = (p, s, i, is_modifier)
+
+        # Short non-alphabetic tokens that are emoticons, first match wins like in pattern
+        self.emoticons = {}
+        for (_type, p), forms in EMOTICONS.items():
+            for form in forms:
+                self.emoticons.setdefault(form.lower(), p)
+
+    def polarity(self, text):
+        lexicon = self.lexicon
+        negations = self.negations
+        assessments = []
+        m = None  # Preceding modifier word
+        n = None  # Preceding negation word
+
+        for w in text.lower().split():
+            entry = lexicon.get(w)
+            if entry is not None:
+                p, s, i, is_modifier = entry
+                if m is None:
+                    assessments.append([p, i, 1])
+                else:
+                    # Known word preceded by a modifier ("really good")
+                    last = assessments[-1]
+                    last[0] = max(-1.0, min(p * last[1], +1.0))
+                    last[1] = i
+                if n is not None:
+                    # Known word preceded by a negation ("not good")
+                    last = assessments[-1]
+                    last[1] = 1.0 / last[1]
+                    last[2] = -1
+                m = w if is_modifier else None
+                n = w if w in negations else None
+            else:
+                if w in negations:
+                    n = w
+                elif n and len(w.strip("'")) > 1:
+                    # Retain a negation across small words ("not a good")
+                    n = None
+                if n is not None and m is not None and m.endswith('ly'):
+                    # Negation preceded by a modifier ("really not good")
+                    assessments[-1][2] = -1
+                    n = None
+                elif m and len(w) > 2:
+                    # Retain a modifier across small words ("really is a good")
+                    m = None
+                if not w.isalpha() and len(w) <= 5 and w not in self.punctuation:
+                    p = self.emoticons.get(w)
+                    if p is not None:
+                        assessments.append([p, 1.0, 1])
+
+        if not assessments:
+            return 0.0
+        # "not good" = slightly bad, "not bad" = slightly good
+        total = 0
+        for p, _i, negated in assessments:
+            total += p * -0.5 if negated < 0 else p
+        return total / float(len(assessments))
+
+
+BACKENDS = {
+    'textblob': TextBlobSentiment,
+    'lexicon': LexiconSentiment,
+}
+
+# Backend used by pool worker processes, created once per process
+_worker_backend = None
+
+
+def _score_chunk(backend_name, texts):
+    global _worker_backend
+    if _worker_backend is None:
+        _worker_backend = BACKENDS[backend_name]()
+    return [_worker_backend.polarity(text) for text in texts]
+
+
+def normalize_title(text):
+    """Cache key for a title, case and whitespace do not change its polarity."""
+    return ' '.join(text.lower().split())
+
+
+class SentimentScorer:
+    """
+    Score title polarity through a pluggable backend with a bounded LRU cache.
+
+    Reposts and crossposts repeat titles heavily, so repeated titles are served
+    from the cache. Batches with more than pool_threshold uncached titles are
+    scored in a process pool when processes is set.
+    """
+
+    def __init__(self, backend='lexicon', cache_size=100000, processes=None, pool_threshold=5000):
+        self.backend_name = backend
+        self.backend = BACKENDS[backend]()
+        self.cache_size = cache_size
+        self.processes = processes
+        self.pool_threshold = pool_threshold
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def polarity(self, text):
+        """Return the polarity of one title, from -1 (negative) to 1 (positive)."""
+        key = normalize_title(text)
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = self.backend.polarity(key)
+        self._store([(key, value)])
+        return value
+
+    def polarities(self, texts):
+        """Return the polarity of every title in a batch."""
+        keys = [normalize_title(text) for text in texts]
+        results = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                value = self._cache.get(key)
+                if value is None:
+                    missing.append(key)
+                else:
+                    self._cache.move_to_end(key)
+                    results[key] = value
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if self.processes and len(missing) > self.pool_threshold:
+            scored = self._score_in_pool(missing)
+        else:
+            scored = [self.backend.polarity(key) for key in missing]
+        results.update(zip(missing, scored))
+        self._store(zip(missing, scored))
+
+        return [results[key] for key in keys]
+
+    def cache_info(self):
+        """Return the hits, misses and size of the title cache."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache),
+                    'max_size': self.cache_size}
+
+    def close(self):
+        """Shut down the process pool if one was started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _store(self, items):
+        with self._lock:
+            for key, value in items:
+                self._cache[key] = value
+                self._cache.move_to_end(key)
+            # Evict the least recently used titles
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _score_in_pool(self, keys):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        chunk_size = max(1, len(keys) // (self.processes * 4))
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+        results = self._pool.map(_score_chunk, [self.backend_name] * len(chunks), chunks)
+        return [polarity for chunk_result in results for polarity in chunk_result]
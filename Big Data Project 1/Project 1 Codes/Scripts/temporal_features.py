@@ -0,0 +1,85 @@
+import uuid
+
+from pyspark import StorageLevel
+from pyspark.sql import functions as F
+from pyspark.sql import types as T
+
+TIMESTAMP_FORMAT = 'yyyy-MM-dd HH:mm:ss'
+
+# Time grains aggregated by temporal_aggregates: name -> grouping columns
+GRAINS = {
+    'year': ('post_year',),
+    'month': ('post_month',),
+    'day': ('post_date',),
+    'hour': ('post_hour',),
+    'subreddit_hour': ('Subreddit', 'post_hour'),
+}
+
+
+def add_temporal_features(df, date_col='creation_date', persist=True):
+    """
+    Add creation_timestamp, post_date, post_time, post_year, post_month,
+    post_day and post_hour, all derived from one parsed timestamp.
+
+    date_col may already be a timestamp (csv_ingest) or a string in
+    TIMESTAMP_FORMAT. With persist the result is cached, so every later
+    aggregate and export reuses it instead of re-reading the source.
+    """
+    timestamp = F.col(date_col)
+    if not isinstance(df.schema[date_col].dataType, T.TimestampType):
+        timestamp = F.to_timestamp(timestamp, TIMESTAMP_FORMAT)
+
+    features = (df.withColumn('creation_timestamp', timestamp)
+                  .withColumn('post_date', F.to_date('creation_timestamp'))
+                  .withColumn('post_time', F.date_format('creation_timestamp', 'HH:mm:ss'))
+                  .withColumn('post_year', F.year('creation_timestamp'))
+                  .withColumn('post_month', F.month('creation_timestamp'))
+                  .withColumn('post_day', F.dayofmonth('creation_timestamp'))
+                  .withColumn('post_hour', F.hour('creation_timestamp')))
+    if persist:
+        features = features.persist(StorageLevel.MEMORY_AND_DISK)
+    return features
+
+
+def temporal_aggregates(features, grains=GRAINS):
+    """
+    Post counts for every grain in one GROUPING SETS query over a DataFrame
+    from add_temporal_features, instead of one groupBy and scan per grain.
+    Each row has a `grain` name, the grain's columns (null for the others)
+    and `count`.
+    """
+    columns = []
+    for grouping in grains.values():
+        columns.extend(column for column in grouping if column not in columns)
+
+    # A row belongs to a grain when exactly that grain's columns are grouped
+    cases = []
+    for name, grouping in grains.items():
+        conditions = [f"grouping(`{column}`) = {0 if column in grouping else 1}" for column in columns]
+        cases.append(f"WHEN {' AND '.join(conditions)} THEN '{name}'")
+
+    view = f"temporal_features_{uuid.uuid4().hex}"
+    features.createOrReplaceTempView(view)
+    selected = ', '.join(f"`{column}`" for column in columns)
+    sets = ', '.join('(' + ', '.join(f"`{column}`" for column in grouping) + ')' for grouping in grains.values())
+    try:
+        return features.sparkSession.sql(f"""
+            SELECT CASE {' '.join(cases)} END AS grain, {selected}, COUNT(*) AS count
+            FROM {view}
+            GROUP BY {selected} GROUPING SETS ({sets})
+        """)
+    finally:
+        features.sparkSession.catalog.dropTempView(view)
+
+
+def aggregates_by_grain(aggregates, grains=GRAINS):
+    """
+    Collect temporal_aggregates once and split it into one pandas DataFrame
+    per grain, sorted by the grain's columns.
+    """
+    collected = aggregates.toPandas()
+    result = {}
+    for name, grouping in grains.items():
+        rows = collected[collected['grain'] == name]
+        result[name] = rows[list(grouping) + ['count']].sort_values(list(grouping)).reset_index(drop=True)
+    return result
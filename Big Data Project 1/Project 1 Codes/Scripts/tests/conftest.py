@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts import each other as top-level modules
+sys.path.insert(0, SCRIPTS)
+
+
+@pytest.fixture
+def aws_credentials(monkeypatch):
+    """Fake credentials, so moto never reaches a real AWS account."""
+    for name, value in (('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_SESSION_TOKEN', 'testing'), ('AWS_DEFAULT_REGION', 'eu-north-1')):
+        monkeypatch.setenv(name, value)
+
+
+@pytest.fixture(scope='session')
+def spark():
+    """A local SparkSession, skipped where pyspark or Java is missing."""
+    pytest.importorskip('pyspark')
+    if not (os.environ.get('JAVA_HOME') or shutil.which('java')):
+        pytest.skip("Spark needs Java")
+    from pyspark.sql import SparkSession
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # Python workers inherit the environment the JVM is started with
+        monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [SCRIPTS, os.environ.get('PYTHONPATH')])))
+        for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            monkeypatch.setenv(name, 'testing')
+        session = SparkSession.builder \
+            .master('local[2]') \
+            .appName('tests') \
+            .config('spark.ui.enabled', 'false') \
+            .config('spark.sql.shuffle.partitions', '2') \
+            .getOrCreate()
+    session.sparkContext.setLogLevel('ERROR')
+    yield session
+    session.stop()
+
+
+@pytest.fixture
+def pipeline(aws_credentials, monkeypatch, tmp_path):
+    """
+    kinesis_processing_2 with fresh in-memory stores, no snapshots, rollups or
+    Parquet, and dead letters under tmp_path.
+    """
+    import kinesis_processing_2
+    from author_activity import AuthorActivityStore
+    from dedup import SeenIds
+    from record_schema import DeadLetterSink
+
+    monkeypatch.setattr(kinesis_processing_2, 'seen_ids', SeenIds())
+    monkeypatch.setattr(kinesis_processing_2, 'author_activity', AuthorActivityStore())
+    monkeypatch.setattr(kinesis_processing_2, 'dead_letters', DeadLetterSink(str(tmp_path / 'dead_letters.jsonl')))
+    monkeypatch.setattr(kinesis_processing_2, 'rollups_enabled', False)
+    monkeypatch.setattr(kinesis_processing_2, 'parquet_writer', None)
+    monkeypatch.setattr(kinesis_processing_2, 'write_shards', set())
+    monkeypatch.setattr(kinesis_processing_2, 'failed_write_shards', set())
+    return kinesis_processing_2
@@ -0,0 +1,94 @@
+import random
+import statistics
+
+import pandas as pd
+import pytest
+
+from anomaly_detection import EWMAStats, StreamingAnomalyDetector, WelfordStats
+
+
+def values(count=500, seed=1):
+    rng = random.Random(seed)
+    return [rng.gauss(50, 8) for _ in range(count)]
+
+
+def test_welford_matches_the_sample_mean_and_std():
+    stats = WelfordStats()
+    for value in values():
+        stats.update(value)
+
+    assert stats.count == 500
+    assert stats.mean == pytest.approx(statistics.fmean(values()))
+    assert stats.std == pytest.approx(statistics.stdev(values()))
+
+
+def test_welford_std_needs_two_values():
+    stats = WelfordStats()
+    stats.update(3.0)
+
+    assert stats.std == 0.0
+
+
+def test_ewma_matches_pandas():
+    stats = EWMAStats(alpha=0.05)
+    for value in values():
+        stats.update(value)
+
+    ewm = pd.Series(values()).ewm(alpha=0.05, adjust=False)
+    assert stats.mean == pytest.approx(ewm.mean().iloc[-1])
+    assert stats.std ** 2 == pytest.approx(ewm.var(bias=True).iloc[-1])
+
+
+def test_ewma_follows_a_level_shift():
+    stats = EWMAStats(alpha=0.1)
+    for value in [10.0] * 100 + [20.0] * 100:
+        stats.update(value)
+
+    assert stats.mean == pytest.approx(20.0, abs=0.01)
+
+
+@pytest.mark.parametrize('method', ['welford', 'ewma'])
+def test_outliers_are_flagged_once_the_baseline_is_stable(method):
+    anomalies = []
+    detector = StreamingAnomalyDetector(columns=['score'], threshold=3, method=method, alpha=0.05,
+                                        min_count=30, sink=anomalies.append)
+
+    # Too early to flag, however far off
+    assert detector.update({'id': 'early', 'score': 10_000}) == []
+    for i, value in enumerate(values(200)):
+        detector.update({'id': f'p{i}', 'score': value})
+    flagged = detector.update({'id': 'outlier', 'score': 5_000, 'num_comments': None})
+
+    assert [anomaly['id'] for anomaly in flagged] == ['outlier']
+    assert flagged[0]['z_score'] > 3
+    assert anomalies[-1] is flagged[0]
+
+
+def test_a_record_is_scored_before_it_joins_the_baseline():
+    detector = StreamingAnomalyDetector(columns=['score'], min_count=3)
+    for value in (1.0, 2.0, 3.0):
+        detector.update({'score': value})
+
+    flagged = detector.update({'score': 100.0})
+
+    assert flagged[0]['mean'] == 2.0
+    assert flagged[0]['std'] == 1.0
+    assert detector.baseline('score')[0] == 4
+
+
+def test_per_subreddit_baselines_are_kept_next_to_the_overall_one():
+    detector = StreamingAnomalyDetector(columns=['score'], per_subreddit=True, min_count=5)
+    for i in range(20):
+        detector.update({'subreddit': 'python', 'score': 10.0 + i % 2})
+        detector.update({'subreddit': 'funny', 'score': 1000.0 + i % 2})
+
+    flagged = detector.update({'subreddit': 'python', 'score': 1000.0})
+
+    # Normal for the stream, but far from r/python's baseline
+    assert [anomaly['subreddit'] for anomaly in flagged] == ['python']
+    assert detector.baseline('score', 'funny')[:2] == (20, 1000.5)
+
+
+def test_unknown_methods_are_rejected():
+    with pytest.raises(ValueError):
+        StreamingAnomalyDetector(method='mad')
@@ -0,0 +1,148 @@
+from decimal import Decimal
+
+from athena_runner import AthenaQueryRunner
+
+OUTPUT = 's3://reddit-processed-athena-results/temp/'
+
+
+class FakeAthena:
+    """
+    Athena client stand-in. Each query stays RUNNING for `polls_until_done`
+    polls, then ends in `final_state`; with an s3 client the result CSV is
+    written to the output location like Athena does.
+    """
+
+    def __init__(self, polls_until_done=0, final_state='SUCCEEDED', s3=None, csv=b'"id"\n"a"\n'):
+        self.polls_until_done = polls_until_done
+        self.final_state = final_state
+        self.s3 = s3
+        self.csv = csv
+        self.started = []
+        self.stopped = []
+        self.polls = {}
+        self.pages = []
+
+    def start_query_execution(self, QueryString, QueryExecutionContext, ResultConfiguration, **params):
+        query_execution_id = f'q{len(self.started)}'
+        self.started.append((QueryString, params))
+        self.polls[query_execution_id] = 0
+        if self.s3 is not None:
+            bucket, _, key = f"{ResultConfiguration['OutputLocation']}{query_execution_id}.csv"[5:].partition('/')
+            self.s3.put_object(Bucket=bucket, Key=key, Body=self.csv)
+        return {'QueryExecutionId': query_execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        self.polls[QueryExecutionId] += 1
+        if QueryExecutionId in self.stopped:
+            state = 'CANCELLED'
+        elif self.polls[QueryExecutionId] > self.polls_until_done:
+            state = self.final_state
+        else:
+            state = 'RUNNING'
+        return {'QueryExecution': {
+            'QueryExecutionId': QueryExecutionId,
+            'Status': {'State': state, 'StateChangeReason': 'boom' if state == 'FAILED' else None},
+            'ResultConfiguration': {'OutputLocation': f'{OUTPUT}{QueryExecutionId}.csv'},
+            'Statistics': {'QueryQueueTimeInMillis': 12, 'EngineExecutionTimeInMillis': 340,
+                           'DataScannedInBytes': 1024},
+        }}
+
+    def stop_query_execution(self, QueryExecutionId):
+        self.stopped.append(QueryExecutionId)
+        return {}
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        index = int(NextToken or 0)
+        page = dict(self.pages[index])
+        if index + 1 < len(self.pages):
+            page['NextToken'] = str(index + 1)
+        return page
+
+
+def runner_for(athena, **options):
+    sleeps = []
+    runner = AthenaQueryRunner(athena, 'default', OUTPUT, sleep=sleeps.append, **options)
+    return runner, sleeps
+
+
+def test_polling_backs_off_from_a_sub_second_interval():
+    runner, sleeps = runner_for(FakeAthena(polls_until_done=5), initial_poll=0.25, max_poll=1.0)
+
+    result = runner.run('SELECT 1')
+
+    assert result.succeeded
+    assert sleeps == [0.25, 0.5, 1.0, 1.0, 1.0]
+    assert result.timings['polls'] == 6
+    assert result.timings['queue_ms'] == 12
+    assert result.timings['execution_ms'] == 340
+    assert result.timings['data_scanned_bytes'] == 1024
+
+
+def test_a_query_past_the_timeout_is_cancelled():
+    athena = FakeAthena(polls_until_done=100)
+    runner, sleeps = runner_for(athena, initial_poll=1.0, max_poll=1.0, timeout=3.0)
+
+    result = runner.run('SELECT 1')
+
+    assert athena.stopped == ['q0']
+    assert result.state == 'CANCELLED'
+    assert not result.succeeded
+    assert sum(sleeps) <= 3.0
+
+
+def test_failed_query_reports_its_reason():
+    runner, _ = runner_for(FakeAthena(final_state='FAILED'))
+
+    result = runner.run('SELECT 1')
+
+    assert result.state == 'FAILED'
+    assert result.reason == 'boom'
+
+
+def test_same_query_and_data_version_reuse_the_execution():
+    athena = FakeAthena()
+    cache = {}
+    runner, _ = runner_for(athena, cache=cache)
+
+    first = runner.run('SELECT 1', data_version='v1')
+    again = runner.run('SELECT 1', data_version='v1')
+    changed = runner.run('SELECT 1', data_version='v2')
+
+    assert len(athena.started) == 2
+    assert again.query_execution_id == first.query_execution_id
+    assert again.reused and not first.reused and not changed.reused
+    assert len(cache) == 2
+
+
+def test_athena_result_reuse_is_requested_when_configured():
+    athena = FakeAthena()
+    runner, _ = runner_for(athena, reuse_max_age_minutes=30)
+
+    runner.run('SELECT 1')
+
+    reuse = athena.started[0][1]['ResultReuseConfiguration']['ResultReuseByAgeConfiguration']
+    assert reuse == {'Enabled': True, 'MaxAgeInMinutes': 30}
+
+
+def test_rows_are_paged_and_typed():
+    athena = FakeAthena()
+    metadata = {'ColumnInfo': [{'Name': 'id', 'Type': 'varchar'}, {'Name': 'score', 'Type': 'bigint'},
+                               {'Name': 'ratio', 'Type': 'double'}, {'Name': 'over_18', 'Type': 'boolean'},
+                               {'Name': 'sentiment', 'Type': 'decimal'}]}
+
+    def row(*values):
+        return {'Data': [{'VarCharValue': value} if value is not None else {} for value in values]}
+
+    athena.pages = [
+        {'ResultSet': {'ResultSetMetadata': metadata, 'Rows': [row('id', 'score', 'ratio', 'over_18', 'sentiment'),
+                                                               row('a', '3', '0.5', 'true', '0.123456789')]}},
+        {'ResultSet': {'ResultSetMetadata': metadata,
+                       'Rows': [row('b', None, '1.0', 'false', '12345678901234567890.000000001')]}},
+    ]
+    runner, _ = runner_for(athena)
+
+    rows = list(runner.iter_rows(runner.run('SELECT 1'), page_size=1))
+
+    assert rows == [{'id': 'a', 'score': 3, 'ratio': 0.5, 'over_18': True, 'sentiment': Decimal('0.123456789')},
+                    {'id': 'b', 'score': None, 'ratio': 1.0, 'over_18': False,
+                     'sentiment': Decimal('12345678901234567890.000000001')}]
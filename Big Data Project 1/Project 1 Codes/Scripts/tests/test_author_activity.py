@@ -0,0 +1,93 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from author_activity import AuthorActivityStore, CountMinSketch, author_hash
+
+
+def posts(count=20000, authors=3000, seed=1):
+    rng = random.Random(seed)
+    # A few prolific authors and a long tail, like r/all
+    return [f"user_{int(rng.paretovariate(1.1)) % authors}" for _ in range(count)]
+
+
+def test_author_hash_is_stable_across_runs():
+    assert author_hash('alice') == author_hash('alice')
+    assert author_hash('alice') != author_hash('bob')
+    assert 0 <= author_hash('alice') < 2 ** 64
+
+
+def test_sketch_never_undercounts_and_stays_within_its_bound():
+    sketch = CountMinSketch(width=2 ** 10, depth=4)
+    stream = posts()
+    for author in stream:
+        sketch.add(author_hash(author))
+
+    bound = math.e * len(stream) / sketch.width
+    errors = [sketch.estimate(author_hash(author)) - count for author, count in Counter(stream).items()]
+    assert min(errors) >= 0
+    # Each author is within the bound with probability 1 - e^-depth
+    assert sum(error > bound for error in errors) / len(errors) < 0.05
+
+
+def test_sketch_memory_is_fixed():
+    store = AuthorActivityStore(mode='sketch', sketch_width=2 ** 12, sketch_depth=4)
+    before = store.memory_bytes()
+    for author in posts(5000):
+        store.increment(author)
+
+    assert store.memory_bytes() == before == 4 * 2 ** 12 * 4
+    assert len(store) == 0
+
+
+@pytest.mark.parametrize('key_mode', ['intern', 'hash'])
+def test_exact_counts_match_a_counter(key_mode):
+    store = AuthorActivityStore(mode='exact', key_mode=key_mode)
+    stream = posts(5000)
+    counts = [store.increment(author) for author in stream]
+
+    expected = Counter()
+    for author, count in zip(stream, counts):
+        expected[author] += 1
+        assert count == expected[author]
+    assert store.get('user_1') == expected['user_1']
+    assert store.get('nobody') == 0
+
+
+@pytest.mark.parametrize('mode', ['exact', 'sketch'])
+def test_only_the_window_counts(mode):
+    store = AuthorActivityStore(mode=mode, window_seconds=3600, bucket_seconds=600)
+    store.increment('alice', timestamp=0)
+    store.increment('alice', timestamp=1800)
+
+    assert store.increment('alice', timestamp=3000) == 3
+    # The bucket of the first post has expired, the others are still in the window
+    assert store.increment('alice', timestamp=4300) == 3
+    assert store.get('bob') == 0
+
+
+@pytest.mark.parametrize('mode', ['exact', 'sketch'])
+def test_snapshot_round_trip(tmp_path, mode):
+    path = str(tmp_path / 'author_activity.snapshot')
+    store = AuthorActivityStore(mode=mode, snapshot_path=path)
+    for author in ['alice', 'bob', 'alice']:
+        store.increment(author)
+    store.save_snapshot()
+
+    restored = AuthorActivityStore(mode=mode, snapshot_path=path)
+
+    assert restored.increment('alice') == 3
+    assert restored.get('bob') == 1
+
+
+def test_snapshot_with_other_settings_is_ignored(tmp_path):
+    path = str(tmp_path / 'author_activity.snapshot')
+    store = AuthorActivityStore(mode='exact', snapshot_path=path)
+    store.increment('alice')
+    store.save_snapshot()
+
+    restored = AuthorActivityStore(mode='sketch', snapshot_path=path)
+
+    assert restored.get('alice') == 0
@@ -0,0 +1,105 @@
+import csv
+import io
+import os
+import subprocess
+import sys
+from argparse import Namespace
+from datetime import datetime, timedelta
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import benchmarks
+from conftest import SCRIPTS
+from kinesis_consumer import FileCheckpointStore, consume_shard
+from kinesis_producer import BatchingKinesisProducer
+from record_codec import decode_record, encode_record
+from record_schema import validate_payload
+
+
+def test_generated_submissions_are_repeatable_and_valid():
+    submissions = benchmarks.generate_submissions(200, seed=9)
+
+    assert submissions == benchmarks.generate_submissions(200, seed=9)
+    assert submissions != benchmarks.generate_submissions(200, seed=10)
+    assert all(validate_payload(submission)[1] == [] for submission in submissions)
+    # Reposts repeat earlier titles
+    assert len({submission['title'] for submission in submissions}) < len(submissions)
+
+
+def test_a_saved_corpus_is_replayed_as_generated(tmp_path):
+    path = str(tmp_path / 'corpus.jsonl')
+    generated = benchmarks.load_corpus(Namespace(corpus=None, records=50, seed=1, save_corpus=path))
+
+    replayed = benchmarks.load_corpus(Namespace(corpus=path, records=20))
+
+    assert replayed == generated[:20]
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+
+    assert benchmarks.percentile(values, 0.5) == 50
+    assert benchmarks.percentile(values, 0.99) == 99
+    assert benchmarks.percentile([], 0.5) == 0.0
+
+
+def test_in_memory_kinesis_carries_records_from_producer_to_consumer(tmp_path):
+    kinesis = benchmarks.InMemoryKinesis()
+    producer = BatchingKinesisProducer('stream', kinesis_client=kinesis, linger=0.01)
+    submissions = benchmarks.generate_submissions(30, seed=2)
+    for submission in submissions:
+        producer.put(encode_record(submission), submission['id'])
+    producer.close()
+    kinesis.closed = True
+
+    received = []
+    count = consume_shard('stream', kinesis.shard_id, received.extend, FileCheckpointStore(str(tmp_path)),
+                          initial_position='TRIM_HORIZON', kinesis_client=kinesis)
+
+    assert count == 30
+    assert [decode_record(record['Data']) for record in received] == submissions
+
+
+def test_local_athena_answers_the_export_window(aws_credentials, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    import reddit_lambda
+    from parquet_writer import ParquetDatasetWriter, processed_row
+
+    monkeypatch.setattr(reddit_lambda, 'typed_source', True)
+
+    start = datetime(2026, 10, 17, 12)
+    writer = ParquetDatasetWriter(str(tmp_path / 'processed'))
+    writer.write([processed_row({'id': f'p{i}', 'subreddit': 'python', 'created_time': start + timedelta(minutes=i)})
+                  for i in range(10)])
+    writer.close()
+
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='eu-north-1')
+        s3.create_bucket(Bucket='results', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        athena = benchmarks.LocalAthena(str(tmp_path / 'processed'), s3)
+        query = reddit_lambda.build_query(start + timedelta(minutes=2), start + timedelta(minutes=5))
+        query_execution_id = athena.start_query_execution(
+            QueryString=query, QueryExecutionContext={}, ResultConfiguration={'OutputLocation': 's3://results/q/'}
+        )['QueryExecutionId']
+
+        execution = athena.get_query_execution(query_execution_id)['QueryExecution']
+        body = s3.get_object(Bucket='results', Key=f'q/{query_execution_id}.csv')['Body'].read().decode('utf-8')
+
+    assert execution['Status']['State'] == 'SUCCEEDED'
+    assert execution['rows'] == 3
+    assert [row['id'] for row in csv.DictReader(io.StringIO(body))] == ['p3', 'p4', 'p5']
+
+
+def test_the_pipeline_benchmark_accounts_for_every_record():
+    pytest.importorskip('pyarrow')
+    env = dict(os.environ, AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', PYTHONPATH=SCRIPTS)
+
+    # A separate interpreter, the benchmark rewires kinesis_processing_2's module globals
+    result = subprocess.run([sys.executable, 'benchmarks.py', 'pipeline', '--records', '200', '--rate', '20'],
+                            cwd=SCRIPTS, env=env, capture_output=True, text=True, timeout=300)
+
+    # It exits with 1 unless DynamoDB, the export and the rollups all hold every valid record
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
+    assert 'stored in DynamoDB: 200' in result.stdout
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pyspark')
+
+from csv_ingest import SOCIAL_POSTS_SCHEMA, file_schema, read_social_posts
+
+
+@pytest.fixture
+def exports(tmp_path):
+    # A pandas export with its index column and NaN-typed counts
+    (tmp_path / 'python.csv').write_text(
+        ',ID,is_original,Flair,num_comments,Title,Subreddit,Body,URL,Upvotes,creation_date\n'
+        '0,p1,True,Help,13.0,First,python,"two\nlines",https://redd.it/p1,40.0,2024-10-17 12:00:00\n'
+        '1,p2,False,,,Second,python,"say ""hi""",https://redd.it/p2,,2024-10-17 13:30:00\n',
+        encoding='utf-8')
+    # Columns in another order, without Flair
+    (tmp_path / 'rust.csv').write_text(
+        'Subreddit,ID,Title,creation_date,Upvotes,num_comments\n'
+        'rust,r1,Third,2024-10-18 08:15:00,7,2\n',
+        encoding='utf-8')
+    (tmp_path / 'broken.csv').write_text('not,a,post\n', encoding='utf-8')
+    return tmp_path
+
+
+def test_file_schema_matches_known_columns_case_insensitively():
+    schema, found = file_schema(['', 'id', 'IS_ORIGINAL', 'Upvotes', 'extra'])
+
+    assert [field.name for field in schema] == ['_ignored_0', 'ID', 'is_Original', 'Upvotes', '_ignored_4']
+    assert found == {'ID', 'is_Original', 'Upvotes'}
+
+
+def test_exports_with_different_headers_are_read_into_one_schema(spark, exports):
+    posts = read_social_posts(spark, str(exports / '*.csv'), exclude=['broken.csv'])
+
+    assert posts.schema == SOCIAL_POSTS_SCHEMA
+    rows = {row['ID']: row for row in posts.collect()}
+    assert sorted(rows) == ['p1', 'p2', 'r1']
+    assert (rows['p1']['is_Original'], rows['p1']['num_comments'], rows['p1']['Upvotes']) == (True, 13, 40)
+    assert rows['p1']['Body'] == 'two\nlines'
+    assert rows['p2']['Body'] == 'say "hi"'
+    assert rows['p2']['num_comments'] is None
+    assert rows['r1']['creation_date'] == datetime(2024, 10, 18, 8, 15)
+    assert (rows['r1']['Flair'], rows['r1']['Body']) == (None, None)
+
+
+def test_no_matching_files_is_an_error(spark, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_social_posts(spark, str(tmp_path / '*.csv'))
@@ -0,0 +1,117 @@
+import pytest
+
+from dedup import BloomFilter, SeenIds, key_hash
+
+
+def items(*keys):
+    return [{'id': key} for key in keys]
+
+
+def ids(fresh):
+    return [item['id'] for item in fresh]
+
+
+@pytest.fixture(params=['lru', 'bloom'])
+def mode(request):
+    return request.param
+
+
+def test_bloom_filter_never_misses_and_keeps_its_error_rate():
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(key_hash(f'seen-{i}'))
+
+    assert all(bloom.contains(key_hash(f'seen-{i}')) for i in range(10000))
+    false_positives = sum(bloom.contains(key_hash(f'new-{i}')) for i in range(10000))
+    assert false_positives / 10000 < 0.02
+
+
+def test_duplicates_are_skipped_within_and_across_batches(mode):
+    seen = SeenIds(mode=mode)
+
+    assert ids(seen.filter_new(items('a', 'b', 'a'), timestamp=0)) == ['a', 'b']
+    assert ids(seen.filter_new(items('b', 'c'), timestamp=1)) == ['c']
+    assert seen.stats()['hits'] == 2
+
+
+def test_pending_ids_are_only_persisted_once_confirmed(mode, tmp_path):
+    path = str(tmp_path / 'seen_ids.snapshot')
+    seen = SeenIds(mode=mode, snapshot_path=path)
+    seen.filter_new(items('written', 'unwritten'))
+    seen.confirm(['written'])
+    seen.save_snapshot()
+
+    restored = SeenIds(mode=mode, snapshot_path=path)
+
+    # The unwritten record is processed again when Kinesis redelivers it
+    assert ids(restored.filter_new(items('written', 'unwritten'))) == ['unwritten']
+
+
+def test_only_ids_queued_before_the_barrier_are_confirmed(mode):
+    seen = SeenIds(mode=mode)
+    seen.filter_new(items('a', 'b'))
+    seen.mark_queued(['a', 'b'])
+
+    queued = seen.take_queued()
+    # Another shard queues c while the writers are being waited on
+    seen.filter_new(items('c'))
+    seen.mark_queued(['c'])
+    seen.confirm(queued)
+
+    assert seen.stats()['tracked'] == 2
+    assert seen.stats()['pending'] == 1
+    assert seen.take_queued() == ['c']
+
+
+def test_discarded_ids_are_processed_again(mode):
+    seen = SeenIds(mode=mode)
+    seen.filter_new(items('a', 'b'))
+    seen.mark_queued(['a', 'b'])
+    queued = seen.take_queued()
+
+    # The write of b was given up on
+    seen.discard(['b'])
+    seen.confirm(queued)
+
+    assert ids(seen.filter_new(items('a', 'b'))) == ['b']
+    assert seen.stats()['tracked'] == 1
+
+
+def test_confirmed_ids_expire_after_the_window(mode):
+    seen = SeenIds(mode=mode, window_seconds=3600, generations=4)
+    seen.filter_new(items('old'), timestamp=0)
+    seen.confirm(['old'])
+
+    assert ids(seen.filter_new(items('old'), timestamp=3000)) == []
+    assert ids(seen.filter_new(items('old'), timestamp=5000)) == ['old']
+
+
+def test_pending_ids_that_never_confirm_expire():
+    seen = SeenIds(window_seconds=3600)
+    seen.filter_new(items('dead-lettered'), timestamp=0)
+
+    assert ids(seen.filter_new(items('dead-lettered'), timestamp=3600)) == ['dead-lettered']
+
+
+def test_lru_keeps_the_most_recent_ids_up_to_capacity():
+    seen = SeenIds(mode='lru', capacity=3, window_seconds=None)
+    for key in 'abcd':
+        seen.add(key, timestamp=0)
+
+    assert seen.add('d', timestamp=1) is True
+    assert seen.stats()['tracked'] == 3
+    assert seen.add('a', timestamp=1) is False
+
+
+def test_bloom_memory_is_fixed_by_capacity():
+    seen = SeenIds(mode='bloom', capacity=4000, window_seconds=None, generations=4)
+    for i in range(4000):
+        seen.add(f'post-{i}')
+    memory = seen.memory_bytes()
+    for i in range(4000, 12000):
+        seen.add(f'post-{i}')
+
+    assert seen.memory_bytes() == memory
+    # The newest capacity ids are still known, the oldest generations are gone
+    assert seen.add('post-11999') is True
+    assert seen.add('post-0') is False
@@ -0,0 +1,122 @@
+import urllib.request
+from decimal import Decimal
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from dynamodb_scan import TokenBucket, plain_value, projection_params, read_dynamodb_table, scan_segment
+
+
+@pytest.fixture
+def dynamodb(aws_credentials):
+    with mock_aws():
+        client = boto3.client('dynamodb', region_name='eu-north-1')
+        client.create_table(
+            TableName='posts',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        yield client
+
+
+def test_plain_value_numbers_are_float_unless_integral():
+    assert plain_value(Decimal('3')) == 3.0
+    assert isinstance(plain_value(Decimal('3')), float)
+    assert plain_value(Decimal('2.5')) == 2.5
+    assert plain_value(Decimal('3'), integral=True) == 3
+    assert isinstance(plain_value(Decimal('3'), integral=True), int)
+    assert plain_value({'a': [Decimal('1')], 'b': {Decimal('2'), Decimal('1')}}) == {'a': [1.0], 'b': [1.0, 2.0]}
+
+
+def test_projection_params_use_placeholders():
+    assert projection_params(None) == {}
+    params = projection_params(['id', 'name'])
+    assert params['ProjectionExpression'] == '#c0, #c1'
+    assert params['ExpressionAttributeNames'] == {'#c0': 'id', '#c1': 'name'}
+
+
+def test_segments_cover_the_table_once(dynamodb):
+    for i in range(40):
+        score = 10 if i % 2 else 2.5
+        dynamodb.put_item(TableName='posts', Item={'id': {'S': f'p{i}'}, 'score': {'N': str(score)},
+                                                   'name': {'S': f'n{i}'}})
+
+    items = [item for segment in range(4)
+             for item in scan_segment('posts', segment, 4, page_size=7, dynamodb_client=dynamodb)]
+
+    assert sorted(item['id'] for item in items) == sorted(f'p{i}' for i in range(40))
+    # Whole and fractional scores share one type, so a schema can be inferred from them
+    assert {type(item['score']) for item in items} == {float}
+
+
+def test_scan_reads_only_projected_columns(dynamodb):
+    dynamodb.put_item(TableName='posts', Item={'id': {'S': 'p1'}, 'score': {'N': '4'}, 'name': {'S': 'x'}})
+
+    items = list(scan_segment('posts', 0, 1, columns=['id', 'name'], dynamodb_client=dynamodb,
+                              integer_attributes=('score',)))
+
+    assert items == [{'id': 'p1', 'name': 'x'}]
+
+
+def test_token_bucket_waits_for_debt_to_be_paid_back():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(10, clock=lambda: now[0], sleep=sleep)
+    bucket.acquire()
+    bucket.consume(30)
+    bucket.acquire()
+
+    assert slept == [pytest.approx(2.0)]
+
+
+@pytest.fixture
+def dynamodb_endpoint(aws_credentials):
+    """A moto server, reachable from the Spark workers as well."""
+    server_module = pytest.importorskip('moto.server')
+    server = server_module.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = f"http://{host}:{port}"
+    client = boto3.client('dynamodb', region_name='eu-north-1', endpoint_url=endpoint_url)
+    client.create_table(
+        TableName='posts',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    for i in range(20):
+        client.put_item(TableName='posts', Item={'id': {'S': f'p{i}'}, 'score': {'N': str(i * 10)},
+                                                 'upvote_ratio': {'N': '0.5' if i % 2 else '1'}})
+    yield endpoint_url
+    # Backends are shared by every server in this process
+    urllib.request.urlopen(urllib.request.Request(f"{endpoint_url}/moto-api/reset", method='POST'))
+    server.stop()
+
+
+def test_schema_integer_fields_load_as_integers(spark, dynamodb_endpoint):
+    from pyspark.sql.types import DoubleType, LongType, StringType, StructField, StructType
+
+    schema = StructType([StructField('id', StringType()), StructField('score', LongType()),
+                         StructField('upvote_ratio', DoubleType())])
+
+    df = read_dynamodb_table(spark, 'posts', schema=schema, total_segments=3, endpoint_url=dynamodb_endpoint)
+
+    rows = sorted(df.collect(), key=lambda row: int(row['id'][1:]))
+    assert [row['score'] for row in rows] == [i * 10 for i in range(20)]
+    assert {row['upvote_ratio'] for row in rows} == {0.5, 1.0}
+
+
+def test_without_a_schema_the_dataframe_is_cached(spark, dynamodb_endpoint):
+    df = read_dynamodb_table(spark, 'posts', total_segments=2, endpoint_url=dynamodb_endpoint)
+
+    assert df.is_cached
+    assert df.columns == ['id', 'score', 'upvote_ratio']
+    assert df.count() == 20
+    df.unpersist()
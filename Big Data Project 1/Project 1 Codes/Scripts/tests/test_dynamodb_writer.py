@@ -0,0 +1,152 @@
+from decimal import Decimal
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from dynamodb_writer import DynamoDBBatchWriter
+
+
+@pytest.fixture
+def dynamodb(aws_credentials):
+    with mock_aws():
+        resource = boto3.resource('dynamodb', region_name='eu-north-1')
+        resource.create_table(
+            TableName='posts',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        yield resource
+
+
+def stored(dynamodb):
+    return {item['id']: item for item in dynamodb.Table('posts').scan()['Items']}
+
+
+class FlakyDynamoDB:
+    """batch_write_item that throttles once, then leaves one item unprocessed, then writes everything."""
+
+    def __init__(self):
+        self.calls = []
+
+    def batch_write_item(self, RequestItems):
+        requests = RequestItems['posts']
+        self.calls.append([request['PutRequest']['Item']['id'] for request in requests])
+        if len(self.calls) == 1:
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'BatchWriteItem')
+        if len(self.calls) == 2:
+            return {'UnprocessedItems': {'posts': requests[-1:]}}
+        return {'UnprocessedItems': {}}
+
+
+def test_writes_every_item_in_batches(dynamodb):
+    writer = DynamoDBBatchWriter('posts', dynamodb=dynamodb, batch_size=10)
+    for i in range(57):
+        writer.put({'id': f'p{i}', 'score': Decimal(i)})
+    writer.wait()
+
+    assert len(stored(dynamodb)) == 57
+    stats = writer.stats()
+    assert stats['items_written'] == 57
+    assert stats['flushes'] == 6
+    assert stats['items_failed'] == 0
+    writer.close()
+
+
+def test_keeps_the_latest_version_of_a_key_in_one_batch(dynamodb):
+    writer = DynamoDBBatchWriter('posts', dynamodb=dynamodb)
+    writer.put({'id': 'p1', 'score': Decimal(1)})
+    writer.put({'id': 'p1', 'score': Decimal(2)})
+    writer.close()
+
+    assert stored(dynamodb)['p1']['score'] == 2
+    assert writer.stats()['items_written'] == 1
+
+
+def test_retries_throttling_and_unprocessed_items():
+    client = FlakyDynamoDB()
+    writer = DynamoDBBatchWriter('posts', dynamodb=client, base_backoff=0.001)
+    for i in range(3):
+        writer.put({'id': f'p{i}'})
+    writer.close()
+
+    assert client.calls == [['p0', 'p1', 'p2'], ['p0', 'p1', 'p2'], ['p2']]
+    stats = writer.stats()
+    assert stats['items_written'] == 3
+    assert stats['retries'] == 2
+
+
+def test_items_given_up_on_are_returned_by_wait():
+    class Throttled:
+        def batch_write_item(self, RequestItems):
+            raise ClientError({'Error': {'Code': 'ThrottlingException'}}, 'BatchWriteItem')
+
+    writer = DynamoDBBatchWriter('posts', dynamodb=Throttled(), max_retries=2, base_backoff=0.001)
+    writer.put({'id': 'p1'})
+    writer.put({'id': 'p2'})
+
+    assert writer.wait() == [{'id': 'p1'}, {'id': 'p2'}]
+    # Each failure is reported once
+    assert writer.wait() == []
+    assert writer.stats()['items_failed'] == 2
+    assert writer.stats()['items_written'] == 0
+    writer.close()
+
+
+def test_a_rejected_batch_reports_only_its_unwritten_items():
+    class Rejecting:
+        calls = 0
+
+        def batch_write_item(self, RequestItems):
+            self.calls += 1
+            if self.calls == 1:
+                return {'UnprocessedItems': {'posts': RequestItems['posts'][-1:]}}
+            raise ClientError({'Error': {'Code': 'ValidationException'}}, 'BatchWriteItem')
+
+    writer = DynamoDBBatchWriter('posts', dynamodb=Rejecting(), base_backoff=0.001)
+    for i in range(3):
+        writer.put({'id': f'p{i}'})
+
+    assert writer.close() == [{'id': 'p2'}]
+    assert writer.stats()['items_written'] == 2
+
+
+def test_failed_conditional_puts_are_returned():
+    class Table:
+        def put_item(self, Item, **_):
+            if Item['id'] == 'p2':
+                raise ClientError({'Error': {'Code': 'ValidationException'}}, 'PutItem')
+
+    class Resource:
+        def Table(self, name):
+            return Table()
+
+    writer = DynamoDBBatchWriter('posts', dynamodb=Resource(), conditional=True, conditional_workers=2)
+    for i in range(3):
+        writer.put({'id': f'p{i}'})
+
+    assert writer.close() == [{'id': 'p2'}]
+    assert writer.stats()['items_written'] == 2
+
+
+def test_conditional_writes_keep_the_first_copy(dynamodb):
+    writer = DynamoDBBatchWriter('posts', dynamodb=dynamodb, conditional=True, conditional_workers=2)
+    writer.put({'id': 'p1', 'score': Decimal(1)})
+    writer.wait()
+    writer.put({'id': 'p1', 'score': Decimal(2)})
+    writer.put({'id': 'p2', 'score': Decimal(3)})
+    writer.close()
+
+    items = stored(dynamodb)
+    assert items['p1']['score'] == 1
+    assert set(items) == {'p1', 'p2'}
+    assert writer.stats()['items_duplicate'] == 1
+
+
+def test_put_after_close_fails(dynamodb):
+    writer = DynamoDBBatchWriter('posts', dynamodb=dynamodb)
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.put({'id': 'p1'})
@@ -0,0 +1,211 @@
+from datetime import timedelta
+
+import pytest
+from botocore.exceptions import ClientError
+
+import kinesis_consumer
+from kinesis_consumer import (SHARD_END, AdaptiveFetchScheduler, FileCheckpointStore, SQLiteCheckpointStore,
+                              consume_shard, eligible_shards, run_consumer)
+
+
+class FakeKinesis:
+    """
+    Kinesis client stand-in. shards maps shard ids to their records, each
+    shard in `closed` ends once read to the end, like a parent after a
+    reshard, and `parents` maps children to their parent shard ids.
+    """
+
+    def __init__(self, shards, closed=(), parents=None, throttles=0):
+        self.shards = shards
+        self.closed = set(closed)
+        self.parents = parents or {}
+        self.throttles = throttles
+        self.limits = []
+
+    def list_shards(self, StreamName=None, NextToken=None):
+        shards = []
+        for shard_id in self.shards:
+            shard = {'ShardId': shard_id}
+            parents = self.parents.get(shard_id, ())
+            if parents:
+                shard['ParentShardId'] = parents[0]
+            if len(parents) > 1:
+                shard['AdjacentParentShardId'] = parents[1]
+            shards.append(shard)
+        return {'Shards': shards}
+
+    def get_shard_iterator(self, StreamName, ShardId, ShardIteratorType, StartingSequenceNumber=None):
+        records = self.shards[ShardId]
+        if ShardIteratorType == 'AFTER_SEQUENCE_NUMBER':
+            position = [record['SequenceNumber'] for record in records].index(StartingSequenceNumber) + 1
+        elif ShardIteratorType == 'TRIM_HORIZON':
+            position = 0
+        else:
+            position = len(records)
+        return {'ShardIterator': f'{ShardId}:{position}'}
+
+    def get_records(self, ShardIterator, Limit):
+        if self.throttles:
+            self.throttles -= 1
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'GetRecords')
+        self.limits.append(Limit)
+        shard_id, position = ShardIterator.rsplit(':', 1)
+        records = self.shards[shard_id][int(position):int(position) + Limit]
+        position = int(position) + len(records)
+        ended = shard_id in self.closed and position >= len(self.shards[shard_id])
+        return {'Records': records, 'NextShardIterator': None if ended else f'{shard_id}:{position}',
+                'MillisBehindLatest': 0}
+
+
+def records(shard_id, count):
+    return [{'Data': f'{shard_id}-{i}'.encode(), 'SequenceNumber': f'{shard_id}-{i:03d}'} for i in range(count)]
+
+
+@pytest.fixture(params=['file', 'sqlite'])
+def checkpoint_store(request, tmp_path):
+    if request.param == 'file':
+        return FileCheckpointStore(str(tmp_path / 'checkpoints'))
+    return SQLiteCheckpointStore(str(tmp_path / 'checkpoints.db'), 'stream')
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(kinesis_consumer.time, 'sleep', slept.append)
+    return slept
+
+
+def test_children_wait_for_every_parent(checkpoint_store):
+    shards = FakeKinesis({'parent-0': [], 'parent-1': [], 'child': []},
+                         parents={'child': ('parent-0', 'parent-1')}).list_shards()['Shards']
+
+    assert [shard['ShardId'] for shard in eligible_shards(shards, checkpoint_store)] == ['parent-0', 'parent-1']
+
+    checkpoint_store.set('parent-0', SHARD_END)
+    assert [shard['ShardId'] for shard in eligible_shards(shards, checkpoint_store)] == ['parent-1']
+
+    checkpoint_store.set('parent-1', SHARD_END)
+    assert [shard['ShardId'] for shard in eligible_shards(shards, checkpoint_store)] == ['child']
+
+
+def test_expired_parents_do_not_hold_their_children(checkpoint_store):
+    shards = [{'ShardId': 'child', 'ParentShardId': 'trimmed'}]
+
+    assert eligible_shards(shards, checkpoint_store) == shards
+
+
+def test_parent_records_are_processed_before_the_child(checkpoint_store):
+    kinesis = FakeKinesis({'parent': records('parent', 5), 'child': records('child', 3)},
+                          closed={'parent'}, parents={'child': ('parent',)})
+    processed = []
+
+    total = run_consumer('stream', lambda batch: processed.extend(batch), checkpoint_store,
+                         time_limit=timedelta(seconds=1.5), initial_position='TRIM_HORIZON',
+                         kinesis_client=kinesis, discovery_interval=0.05,
+                         scheduler_options={'min_limit': 2, 'max_limit': 2, 'max_idle_delay': 0.05})
+
+    assert total == 8
+    # The child starts at TRIM_HORIZON once its parent is finished, so nothing is skipped
+    assert [record['SequenceNumber'] for record in processed] == \
+        [f'parent-{i:03d}' for i in range(5)] + [f'child-{i:03d}' for i in range(3)]
+    assert checkpoint_store.get('parent') == SHARD_END
+    assert checkpoint_store.get('child') == 'child-002'
+
+
+def test_a_restart_resumes_after_the_checkpoint(checkpoint_store, sleeps):
+    kinesis = FakeKinesis({'shard-0': records('shard-0', 5)}, closed={'shard-0'})
+    options = {'initial_position': 'TRIM_HORIZON', 'checkpoint_interval': 0,
+               'scheduler_options': {'min_limit': 2, 'max_limit': 2}}
+    processed = []
+
+    def fail_on_second_batch(batch):
+        if processed:
+            raise RuntimeError("consumer crashed")
+        processed.extend(batch)
+
+    with pytest.raises(RuntimeError):
+        consume_shard('stream', 'shard-0', fail_on_second_batch, checkpoint_store, kinesis_client=kinesis, **options)
+    assert checkpoint_store.get('shard-0') == 'shard-0-001'
+
+    consume_shard('stream', 'shard-0', processed.extend, checkpoint_store, kinesis_client=kinesis, **options)
+
+    assert [record['SequenceNumber'] for record in processed] == [f'shard-0-{i:03d}' for i in range(5)]
+    assert checkpoint_store.get('shard-0') == SHARD_END
+
+
+def test_throttles_back_off_exponentially(monkeypatch):
+    monkeypatch.setattr(kinesis_consumer.random, 'uniform', lambda low, high: high)
+    scheduler = AdaptiveFetchScheduler(min_limit=100, max_limit=1000, throttle_delay=0.5, max_throttle_delay=4.0)
+    scheduler.limit = 800
+
+    delays = [scheduler.record_throttle() for _ in range(6)]
+
+    assert delays == [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+    assert scheduler.limit == 100
+    # A successful read resets the backoff
+    scheduler.record_fetch(10, 0)
+    assert scheduler.record_throttle() == 0.5
+
+
+def test_throttled_reads_are_retried_after_the_backoff(tmp_path, sleeps, monkeypatch):
+    monkeypatch.setattr(kinesis_consumer.random, 'uniform', lambda low, high: high)
+    kinesis = FakeKinesis({'shard-0': records('shard-0', 3)}, closed={'shard-0'}, throttles=3)
+
+    processed = consume_shard('stream', 'shard-0', lambda batch: None, FileCheckpointStore(str(tmp_path)),
+                              initial_position='TRIM_HORIZON', kinesis_client=kinesis,
+                              scheduler_options={'throttle_delay': 0.5})
+
+    assert processed == 3
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert kinesis_consumer.shard_metrics['shard-0']['throttles'] == 3
+
+
+def test_full_batches_grow_the_limit_and_empty_ones_back_off():
+    scheduler = AdaptiveFetchScheduler(min_limit=100, max_limit=400, min_idle_delay=0.2, max_idle_delay=1.0)
+
+    assert [scheduler.record_fetch(scheduler.limit, 0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert scheduler.limit == 400
+    # A partial batch means the consumer caught up
+    assert scheduler.record_fetch(50, 0) == 0.2
+    assert scheduler.limit == 200
+
+    assert [scheduler.record_fetch(0, 0) for _ in range(5)] == [0.2, 0.4, 0.8, 1.0, 1.0]
+    assert scheduler.limit == 100
+    # Empty reads of a lagging shard are inside a gap, read on
+    assert scheduler.record_fetch(0, 5000) == 0.0
+    assert scheduler.record_fetch(1, 0) == 0.2
+
+
+def test_a_lagging_shard_is_read_back_to_back_with_growing_limits(tmp_path, sleeps):
+    kinesis = FakeKinesis({'shard-0': records('shard-0', 7)}, closed={'shard-0'})
+
+    consume_shard('stream', 'shard-0', lambda batch: None, FileCheckpointStore(str(tmp_path)),
+                  initial_position='TRIM_HORIZON', kinesis_client=kinesis,
+                  scheduler_options={'min_limit': 2, 'max_limit': 8})
+
+    assert kinesis.limits == [2, 4, 8]
+    assert sleeps == []
+
+
+def test_checkpoints_are_saved_after_the_barrier(tmp_path, sleeps):
+    events = []
+
+    class Store(FileCheckpointStore):
+        def set(self, shard_id, sequence_number):
+            events.append(('checkpoint', sequence_number))
+            super().set(shard_id, sequence_number)
+
+    store = Store(str(tmp_path))
+
+    def wait_for_writes():
+        # The previous checkpoint is still the saved one while the writes are waited for
+        events.append(('barrier', store.get('shard-0')))
+
+    kinesis = FakeKinesis({'shard-0': records('shard-0', 4)}, closed={'shard-0'})
+    consume_shard('stream', 'shard-0', lambda batch: events.append(('batch', len(batch))), store,
+                  initial_position='TRIM_HORIZON', kinesis_client=kinesis, checkpoint_barrier=wait_for_writes,
+                  checkpoint_interval=0, scheduler_options={'min_limit': 2, 'max_limit': 2})
+
+    assert events == [('batch', 2), ('barrier', None), ('checkpoint', 'shard-0-001'),
+                      ('batch', 2), ('barrier', 'shard-0-001'), ('checkpoint', 'shard-0-003'),
+                      ('barrier', 'shard-0-003'), ('checkpoint', SHARD_END)]
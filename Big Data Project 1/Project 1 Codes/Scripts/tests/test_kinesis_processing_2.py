@@ -0,0 +1,208 @@
+import copy
+from collections import deque
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+import kinesis_consumer
+from anomaly_detection import StreamingAnomalyDetector
+from author_activity import AuthorActivityStore
+from benchmarks import generate_submissions
+from dynamodb_writer import DynamoDBBatchWriter
+from record_codec import encode_record
+
+
+class AlwaysThrottled:
+    """DynamoDB resource whose batch writes are always throttled."""
+
+    def batch_write_item(self, RequestItems):
+        raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'BatchWriteItem')
+
+
+class Recording:
+    """DynamoDB resource that accepts every batch write."""
+
+    def __init__(self):
+        self.written = []
+
+    def batch_write_item(self, RequestItems):
+        for requests in RequestItems.values():
+            self.written.extend(request['PutRequest']['Item'].get('id') for request in requests)
+        return {'UnprocessedItems': {}}
+
+
+def kinesis_records(payloads):
+    return [{'Data': encode_record(payload), 'SequenceNumber': str(i)} for i, payload in enumerate(payloads)]
+
+
+def use_writer(pipeline, monkeypatch, dynamodb):
+    writer = DynamoDBBatchWriter('posts', dynamodb=dynamodb, max_retries=1, base_backoff=0.001)
+    monkeypatch.setattr(pipeline, 'dynamodb_writer', writer)
+    return writer
+
+
+def in_shard(shard_id, function, *args):
+    """Run function as consume_shard would for shard_id."""
+    kinesis_consumer._current.shard_id = shard_id
+    try:
+        return function(*args)
+    finally:
+        kinesis_consumer._current.shard_id = None
+
+
+def test_records_that_were_never_written_are_not_confirmed(pipeline, monkeypatch):
+    use_writer(pipeline, monkeypatch, AlwaysThrottled())
+    payloads = generate_submissions(5, seed=1)
+
+    in_shard('shard-0', pipeline.process_batch, kinesis_records(payloads))
+    with pytest.raises(pipeline.WritesFailed):
+        in_shard('shard-0', pipeline.wait_for_writes)
+
+    # Nothing was confirmed, and a redelivery is processed again
+    assert pipeline.seen_ids.stats()['tracked'] == 0
+    assert len(pipeline.seen_ids.filter_new([{'id': payload['id']} for payload in payloads])) == 5
+
+
+def test_every_shard_that_queued_failed_writes_skips_its_checkpoint(pipeline, monkeypatch):
+    use_writer(pipeline, monkeypatch, AlwaysThrottled())
+    payloads = generate_submissions(4, seed=2)
+    in_shard('shard-0', pipeline.process_batch, kinesis_records(payloads[:2]))
+    in_shard('shard-1', pipeline.process_batch, kinesis_records(payloads[2:]))
+
+    # shard-0's barrier waits for shard-1's writes as well
+    with pytest.raises(pipeline.WritesFailed):
+        in_shard('shard-0', pipeline.wait_for_writes)
+    monkeypatch.setattr(pipeline, 'dynamodb_writer', DynamoDBBatchWriter('posts', dynamodb=Recording()))
+    with pytest.raises(pipeline.WritesFailed):
+        in_shard('shard-1', pipeline.wait_for_writes)
+    # Once replayed from their checkpoints, the shards checkpoint again
+    in_shard('shard-1', pipeline.wait_for_writes)
+
+
+def test_written_records_are_confirmed(pipeline, monkeypatch):
+    dynamodb = Recording()
+    use_writer(pipeline, monkeypatch, dynamodb)
+    payloads = generate_submissions(5, seed=3)
+
+    in_shard('shard-0', pipeline.process_batch, kinesis_records(payloads))
+    in_shard('shard-0', pipeline.wait_for_writes)
+
+    assert sorted(dynamodb.written) == sorted(payload['id'] for payload in payloads)
+    assert pipeline.seen_ids.stats()['tracked'] == 5
+
+
+def test_a_failed_barrier_leaves_the_checkpoint_alone(tmp_path):
+    class Shard:
+        def get_shard_iterator(self, **_):
+            return {'ShardIterator': '0'}
+
+        def get_records(self, ShardIterator, Limit):
+            return {'Records': [{'Data': b'{}', 'SequenceNumber': '1'}], 'NextShardIterator': None}
+
+    def barrier():
+        assert kinesis_consumer.current_shard_id() == 'shard-0'
+        raise RuntimeError("writes failed")
+
+    store = kinesis_consumer.FileCheckpointStore(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        kinesis_consumer.consume_shard('stream', 'shard-0', lambda records: None, store,
+                                       kinesis_client=Shard(), checkpoint_barrier=barrier)
+    assert store.get('shard-0') is None
+
+
+def test_shard_processes_snapshot_rollups_per_shard(pipeline, monkeypatch, tmp_path):
+    from rollups import WindowedRollups
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, 'shard_executor', 'process')
+    monkeypatch.setattr(pipeline, 'snapshot_shard_id', None)
+    monkeypatch.setattr(pipeline, 'rollups_enabled', True)
+    monkeypatch.setattr(pipeline, 'rollups', WindowedRollups(idle_timeout=None))
+    monkeypatch.setattr(pipeline, 'use_process_metrics', lambda: None)
+    monkeypatch.setattr(pipeline.metrics, 'write', lambda path: None)
+    use_writer(pipeline, monkeypatch, Recording())
+    monkeypatch.setattr(pipeline, 'rollup_writer', DynamoDBBatchWriter('rollups', dynamodb=Recording(),
+                                                                       key_name='rollup_id'))
+    payloads = generate_submissions(4, seed=3)
+
+    in_shard('shard-1', pipeline.process_batch, kinesis_records(payloads[:2]))
+    in_shard('shard-1', pipeline.wait_for_writes)
+    in_shard('shard-2', pipeline.process_batch, kinesis_records(payloads[2:]))
+
+    assert pipeline.rollups.snapshot_path == 'rollups.snapshot.shard-2'
+    assert (tmp_path / 'rollups.snapshot.shard-1').exists()
+    assert not (tmp_path / 'rollups.snapshot').exists()
+
+
+NOW = datetime(2024, 11, 2, 8, 30, tzinfo=timezone.utc)
+
+
+def both_paths(pipeline, monkeypatch, records):
+    """preprocess_record on each record and preprocess_batch, each with fresh author counts."""
+    monkeypatch.setattr(pipeline, 'author_activity', AuthorActivityStore())
+    per_record = [pipeline.preprocess_record(record, now=NOW) for record in copy.deepcopy(records)]
+    monkeypatch.setattr(pipeline, 'author_activity', AuthorActivityStore())
+    return per_record, pipeline.preprocess_batch(copy.deepcopy(records), now=NOW)
+
+
+def test_batch_preprocessing_matches_per_record(pipeline, monkeypatch):
+    records = generate_submissions(500, seed=4)
+
+    per_record, batch = both_paths(pipeline, monkeypatch, records)
+
+    assert batch == per_record
+
+
+def test_mixed_int_and_float_scores_match(pipeline, monkeypatch):
+    records = generate_submissions(50, seed=5)
+    for record in records[::3]:
+        record['score'] = float(record['score'])
+    del records[1]['upvote_ratio']
+    records[2]['thumbnail'] = None
+
+    per_record, batch = both_paths(pipeline, monkeypatch, records)
+
+    assert batch == per_record
+    assert isinstance(batch[0]['score'], float) and isinstance(batch[1]['score'], int)
+
+
+def test_missing_scores_fail_like_per_record(pipeline, monkeypatch):
+    records = generate_submissions(10, seed=6)
+    records[4]['score'] = None
+
+    monkeypatch.setattr(pipeline, 'author_activity', AuthorActivityStore())
+    with pytest.raises(TypeError):
+        pipeline.preprocess_record(copy.deepcopy(records[4]), now=NOW)
+    with pytest.raises(TypeError):
+        pipeline.preprocess_batch(copy.deepcopy(records), now=NOW)
+
+
+def test_tz_aware_created_times_match(pipeline, monkeypatch):
+    records = generate_submissions(20, seed=7)
+    for record in records[::2]:
+        record['created_time'] = datetime.strptime(record['created_time'], '%Y-%m-%d %H:%M:%S') \
+            .replace(tzinfo=timezone.utc)
+
+    per_record, batch = both_paths(pipeline, monkeypatch, records)
+
+    assert batch == per_record
+    assert all(isinstance(record['created_time'], str) for record in batch)
+
+
+def test_an_empty_batch_is_returned_as_is(pipeline):
+    assert pipeline.preprocess_batch([], now=NOW) == []
+
+
+def test_only_the_latest_anomalies_are_kept_and_all_are_logged(pipeline, monkeypatch, caplog):
+    anomalies = deque(maxlen=2)
+    monkeypatch.setattr(pipeline, 'anomalies', anomalies)
+    monkeypatch.setattr(pipeline, 'anomaly_detector',
+                        StreamingAnomalyDetector(columns=['score'], min_count=10, sink=anomalies.append))
+    pipeline.detect_anomalies([{'id': f'p{i}', 'score': 10 + i % 3} for i in range(50)])
+
+    with caplog.at_level('WARNING'):
+        pipeline.detect_anomalies([{'id': f'spike{i}', 'score': 10_000 * (i + 1)} for i in range(4)])
+
+    assert [anomaly['id'] for anomaly in anomalies] == ['spike2', 'spike3']
+    assert sum('Anomaly detected' in message for message in caplog.messages) == 4
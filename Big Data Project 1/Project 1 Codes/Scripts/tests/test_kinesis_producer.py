@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from kinesis_producer import MAX_BATCH_BYTES, MAX_BATCH_RECORDS, MAX_RECORD_BYTES, BatchingKinesisProducer
+
+
+class FakeKinesis:
+    """
+    PutRecords stand-in. fail(data, attempt) decides whether an entry fails,
+    and errors are raised for whole calls before any entry is accepted.
+    """
+
+    def __init__(self, fail=None, errors=()):
+        self.fail = fail or (lambda data, attempt: False)
+        self.errors = list(errors)
+        self.calls = []
+        self.stored = []
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def put_records(self, StreamName, Records):
+        with self._lock:
+            self.calls.append([entry['Data'] for entry in Records])
+            if self.errors:
+                raise ClientError({'Error': {'Code': self.errors.pop(0)}}, 'PutRecords')
+            results = []
+            for entry in Records:
+                attempt = self.attempts[entry['Data']] = self.attempts.get(entry['Data'], 0) + 1
+                if self.fail(entry['Data'], attempt):
+                    results.append({'ErrorCode': 'ProvisionedThroughputExceededException',
+                                    'ErrorMessage': 'Rate exceeded'})
+                else:
+                    self.stored.append(entry['Data'])
+                    results.append({'SequenceNumber': str(len(self.stored)), 'ShardId': 'shardId-0'})
+            failed = sum('ErrorCode' in result for result in results)
+            return {'FailedRecordCount': failed, 'Records': results}
+
+
+def producer(kinesis, **options):
+    options = dict({'linger': 0.05, 'base_backoff': 0.001, 'max_backoff': 0.001}, **options)
+    return BatchingKinesisProducer('reddit-bde', kinesis_client=kinesis, **options)
+
+
+def test_records_are_sent_in_batches_of_at_most_500():
+    kinesis = FakeKinesis()
+    sender = producer(kinesis, linger=1.0)
+    for i in range(1200):
+        sender.put(f'record-{i}', partition_key=str(i))
+    sender.close()
+
+    assert [len(call) for call in kinesis.calls] == [500, 500, 200]
+    assert sender.stats()['records_sent'] == 1200
+    assert sender.stats()['batches'] == 3
+
+
+def test_only_failed_entries_are_retried():
+    # Every third record is throttled on its first attempt
+    kinesis = FakeKinesis(fail=lambda data, attempt: int(data.split(b'-')[1]) % 3 == 0 and attempt == 1)
+    sender = producer(kinesis, linger=0.5)
+    for i in range(30):
+        sender.put(f'record-{i}', partition_key=str(i))
+    sender.close()
+
+    assert len(kinesis.calls[0]) == 30
+    assert kinesis.calls[1] == [f'record-{i}'.encode() for i in range(0, 30, 3)]
+    assert sorted(kinesis.stored) == sorted(f'record-{i}'.encode() for i in range(30))
+    stats = sender.stats()
+    assert (stats['records_sent'], stats['records_failed'], stats['retries']) == (30, 0, 1)
+
+
+def test_entries_that_keep_failing_are_given_up_on():
+    kinesis = FakeKinesis(fail=lambda data, attempt: data == b'poison')
+    sender = producer(kinesis, max_retries=3)
+    sender.put('ok', partition_key='a')
+    sender.put('poison', partition_key='b')
+    sender.close()
+
+    assert kinesis.attempts[b'poison'] == 4
+    assert kinesis.stored == [b'ok']
+    assert sender.stats()['records_failed'] == 1
+
+
+def test_throttled_calls_retry_the_whole_batch():
+    kinesis = FakeKinesis(errors=['ProvisionedThroughputExceededException', 'ThrottlingException'])
+    sender = producer(kinesis)
+    for i in range(5):
+        sender.put(f'record-{i}', partition_key=str(i))
+    sender.close()
+
+    assert len(kinesis.calls) == 3
+    assert len(kinesis.stored) == 5
+    assert sender.stats()['retries'] == 2
+
+
+def test_other_errors_fail_the_batch_without_stopping_the_sender():
+    kinesis = FakeKinesis(errors=['ValidationException'])
+    sender = producer(kinesis)
+    sender.put('first', partition_key='a')
+    sender.flush()
+    sender.put('second', partition_key='b')
+    sender.close()
+
+    assert kinesis.stored == [b'second']
+    assert sender.stats()['records_failed'] == 1
+
+
+def test_batches_stay_under_5_mb_and_oversized_records_are_dropped():
+    kinesis = FakeKinesis()
+    sender = producer(kinesis, linger=1.0)
+    record = 'x' * (MAX_RECORD_BYTES // 2)
+    for i in range(12):
+        sender.put(record, partition_key=str(i))
+    sender.put('x' * MAX_RECORD_BYTES, partition_key='too-big')
+    sender.close()
+
+    assert all(sum(len(data) for data in call) <= MAX_BATCH_BYTES for call in kinesis.calls)
+    assert sum(len(call) for call in kinesis.calls) == 12
+    assert max(len(call) for call in kinesis.calls) < MAX_BATCH_RECORDS
+    assert sender.stats()['records_failed'] == 1
+
+
+def test_put_after_close_is_an_error():
+    sender = producer(FakeKinesis())
+    sender.close()
+
+    with pytest.raises(RuntimeError):
+        sender.put('late', partition_key='a')
@@ -0,0 +1,100 @@
+import json
+import pstats
+import threading
+
+from metrics import Histogram, MetricsRegistry, RuntimeProfiler
+
+
+def test_histogram_quantiles_stay_within_the_observed_range():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5):
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert 0.01 <= histogram.quantile(0.5) <= 0.1
+    assert histogram.quantile(1.0) == 0.5
+
+
+def test_prometheus_text_has_counters_and_cumulative_buckets():
+    registry = MetricsRegistry('test', buckets=(0.1, 1.0))
+    registry.inc('errors', type='dynamodb')
+    registry.inc('errors', 2, type='dynamodb')
+    registry.observe('stage_seconds', 0.05, stage='decode')
+    registry.observe('stage_seconds', 0.5, stage='decode')
+
+    lines = registry.to_prometheus().splitlines()
+
+    assert 'test_errors_total{type="dynamodb"} 3' in lines
+    assert 'test_stage_seconds_bucket{stage="decode",le="0.1"} 1' in lines
+    assert 'test_stage_seconds_bucket{stage="decode",le="+Inf"} 2' in lines
+    assert 'test_stage_seconds_count{stage="decode"} 2' in lines
+
+
+def test_constant_labels_tell_processes_apart(tmp_path):
+    registry = MetricsRegistry('test', labels={'pid': '42'})
+    registry.inc('records_processed', 5)
+    registry.observe('stage_seconds', 0.2, stage='decode')
+
+    text = registry.to_prometheus()
+    assert 'test_records_processed_total{pid="42"} 5' in text
+    assert 'test_stage_seconds_count{pid="42",stage="decode"} 1' in text
+
+    path = tmp_path / 'metrics.json'
+    registry.write(str(path))
+    assert json.loads(path.read_text())['labels'] == {'pid': '42'}
+
+
+def test_exporter_writes_a_final_copy(tmp_path):
+    path = str(tmp_path / 'metrics.prom')
+    registry = MetricsRegistry('test')
+    registry.start_exporter(path, interval=60)
+    registry.inc('records_processed')
+    registry.stop_exporter(path)
+
+    with open(path) as f:
+        assert 'test_records_processed_total 1' in f.read()
+
+
+def busy(n=20000):
+    return sum(i * i for i in range(n))
+
+
+def test_profiler_sections_in_concurrent_threads(tmp_path):
+    path = str(tmp_path / 'consumer.prof')
+    profiler = RuntimeProfiler(path)
+    profiler.start()
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def shard():
+        try:
+            barrier.wait()
+            for _ in range(20):
+                with profiler.section():
+                    busy()
+        except Exception as e:  # On 3.12+ a second active cProfile raised ValueError
+            errors.append(e)
+
+    threads = [threading.Thread(target=shard) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.stop()
+
+    assert errors == []
+    assert profiler.sections + profiler.skipped_sections == 80
+    assert any(function == 'busy' for _, _, function in pstats.Stats(path).stats)
+
+
+def test_profiler_is_a_no_op_while_stopped(tmp_path):
+    path = tmp_path / 'consumer.prof'
+    profiler = RuntimeProfiler(str(path))
+    with profiler.section():
+        busy()
+
+    profiler.toggle()
+    profiler.toggle()
+
+    assert profiler.sections == 0
+    assert not path.exists()
@@ -0,0 +1,138 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pyarrow')
+import pyarrow.dataset as ds
+
+from parquet_writer import ParquetDatasetWriter, processed_row
+
+
+def rows(count, start=0, subreddits=('python', 'datascience')):
+    created = datetime(2026, 10, 17, 12)
+    return [processed_row({'id': f'p{i}', 'title': f'post {i}', 'score': i,
+                           'subreddit': subreddits[i % len(subreddits)],
+                           'created_time': created + timedelta(seconds=i)})
+            for i in range(start, start + count)]
+
+
+def parquet_files(root):
+    return sorted(os.path.relpath(os.path.join(directory, name), root)
+                  for directory, _, names in os.walk(root) for name in names)
+
+
+def ids(root):
+    return sorted(ds.dataset(root, format='parquet', partitioning='hive').to_table(columns=['id'])['id'].to_pylist())
+
+
+def test_checkpoints_before_the_rollover_only_spool(tmp_path):
+    root, spool = str(tmp_path / 'processed'), str(tmp_path / 'parquet.spool')
+    writer = ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+
+    for batch in range(5):
+        writer.write(rows(10, start=batch * 10))
+        writer.checkpoint()
+
+    assert writer.files_written == 0
+    assert not os.path.exists(root)
+    assert os.path.exists(spool)
+
+    writer.close()
+
+    # One file per partition for all five checkpoints, and the spool is gone
+    assert len(parquet_files(root)) == 2
+    assert ids(root) == sorted(f'p{i}' for i in range(50))
+    assert not os.path.exists(spool)
+
+
+def test_a_full_or_old_buffer_rolls_over_at_the_checkpoint(tmp_path, monkeypatch):
+    root, spool = str(tmp_path / 'processed'), str(tmp_path / 'parquet.spool')
+    writer = ParquetDatasetWriter(root, max_buffered_rows=30, max_buffer_seconds=900, spool_path=spool)
+    clock = [1000.0]
+    monkeypatch.setattr('parquet_writer.time.monotonic', lambda: clock[0])
+
+    writer.write(rows(40))
+    # Past max_buffered_rows, but write() leaves the rollover to the checkpoint
+    assert writer.files_written == 0
+    writer.checkpoint()
+    assert writer.rows_written == 40
+
+    writer.write(rows(5, start=40))
+    writer.checkpoint()
+    assert writer.rows_written == 40
+    clock[0] += 900
+    writer.checkpoint()
+    assert writer.rows_written == 45
+    assert not os.path.exists(spool)
+
+
+def test_without_a_spool_every_checkpoint_flushes(tmp_path):
+    writer = ParquetDatasetWriter(str(tmp_path))
+
+    writer.write(rows(4))
+    writer.checkpoint()
+
+    assert writer.rows_written == 4
+
+
+def test_a_spool_left_by_a_crash_is_written_at_start(tmp_path):
+    root, spool = str(tmp_path / 'processed'), str(tmp_path / 'parquet.spool')
+    crashed = ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+    crashed.write(rows(10))
+    crashed.checkpoint()
+    # Rows after the last checkpoint are lost with the process, Kinesis redelivers them
+    crashed.write(rows(10, start=10))
+
+    restarted = ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+
+    assert ids(root) == sorted(f'p{i}' for i in range(10))
+    assert restarted.stats()['buffered'] == 0
+    assert not os.path.exists(spool)
+
+
+def test_writing_a_spool_again_replaces_its_files(tmp_path):
+    root, spool = str(tmp_path / 'processed'), str(tmp_path / 'parquet.spool')
+    writer = ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+    writer.write(rows(10))
+    writer.checkpoint()
+    with open(spool, 'rb') as f:
+        saved = f.read()
+    writer.flush()
+    written = parquet_files(root)
+
+    # The process died after writing the files but before removing the spool
+    with open(spool, 'wb') as f:
+        f.write(saved)
+    ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+
+    assert parquet_files(root) == written
+    assert ids(root) == sorted(f'p{i}' for i in range(10))
+
+
+def test_a_truncated_spool_keeps_its_complete_checkpoints(tmp_path):
+    root, spool = str(tmp_path / 'processed'), str(tmp_path / 'parquet.spool')
+    writer = ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+    writer.write(rows(10))
+    writer.checkpoint()
+    size = os.path.getsize(spool)
+    writer.write(rows(10, start=10))
+    writer.checkpoint()
+    with open(spool, 'r+b') as f:
+        f.truncate(size + 20)
+
+    ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=spool)
+
+    assert ids(root) == sorted(f'p{i}' for i in range(10))
+
+
+def test_switching_spools_writes_the_previous_shard_rows(tmp_path):
+    root = str(tmp_path / 'processed')
+    writer = ParquetDatasetWriter(root, max_buffer_seconds=900, spool_path=str(tmp_path / 'parquet.spool.a'))
+    writer.write(rows(10))
+    writer.checkpoint()
+
+    writer.use_spool(str(tmp_path / 'parquet.spool.b'))
+
+    assert writer.rows_written == 10
+    assert not os.path.exists(tmp_path / 'parquet.spool.a')
@@ -0,0 +1,41 @@
+import os
+import shutil
+import subprocess
+import sys
+import urllib.request
+
+import pytest
+
+pytest.importorskip('pyspark')
+
+from conftest import SCRIPTS
+
+
+@pytest.fixture
+def moto_endpoint():
+    """An empty moto server the job's Spark workers can reach."""
+    server_module = pytest.importorskip('moto.server')
+    server = server_module.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = f"http://{host}:{port}"
+    yield endpoint_url
+    urllib.request.urlopen(urllib.request.Request(f"{endpoint_url}/moto-api/reset", method='POST'))
+    server.stop()
+
+
+def test_the_job_loads_a_synthetic_table(moto_endpoint):
+    if not (os.environ.get('JAVA_HOME') or shutil.which('java')):
+        pytest.skip("Spark needs Java")
+    env = dict(os.environ, AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+               PYTHONPATH=os.pathsep.join(filter(None, [SCRIPTS, os.environ.get('PYTHONPATH')])))
+
+    # A separate interpreter, the job stops its SparkSession when it is done
+    result = subprocess.run([sys.executable, 'process_dynamo.py', '--table', 'posts', '--synthetic', '50',
+                             '--segments', '3', '--endpoint-url', moto_endpoint],
+                            cwd=SCRIPTS, env=env, capture_output=True, text=True, timeout=300)
+
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert 'Loaded 50 items' in result.stderr
+    # df.show() and the score > 1 filter both print a table
+    assert result.stdout.count('|subreddit|') == 2
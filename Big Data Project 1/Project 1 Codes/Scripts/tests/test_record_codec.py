@@ -0,0 +1,92 @@
+import pytest
+
+from record_codec import (JSON_HEADER, MSGPACK_HEADER, PACKED_HEADER, decode_record, encode_record,
+                          is_supported, schema_for)
+
+ENCODINGS = [encoding for encoding in ('json', 'msgpack', 'packed') if is_supported(encoding)]
+
+
+def extended(**overrides):
+    record = {
+        'id': 'abc123', 'author': 'alice', 'title': 'What is the best way to learn Python?',
+        'subreddit': 'learnpython', 'created_time': '2026-10-17 12:34:56', 'score': 42,
+        'num_comments': 7, 'is_self_post': True, 'flair_text': 'Help', 'upvote_ratio': 0.97,
+        'edited': False, 'over_18': False, 'thumbnail': 'self', 'stickied': False,
+    }
+    record.update(overrides)
+    return record
+
+
+def minimal(**overrides):
+    record = {'id': 'abc123', 'author': 'alice', 'title': 'Hello', 'subreddit': 'python',
+              'created_time': '2026-10-17 12:34:56', 'score': 1, 'num_comments': 0}
+    record.update(overrides)
+    return record
+
+
+CASES = {
+    'extended': extended(),
+    'minimal': minimal(),
+    'edited timestamp': extended(edited=1760704496.5),
+    'none values': extended(created_time=None, flair_text=None, edited=None, upvote_ratio=None),
+    'negative ints': extended(score=-12345, num_comments=-1),
+    'huge int': extended(score=2 ** 70),
+    'huge negative int': minimal(score=-2 ** 70),
+    'int over 64 bits': minimal(score=2 ** 64),
+    'non-BMP text': extended(title='Rocket launch \U0001F680 today \U0001F600', author='émile'),
+    'lone surrogate': extended(title='broken \ud83d title'),
+    'surrogate in str field': minimal(author='x\udcff'),
+    'long title': extended(title='the best way to ' * 50),
+    'unknown keys': dict(minimal(), extra='field'),
+}
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+@pytest.mark.parametrize('name', list(CASES))
+def test_round_trip(encoding, name):
+    record = CASES[name]
+    decoded = decode_record(encode_record(record, encoding))
+    assert decoded == record
+    assert [type(value) for value in decoded.values()] == [type(value) for value in record.values()]
+
+
+@pytest.mark.parametrize('encoding,header', [('msgpack', MSGPACK_HEADER), ('packed', PACKED_HEADER)])
+def test_schema_records_use_the_compact_encoding(encoding, header):
+    if not is_supported(encoding):
+        pytest.skip(f"{encoding} is not available")
+    data = encode_record(extended(), encoding)
+    assert data[0] == header
+    assert data[1] == schema_for(extended())
+    assert len(data) < len(encode_record(extended(), 'json'))
+
+
+@pytest.mark.parametrize('encoding,record', [
+    ('msgpack', extended(score=2 ** 70)),
+    ('msgpack', extended(title='broken \ud83d title')),
+    ('msgpack', dict(minimal(), extra='field')),
+    ('packed', extended(title='broken \ud83d title')),
+    ('packed', dict(minimal(), extra='field')),
+    ('packed', minimal(created_time='2026-10-17T12:34:56')),
+    ('packed', extended(edited=1760704496)),
+])
+def test_values_outside_the_layout_fall_back_to_json(encoding, record):
+    if not is_supported(encoding):
+        pytest.skip(f"{encoding} is not available")
+    assert encode_record(record, encoding)[0] == JSON_HEADER
+
+
+def test_decode_accepts_plain_json():
+    assert decode_record('{"id": "a"}') == {'id': 'a'}
+    assert decode_record(b'  {"id": "a"}') == {'id': 'a'}
+
+
+def test_decode_rejects_unknown_schema_and_empty_records():
+    with pytest.raises(ValueError):
+        decode_record(bytes((PACKED_HEADER, 99)))
+    with pytest.raises(ValueError):
+        decode_record(b'')
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        encode_record(minimal(), 'avro')
@@ -0,0 +1,83 @@
+import json
+from types import SimpleNamespace
+
+import pyarrow.dataset as ds
+import pytest
+
+import reddit_batch_processing
+from parquet_writer import BATCH_SCHEMA, ParquetDatasetWriter
+from reddit_batch_processing import export_hot_posts_parquet
+
+
+class FakeSubreddit:
+    """hot() of a PRAW subreddit over a fixed list of posts, honouring `after`."""
+
+    def __init__(self, count, fail_after=None):
+        self.posts = [SimpleNamespace(title=f'post {i}', score=i, url=f'https://x/{i}', num_comments=i % 7,
+                                      fullname=f't3_{i}') for i in range(count)]
+        self.fail_after = fail_after
+
+    def __str__(self):
+        return 'learnpython'
+
+    def hot(self, limit, params):
+        start = 0
+        if params.get('after'):
+            start = [post.fullname for post in self.posts].index(params['after']) + 1
+        for served, post in enumerate(self.posts[start:start + limit]):
+            if self.fail_after is not None and served >= self.fail_after:
+                raise ConnectionError("listing interrupted")
+            yield post
+
+
+def scores(root):
+    return sorted(ds.dataset(str(root), format='parquet', partitioning='hive').to_table()['score'].to_pylist())
+
+
+def test_parquet_export_resumes_after_the_last_written_file(tmp_path):
+    root, state_path = tmp_path / 'dataset', str(tmp_path / 'state.json')
+    subreddit = FakeSubreddit(250, fail_after=120)
+    with pytest.raises(ConnectionError):
+        export_hot_posts_parquet(subreddit, ParquetDatasetWriter(str(root), schema=BATCH_SCHEMA), 250,
+                                 state_path=state_path, rows_per_file=50)
+    with open(state_path) as f:
+        assert json.load(f)['rows'] == 100
+
+    subreddit.fail_after = None
+    rows = export_hot_posts_parquet(subreddit, ParquetDatasetWriter(str(root), schema=BATCH_SCHEMA), 250,
+                                    state_path=state_path, rows_per_file=50)
+
+    assert rows == 250
+    assert scores(root) == list(range(250))
+
+
+def test_parquet_export_ignores_a_csv_upload_state(tmp_path):
+    root, state_path = tmp_path / 'dataset', tmp_path / 'state.json'
+    state_path.write_text(json.dumps({'bucket': 'b', 'key': 'k.csv', 'part_size': 8, 'upload_id': 'u',
+                                      'parts': [], 'buffer': '', 'progress': None}))
+
+    rows = export_hot_posts_parquet(FakeSubreddit(30), ParquetDatasetWriter(str(root), schema=BATCH_SCHEMA), 30,
+                                    state_path=str(state_path))
+
+    assert rows == 30
+    assert scores(root) == list(range(30))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_each_format_has_its_own_default_state_file(monkeypatch, fmt):
+    used = {}
+    # main() exports the secret's AWS keys, restore them afterwards
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_DEFAULT_REGION'):
+        monkeypatch.setenv(name, 'testing')
+    monkeypatch.setattr(reddit_batch_processing, 'get_secret', lambda: {
+        'reddit_client_id': 'x', 'reddit_client_secret': 'x', 'reddit_user_agent': 'x',
+        'aws_access_key_id': 'x', 'aws_secret_access_key': 'x', 'aws_default_region': 'eu-north-1'})
+    monkeypatch.setattr(reddit_batch_processing.praw, 'Reddit', lambda **_: SimpleNamespace(subreddit=lambda name: FakeSubreddit(0)))
+    monkeypatch.setattr(reddit_batch_processing, 'export_csv', lambda subreddit, args: used.update(csv=args.state_file))
+    monkeypatch.setattr(reddit_batch_processing, 'export_hot_posts_parquet',
+                        lambda subreddit, writer, limit, state_path: used.update(parquet=state_path) or 0)
+    monkeypatch.setattr('parquet_writer.ParquetDatasetWriter', lambda *args, **kwargs: None)
+
+    reddit_batch_processing.main(['--format', fmt, '--kinesis-sample', '0'])
+
+    assert used == {fmt: f'reddit_batch_export.{fmt}.state.json'}
@@ -0,0 +1,136 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import reddit_lambda
+from test_athena_runner import FakeAthena
+
+HEADER = '"created_time","id"\n'
+
+
+@pytest.fixture
+def s3(aws_credentials):
+    with mock_aws():
+        client = boto3.client('s3', region_name='eu-north-1')
+        client.create_bucket(Bucket=reddit_lambda.bucket_name,
+                             CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        yield client
+
+
+def rows(s3, key):
+    body = s3.get_object(Bucket=reddit_lambda.bucket_name, Key=key)['Body'].read().decode('utf-8')
+    return [(row['created_time'], row['id']) for row in csv.DictReader(io.StringIO(body))]
+
+
+def test_query_never_lists_ids():
+    query = reddit_lambda.build_query(datetime(2026, 10, 17, 6), datetime(2026, 10, 17, 12))
+
+    assert 'NOT IN' not in query
+    assert "created_time > '2026-10-17 06:00:00'" in query
+
+
+def test_overlap_rows_already_exported_are_dropped(s3, tmp_path):
+    athena = FakeAthena(s3=s3)
+    store = reddit_lambda.LocalStateStore(str(tmp_path / 'state.json'))
+    store.set({'high_water_mark': '2026-10-17 10:00:00'})
+
+    athena.csv = (HEADER + '"2026-10-17 10:30:00","a"\n"2026-10-17 10:40:00","b"\n').encode('utf-8')
+    first = reddit_lambda.run_incremental_export(reddit_lambda.get_runner(athena), s3, store,
+                                                 now=datetime(2026, 10, 17, 11, 10))
+    assert rows(s3, first['body']['key']) == [('2026-10-17 10:30:00', 'a'), ('2026-10-17 10:40:00', 'b')]
+
+    # The overlap finds a and b again, and c that reached the table late
+    athena.csv = (HEADER + '"2026-10-17 10:30:00","a"\n"2026-10-17 10:35:00","c"\n'
+                  '"2026-10-17 10:40:00","b"\n"2026-10-17 11:30:00","d"\n').encode('utf-8')
+    second = reddit_lambda.run_incremental_export(reddit_lambda.get_runner(athena), s3, store,
+                                                  now=datetime(2026, 10, 17, 12, 10))
+
+    assert rows(s3, second['body']['key']) == [('2026-10-17 10:35:00', 'c'), ('2026-10-17 11:30:00', 'd')]
+    assert 'NOT IN' not in athena.started[1][0]
+    assert 'exported_ids' not in store.get()
+
+
+def test_a_retried_window_does_not_dedup_against_its_own_part(s3, tmp_path):
+    athena = FakeAthena(s3=s3, csv=(HEADER + '"2026-10-17 10:30:00","a"\n').encode('utf-8'))
+    store = reddit_lambda.LocalStateStore(str(tmp_path / 'state.json'))
+    store.set({'high_water_mark': '2026-10-17 10:00:00'})
+    now = datetime(2026, 10, 17, 11, 10)
+    key = reddit_lambda.partition_prefix('2026-10-17') + 'part-20261017T100000-20261017T110000.csv'
+    # Written by an attempt that failed before the mark was saved
+    s3.put_object(Bucket=reddit_lambda.bucket_name, Key=key, Body=athena.csv)
+
+    response = reddit_lambda.run_incremental_export(reddit_lambda.get_runner(athena), s3, store, now=now)
+
+    assert response['body']['key'] == key
+    assert rows(s3, key) == [('2026-10-17 10:30:00', 'a')]
+
+
+def test_days_in_the_next_overlap_keep_their_parts(s3, tmp_path):
+    store = reddit_lambda.LocalStateStore(str(tmp_path / 'state.json'))
+    store.set({'high_water_mark': '2026-10-17 02:00:00'})
+    for day in ('2026-10-15', '2026-10-16'):
+        for part in ('part-1.csv', 'part-2.csv'):
+            s3.put_object(Bucket=reddit_lambda.bucket_name, Key=reddit_lambda.partition_prefix(day) + part,
+                          Body=HEADER.encode('utf-8'))
+
+    response = reddit_lambda.run_incremental_export(reddit_lambda.get_runner(FakeAthena(s3=s3)), s3, store,
+                                                    now=datetime(2026, 10, 17, 2, 5), compact=True)
+
+    # The overlap before 02:00 reaches back into the 16th, so only the 15th is compacted
+    assert response['body']['compacted_files'] == 2
+    listed = s3.list_objects_v2(Bucket=reddit_lambda.bucket_name, Prefix='exports/dt=2026-10-16/')
+    assert len(listed['Contents']) == 2
+
+
+def test_a_retry_reuses_the_failed_run_window_and_query(s3, tmp_path, monkeypatch):
+    csv_body = (HEADER + '"2026-10-17 11:30:00","a"\n').encode('utf-8')
+    athena = FakeAthena(s3=s3, csv=csv_body)
+    store = reddit_lambda.LocalStateStore(str(tmp_path / 'state.json'))
+    store.set({'high_water_mark': '2026-10-17 11:00:00'})
+    now = datetime(2026, 10, 17, 12, 0)
+
+    copy_object = s3.copy_object
+    calls = []
+
+    def failing_copy(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise ConnectionError("copy interrupted")
+        return copy_object(**kwargs)
+
+    monkeypatch.setattr(s3, 'copy_object', failing_copy)
+    with pytest.raises(ConnectionError):
+        reddit_lambda.run_incremental_export(reddit_lambda.get_runner(athena), s3, store, now=now)
+    assert store.get()['high_water_mark'] == '2026-10-17 11:00:00'
+
+    # Retried a little later, when a fresh window would end later too
+    response = reddit_lambda.run_incremental_export(reddit_lambda.get_runner(athena), s3, store,
+                                                    now=now + timedelta(seconds=45))
+
+    body = response['body']
+    assert len(athena.started) == 1
+    assert body['reused_result'] is True
+    assert body['high_water_mark'] == '2026-10-17 11:50:00'
+    assert rows(s3, body['key']) == [('2026-10-17 11:30:00', 'a')]
+    # Once the mark moved on, the temp result, the cache entry and the window are gone
+    assert s3.list_objects_v2(Bucket=reddit_lambda.bucket_name, Prefix='temp/').get('KeyCount', 0) == 0
+    state = store.get()
+    assert state['query_cache'] == {}
+    assert 'pending_window' not in state
+
+
+def test_a_new_mark_picks_a_new_window(s3, tmp_path):
+    athena = FakeAthena(s3=s3, csv=HEADER.encode('utf-8'))
+    store = reddit_lambda.LocalStateStore(str(tmp_path / 'state.json'))
+    store.set({'high_water_mark': '2026-10-17 11:00:00',
+               'pending_window': {'high_water_mark': '2026-10-17 10:00:00',
+                                  'start': '2026-10-17 10:00:00', 'end': '2026-10-17 11:00:00'}})
+
+    response = reddit_lambda.run_incremental_export(reddit_lambda.get_runner(athena), s3, store,
+                                                    now=datetime(2026, 10, 17, 12, 0))
+
+    assert response['body']['high_water_mark'] == '2026-10-17 11:50:00'
@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+import reddit_producer
+from record_codec import decode_record
+from record_schema import validate_payload
+from reddit_producer import PAYLOAD_SCHEMAS, RedditProducer, register_schema
+
+
+def submission(i=0, **fields):
+    values = dict(id=f'post{i}', author=f'user_{i}', title=f'Title {i}', subreddit='python',
+                  created_utc=1729166400 + i, score=10 + i, num_comments=i, is_self=True,
+                  link_flair_text=None, upvote_ratio=0.9, edited=False, over_18=False,
+                  thumbnail='self', stickied=False)
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+class FakeReddit:
+    def __init__(self, submissions):
+        self.items = submissions
+        self.names = []
+
+    def subreddit(self, name):
+        self.names.append(name)
+        return SimpleNamespace(stream=SimpleNamespace(submissions=lambda: iter(self.items)))
+
+
+class FakeKinesis:
+    def __init__(self):
+        self.put = []
+        self.batches = []
+
+    def put_record(self, StreamName, Data, PartitionKey):
+        self.put.append((Data, PartitionKey))
+        return {'SequenceNumber': str(len(self.put)), 'ShardId': 'shardId-0'}
+
+    def put_records(self, StreamName, Records):
+        self.batches.append(Records)
+        return {'FailedRecordCount': 0, 'Records': [{'SequenceNumber': '1'} for _ in Records]}
+
+
+def test_builtin_schemas_are_registered():
+    assert {'minimal', 'extended'} <= set(PAYLOAD_SCHEMAS)
+    assert set(PAYLOAD_SCHEMAS['minimal'](submission())) == \
+        {'id', 'author', 'title', 'subreddit', 'created_time', 'score', 'num_comments'}
+
+
+def test_extended_payloads_pass_the_consumer_schema():
+    payload = PAYLOAD_SCHEMAS['extended'](submission(3))
+
+    row, errors = validate_payload(payload)
+
+    assert errors == []
+    assert row['created_time'] == '2024-10-17 12:00:03'
+    assert row['is_self_post'] is True
+
+
+def test_a_registered_schema_can_be_selected(monkeypatch):
+    monkeypatch.setattr(reddit_producer, 'PAYLOAD_SCHEMAS', dict(PAYLOAD_SCHEMAS))
+
+    @register_schema('ids')
+    def ids_payload(post):
+        return {'id': post.id}
+
+    kinesis = FakeKinesis()
+    producer = RedditProducer('python', 'reddit-bde', schema='ids', mode='single', kinesis_client=kinesis)
+    producer.send(submission(1))
+
+    assert reddit_producer.PAYLOAD_SCHEMAS['ids'] is ids_payload
+    assert decode_record(kinesis.put[0][0]) == {'id': 'post1'}
+    assert kinesis.put[0][1] == 'post1'
+
+
+@pytest.mark.parametrize('options', [{'schema': 'unknown'}, {'mode': 'async'}, {'encoding': 'xml'}])
+def test_unknown_settings_are_rejected(options):
+    with pytest.raises(ValueError):
+        RedditProducer('python', 'reddit-bde', **options)
+
+
+def test_run_streams_every_subreddit_through_the_batching_producer():
+    reddit = FakeReddit([submission(i) for i in range(5)])
+    kinesis = FakeKinesis()
+    producer = RedditProducer(['python', 'datascience'], 'reddit-bde', encoding='packed', reddit=reddit,
+                              kinesis_client=kinesis, linger=0.01)
+
+    assert producer.run() == 5
+
+    assert reddit.names == ['python+datascience']
+    records = [record for batch in kinesis.batches for record in batch]
+    assert [record['PartitionKey'] for record in records] == [f'post{i}' for i in range(5)]
+    assert decode_record(records[0]['Data']) == PAYLOAD_SCHEMAS['extended'](submission(0))
+    assert producer._producer is None
+
+
+def test_submissions_without_a_timestamp_have_no_created_time():
+    payload = PAYLOAD_SCHEMAS['minimal'](submission(created_utc=None))
+
+    assert payload['created_time'] is None
+    assert validate_payload(payload)[1] != []
@@ -0,0 +1,111 @@
+import pytest
+
+import rollups
+from rollups import WindowedRollups
+
+
+def record(created_time, subreddit='python', title='t', popularity=1.0):
+    return {'created_time': created_time, 'subreddit': subreddit, 'time_of_day': 'Afternoon',
+            'num_comments': 2, 'score': 3, 'sentiment': 0.5, 'popularity_score': popularity,
+            'author': 'alice', 'title': title}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rollups.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_lagging_shard_holds_the_watermark(clock):
+    windows = WindowedRollups(idle_timeout=300)
+    windows.add_batch([record('2026-10-17 12:00:00')], source='shard-2')
+    clock[0] += 200
+    windows.add_batch([record('2026-10-17 12:05:00')], source='shard-2')
+    clock[0] += 200
+    rows = windows.add_batch([record('2026-10-17 12:30:00')], source='shard-1')
+    windows.add_batch([record('2026-10-17 12:10:00'), record('2026-10-17 12:12:00')], source='shard-2')
+
+    assert windows.late_records == 0
+    # Only windows ending before shard-2's watermark, 11:55, could have been emitted
+    assert rows == []
+
+
+def test_shards_that_have_not_sent_yet_are_waited_for_on_start(clock):
+    windows = WindowedRollups(idle_timeout=300)
+    windows.add_batch([record('2026-10-17 12:30:00')], source='shard-1')
+    windows.add_batch([record('2026-10-17 12:10:00'), record('2026-10-17 12:12:00')], source='shard-2')
+
+    assert windows.late_records == 0
+
+
+def test_idle_shard_stops_holding_the_watermark(clock):
+    windows = WindowedRollups(idle_timeout=300)
+    windows.add_batch([record('2026-10-17 12:00:00')], source='shard-2')
+    clock[0] += 400
+    rows = windows.add_batch([record('2026-10-17 12:30:00')], source='shard-1')
+    # shard-2 was silent for longer than idle_timeout, so windows up to 12:20 are emitted
+    assert {row['window_start'] for row in rows if row['window'] == '5m'} == {'2026-10-17 12:00:00'}
+
+    windows.add_batch([record('2026-10-17 12:10:00')], source='shard-2')
+    assert windows.late_records == 1
+
+
+def test_every_record_is_emitted_once_per_window(clock):
+    windows = WindowedRollups(idle_timeout=None)
+    rows = windows.add_batch([record('2026-10-17 12:01:00', title='a', popularity=2.0),
+                              record('2026-10-17 12:02:00', title='b', popularity=5.0),
+                              record('2026-10-17 12:07:00', subreddit='rust')])
+    rows += windows.close()
+
+    five_minute = {row['rollup_id']: row for row in rows if row['window'] == '5m'}
+    assert sum(row['post_count'] for row in five_minute.values()) == 3
+    first = five_minute['5m#python#Afternoon#2026-10-17 12:00:00']
+    assert first['post_count'] == 2
+    assert first['top_titles'] == [['b', 5.0], ['a', 2.0]]
+    assert len(five_minute) == len(rows) - sum(row['window'] == '1h' for row in rows)
+
+
+def test_snapshot_keeps_open_panes_and_watermarks(tmp_path, clock):
+    path = str(tmp_path / 'rollups.snapshot')
+    windows = WindowedRollups(idle_timeout=None, snapshot_path=path)
+    windows.add_batch([record('2026-10-17 12:01:00')], source='shard-1')
+    windows.commit('shard-1')
+    windows.save_snapshot()
+
+    restored = WindowedRollups(idle_timeout=None, snapshot_path=path)
+    restored.add_batch([record('2026-10-17 11:00:00')], source='shard-1')
+    rows = restored.close()
+
+    assert restored.late_records == 1
+    assert sum(row['post_count'] for row in rows if row['window'] == '5m') == 1
+
+
+def test_snapshot_leaves_out_shards_that_have_not_checkpointed(tmp_path, clock):
+    path = str(tmp_path / 'rollups.snapshot')
+    windows = WindowedRollups(idle_timeout=None, snapshot_path=path)
+    windows.add_batch([record('2026-10-17 12:01:00')], source='shard-1')
+    windows.commit('shard-1')
+    # shard-2 is ahead, but crashes before its checkpoint
+    windows.add_batch([record('2026-10-17 12:40:00'), record('2026-10-17 12:02:00')], source='shard-2')
+    windows.save_snapshot()
+
+    restored = WindowedRollups(idle_timeout=None, snapshot_path=path)
+    # Redelivered from shard-2's last checkpoint
+    restored.add_batch([record('2026-10-17 12:40:00'), record('2026-10-17 12:02:00')], source='shard-2')
+    rows = restored.close()
+
+    assert restored.late_records == 0
+    assert sum(row['post_count'] for row in rows if row['window'] == '5m') == 3
+
+
+def test_uncommitted_records_are_in_the_emitted_windows(clock):
+    windows = WindowedRollups(idle_timeout=None)
+    windows.add_batch([record('2026-10-17 12:01:00')], source='shard-1')
+    windows.commit('shard-1')
+    windows.add_batch([record('2026-10-17 12:02:00')], source='shard-2')
+    rows = windows.add_batch([record('2026-10-17 12:30:00')], source='shard-1')
+    rows += windows.add_batch([record('2026-10-17 12:31:00')], source='shard-2')
+
+    first = [row for row in rows if row['rollup_id'] == '5m#python#Afternoon#2026-10-17 12:00:00']
+    assert [row['post_count'] for row in first] == [2]
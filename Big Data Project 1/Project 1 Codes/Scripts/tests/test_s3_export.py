@@ -0,0 +1,127 @@
+import json
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from reddit_batch_processing import export_hot_posts
+from s3_export import MIN_PART_SIZE, MultipartUploadWriter
+
+BUCKET = 'exports'
+
+
+@pytest.fixture
+def s3(aws_credentials):
+    with mock_aws():
+        client = boto3.client('s3', region_name='eu-north-1')
+        client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        yield client
+
+
+def open_uploads(s3):
+    return s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+
+
+def body(s3, key):
+    return s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+
+class FakeSubreddit:
+    """hot() of a PRAW subreddit over a fixed list of posts, honouring `after`."""
+
+    def __init__(self, count, fail_after=None):
+        self.posts = [SimpleNamespace(title=f'post {i}', score=i, url=f'https://x/{i}', num_comments=i % 7,
+                                      fullname=f't3_{i}') for i in range(count)]
+        self.fail_after = fail_after
+
+    def hot(self, limit, params):
+        start = 0
+        if params.get('after'):
+            start = [post.fullname for post in self.posts].index(params['after']) + 1
+        for served, post in enumerate(self.posts[start:start + limit]):
+            if self.fail_after is not None and served >= self.fail_after:
+                raise ConnectionError("listing interrupted")
+            yield post
+
+
+def test_parts_are_fixed_size_and_reassemble(s3):
+    data = bytes(range(256)) * (MIN_PART_SIZE // 256 * 2 + 100)
+    with MultipartUploadWriter(BUCKET, 'big.bin', s3_client=s3, part_size=MIN_PART_SIZE) as upload:
+        for start in range(0, len(data), 1_000_003):
+            upload.write(data[start:start + 1_000_003])
+
+    assert len(upload.parts) == 3
+    assert body(s3, 'big.bin') == data
+    assert open_uploads(s3) == []
+
+
+def test_state_is_saved_when_the_upload_starts(s3, tmp_path):
+    state_path = str(tmp_path / 'upload.json')
+    upload = MultipartUploadWriter(BUCKET, 'small.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                   state_path=state_path)
+    upload.write(b'a,b\n')
+
+    # A crash now must not orphan the upload: the state names it
+    with open(state_path) as f:
+        assert json.load(f)['upload_id'] == upload.upload_id
+    resumed = MultipartUploadWriter(BUCKET, 'small.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                    state_path=state_path)
+    assert resumed.upload_id == upload.upload_id
+    assert resumed.progress is None
+    resumed.abort()
+    assert open_uploads(s3) == []
+
+
+def test_small_export_resumes_in_the_same_upload(s3, tmp_path):
+    state_path = str(tmp_path / 'upload.json')
+    upload = MultipartUploadWriter(BUCKET, 'hot.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                   state_path=state_path)
+    with pytest.raises(ConnectionError):
+        export_hot_posts(FakeSubreddit(50, fail_after=20), upload, limit=1000)
+
+    upload = MultipartUploadWriter(BUCKET, 'hot.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                   state_path=state_path)
+    assert export_hot_posts(FakeSubreddit(50), upload, limit=1000) == 50
+
+    lines = body(s3, 'hot.csv').decode('utf-8').splitlines()
+    assert lines[0] == 'title,score,url,comments'
+    assert lines[1:] == [f'post {i},{i},https://x/{i},{i % 7}' for i in range(50)]
+    assert open_uploads(s3) == []
+
+
+def test_large_export_resumes_after_the_last_uploaded_part(s3, tmp_path):
+    state_path = str(tmp_path / 'upload.json')
+    subreddit = FakeSubreddit(3000)
+    for post in subreddit.posts:
+        post.title = post.title + ' ' + 'x' * 4000
+    subreddit.fail_after = 2000
+
+    upload = MultipartUploadWriter(BUCKET, 'hot.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                   state_path=state_path)
+    with pytest.raises(ConnectionError):
+        export_hot_posts(subreddit, upload, limit=3000)
+    assert len(upload.parts) == 1
+
+    subreddit.fail_after = None
+    upload = MultipartUploadWriter(BUCKET, 'hot.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                   state_path=state_path)
+    assert upload.resumed
+    assert export_hot_posts(subreddit, upload, limit=3000) == 3000
+
+    lines = body(s3, 'hot.csv').decode('utf-8').splitlines()
+    assert len(lines) == 3001
+    assert [line.split(',')[1] for line in lines[1:]] == [str(i) for i in range(3000)]
+
+
+def test_resume_starts_over_when_the_upload_is_gone(s3, tmp_path):
+    state_path = str(tmp_path / 'upload.json')
+    upload = MultipartUploadWriter(BUCKET, 'gone.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                   state_path=state_path)
+    s3.abort_multipart_upload(Bucket=BUCKET, Key='gone.csv', UploadId=upload.upload_id)
+
+    again = MultipartUploadWriter(BUCKET, 'gone.csv', s3_client=s3, part_size=MIN_PART_SIZE,
+                                  state_path=state_path)
+    assert again.upload_id != upload.upload_id
+    assert not again.resumed
+    again.abort()
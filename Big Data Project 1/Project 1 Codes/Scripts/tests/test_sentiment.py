@@ -0,0 +1,66 @@
+import pytest
+
+from benchmarks import generate_submissions
+from sentiment import LEXICON_TOLERANCE, LexiconSentiment, SentimentScorer, TextBlobSentiment
+from text_normalization import normalize_title
+
+# TextBlob 0.20 polarity of normalized titles, covering modifiers, negations and unknown words
+RECORDED_TEXTBLOB = {
+    'this is a really good idea': 0.7,
+    'not bad at all': 0.3499999999999999,
+    'not very good': -0.26923076923076916,
+    'the worst update ever': -1.0,
+    'i am not a happy user': -0.4,
+    'really not good': -0.35,
+    'python 3 13 released': 0.0,
+    'very very excited about the new release': 0.3119318181818182,
+    'the movie was incredibly boring': -1.0,
+    'i love this community': 0.5,
+    'extremely disappointing results': -0.6,
+    'not the best but not the worst either': 0.0,
+    'so sad :(': -0.625,
+}
+
+
+@pytest.fixture(scope='module')
+def lexicon():
+    return LexiconSentiment()
+
+
+@pytest.mark.parametrize('title, expected', sorted(RECORDED_TEXTBLOB.items()))
+def test_lexicon_matches_recorded_textblob_scores(lexicon, title, expected):
+    assert lexicon.polarity(title) == pytest.approx(expected, abs=LEXICON_TOLERANCE)
+
+
+def test_lexicon_matches_textblob_on_generated_titles(lexicon):
+    textblob = TextBlobSentiment()
+    titles = {normalize_title(submission['title']) for submission in generate_submissions(300, seed=2)}
+
+    differences = [abs(lexicon.polarity(title) - textblob.polarity(title)) for title in titles]
+
+    assert max(differences) <= LEXICON_TOLERANCE
+
+
+def test_repeated_titles_are_served_from_the_cache():
+    scorer = SentimentScorer('lexicon')
+
+    first = scorer.polarity('This is a really good idea')
+    # Case and whitespace do not change the cache key
+    assert scorer.polarity('  this is a REALLY good   idea ') == first
+    assert scorer.polarities(['not bad at all', 'this is a really good idea', 'not bad at all']) == \
+        [pytest.approx(0.35), first, pytest.approx(0.35)]
+
+    assert scorer.cache_info() == {'hits': 3, 'misses': 2, 'size': 2, 'max_size': 100000}
+
+
+def test_the_least_recently_used_title_is_evicted():
+    scorer = SentimentScorer('lexicon', cache_size=2)
+    scorer.polarities(['good', 'bad'])
+    scorer.polarity('good')
+    scorer.polarity('great')
+
+    scorer.polarity('good')
+    scorer.polarity('bad')
+
+    assert scorer.cache_info()['hits'] == 2
+    assert scorer.cache_info()['misses'] == 4
@@ -0,0 +1,42 @@
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip('pyspark')
+
+from temporal_features import add_temporal_features, aggregates_by_grain, temporal_aggregates
+
+POSTS = [
+    ('python', '2023-12-31 23:59:59'),
+    ('python', '2024-01-01 00:10:00'),
+    ('rust', '2024-01-01 00:45:00'),
+    ('python', '2024-01-02 13:00:00'),
+]
+
+
+def test_features_from_a_string_or_timestamp_column_agree(spark):
+    strings = spark.createDataFrame(POSTS, 'Subreddit string, creation_date string')
+    timestamps = strings.withColumn('creation_date', strings['creation_date'].cast('timestamp'))
+
+    from_strings = add_temporal_features(strings, persist=False).drop('creation_date').collect()
+    from_timestamps = add_temporal_features(timestamps).drop('creation_date').collect()
+
+    assert from_strings == from_timestamps
+    first = from_strings[0]
+    assert first['creation_timestamp'] == datetime(2023, 12, 31, 23, 59, 59)
+    assert (first['post_date'], first['post_time']) == (date(2023, 12, 31), '23:59:59')
+    assert (first['post_year'], first['post_month'], first['post_day'], first['post_hour']) == (2023, 12, 31, 23)
+
+
+def test_every_grain_is_counted_in_one_query(spark):
+    features = add_temporal_features(spark.createDataFrame(POSTS, 'Subreddit string, creation_date string'))
+
+    grains = aggregates_by_grain(temporal_aggregates(features))
+
+    assert grains['year'].values.tolist() == [[2023, 1], [2024, 3]]
+    assert grains['month'].values.tolist() == [[1, 3], [12, 1]]
+    assert grains['day'].values.tolist() == [[date(2023, 12, 31), 1], [date(2024, 1, 1), 2], [date(2024, 1, 2), 1]]
+    assert grains['hour'].values.tolist() == [[0, 2], [13, 1], [23, 1]]
+    assert grains['subreddit_hour'].values.tolist() == [['python', 0, 1], ['python', 13, 1], ['python', 23, 1],
+                                                        ['rust', 0, 1]]
+    features.unpersist()
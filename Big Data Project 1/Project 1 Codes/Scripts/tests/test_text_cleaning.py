@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('pyspark')
+
+from text_cleaning import clean_posts
+
+
+def cleaned(spark, bodies, **options):
+    df = spark.createDataFrame([(i, body) for i, body in enumerate(bodies)], 'id int, body string')
+    rows = clean_posts(df, **options).orderBy('id').collect()
+    return [row[options.get('output_col', 'cleaned_body')] for row in rows]
+
+
+def test_noise_is_normalized_and_stopwords_removed(spark):
+    bodies = [
+        "Check https://i.redd.it/abc123.jpg and www.example.com/page NOW",
+        "Café \\u2019 prices \U0001F602 went up 2024 (OC) &amp; more",
+        "someone@mail.com",
+        "#help @mods   the  queue   is   stuck...",
+    ]
+
+    assert cleaned(spark, bodies) == [
+        'check website website now',
+        'caf prices went oc amp',
+        'emailaddress',
+        '#help @mods queue stuck',
+    ]
+
+
+def test_contractions_match_the_stopword_list(spark):
+    assert cleaned(spark, ["I don't think it's BROKEN, can't you see?", "rock'n'roll isn't 'quoted'"]) == \
+        ['think broken see', 'rock n roll quoted']
+
+
+def test_null_and_empty_bodies(spark):
+    assert cleaned(spark, [None, '', 'the and of', '!!!']) == [None, '', '', '']
+
+
+def test_columns_and_stopwords_can_be_chosen(spark):
+    df = spark.createDataFrame([('Spark jobs are FAST',)], 'text string')
+
+    result = clean_posts(df, input_col='text', output_col='clean', stop_words={'jobs'})
+
+    assert result.columns == ['text', 'clean']
+    assert result.first()['clean'] == 'spark are fast'
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip('pyspark')
+
+from word_frequency import top_words, word_counts
+
+
+def posts(spark):
+    rows = [
+        ('python', 'spark pandas spark'),
+        ('python', 'pandas spark  numpy'),
+        ('python', ''),
+        ('rust', 'cargo borrow cargo'),
+        ('rust', 'borrow'),
+        ('rust', 'async'),
+    ]
+    return spark.createDataFrame(rows, 'subreddit string, cleaned_body string')
+
+
+def test_words_are_counted_per_subreddit(spark):
+    counts = {(row['subreddit'], row['word']): row['count'] for row in word_counts(posts(spark)).collect()}
+
+    assert counts == {
+        ('python', 'spark'): 3, ('python', 'pandas'): 2, ('python', 'numpy'): 1,
+        ('rust', 'cargo'): 2, ('rust', 'borrow'): 2, ('rust', 'async'): 1,
+    }
+
+
+def test_top_words_are_ranked_with_ties_broken_alphabetically(spark):
+    rows = top_words(posts(spark), n=2).orderBy('subreddit', 'rank').collect()
+
+    assert [(row['subreddit'], row['word'], row['count'], row['rank']) for row in rows] == [
+        ('python', 'spark', 3, 1), ('python', 'pandas', 2, 2),
+        ('rust', 'borrow', 2, 1), ('rust', 'cargo', 2, 2),
+    ]
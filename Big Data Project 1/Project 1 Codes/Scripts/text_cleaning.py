@@ -0,0 +1,48 @@
+from pyspark.ml.feature import StopWordsRemover
+from pyspark.sql import functions as F
+
+from stopwords import STOP_WORDS
+from text_normalization import EMAIL_PATTERN, TOKEN_SEPARATOR, UNICODE_PATTERN, URL_PATTERN
+
+
+def normalize_post(column):
+    """
+    Lowercase a text column and replace emails, URLs, unicode escapes and
+    non-ASCII characters the way the notebook's clean_post did, as one chain
+    of native expressions.
+    """
+    column = F.regexp_replace(column, EMAIL_PATTERN, 'emailaddress')  # Replace email addresses
+    column = F.regexp_replace(column, UNICODE_PATTERN, '')           # Remove unicode strings and non-ASCII
+    column = F.regexp_replace(column, URL_PATTERN, 'website')        # Replace URLs with 'website'
+    return F.lower(column)
+
+
+def tokenize_post(column):
+    """Split a text column into lowercase word tokens, an empty array for empty or null text."""
+    text = F.trim(F.regexp_replace(normalize_post(F.coalesce(column, F.lit(''))), TOKEN_SEPARATOR, ' '))
+    return F.array_remove(F.split(text, ' '), '')
+
+
+def clean_posts(df, input_col='body', output_col='cleaned_body', stop_words=STOP_WORDS):
+    """
+    Add output_col with the cleaned text of input_col: normalized, tokenized,
+    without stopwords and joined back with single spaces.
+
+    Apostrophes stay inside tokens until stopwords are removed, so
+    contractions such as "don't" match the list. The apostrophes left after
+    that split their token, as the notebook's chain did: "rock'n'roll"
+    becomes "rock n roll".
+
+    Unlike a Python UDF this never leaves the JVM, so rows are not serialized
+    to Python workers. Null input gives a null output.
+    """
+    tokens_col = f"_{output_col}_tokens"
+    filtered_col = f"_{output_col}_filtered"
+    remover = StopWordsRemover(inputCol=tokens_col, outputCol=filtered_col,
+                               stopWords=sorted(stop_words), caseSensitive=True)
+
+    df = remover.transform(df.withColumn(tokens_col, tokenize_post(F.col(input_col))))
+    # A run of apostrophes and spaces becomes one space, so no empty tokens appear
+    cleaned = F.trim(F.regexp_replace(F.array_join(F.col(filtered_col), ' '), "[' ]+", ' '))
+    return (df.withColumn(output_col, F.when(F.col(input_col).isNotNull(), cleaned))
+              .drop(tokens_col, filtered_col))
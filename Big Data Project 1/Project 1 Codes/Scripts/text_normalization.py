@@ -0,0 +1,55 @@
+import re
+import sys
+
+from stopwords import STOP_WORDS
+
+# Punctuation as the consumer has always stripped it: anything that is neither a
+# word character nor whitespace, with Unicode semantics
+PUNCTUATION = re.compile(r'[^\w\s]')
+
+# The same characters below 128, deleted with bytes.translate for ASCII titles,
+# the bulk of the stream. That is about three times faster than the regex.
+ASCII_PUNCTUATION = bytes(code for code in range(128) if PUNCTUATION.match(chr(code)))
+
+# Java regexes for the Spark cleaning in text_cleaning.py, kept here so every
+# job that cleans post text uses the same definitions
+EMAIL_PATTERN = r'^.+@[^\.].*\.[a-z]{2,}$'
+UNICODE_PATTERN = r'\\u[0-9A-Fa-f]+|[^\x00-\x7f]'
+URL_PATTERN = r'(www\.[^\s]+)|(https?://[^\s]+)'
+# Everything between tokens: anything but letters, '#', '@' and apostrophes
+# inside words. Apostrophes are kept until stopwords are removed so that
+# contractions like "don't" match STOP_WORDS.
+TOKEN_SEPARATOR = r"(?:[^a-z#@']|(?<![a-z])'|'(?![a-z]))+"
+
+
+def strip_punctuation(text):
+    """Remove punctuation, equivalent to re.sub(r'[^\\w\\s]', '', text)."""
+    if text.isascii():
+        return text.encode('ascii').translate(None, ASCII_PUNCTUATION).decode('ascii')
+    return PUNCTUATION.sub('', text)
+
+
+def normalize_title(title):
+    """Lowercase a title and remove its punctuation."""
+    return strip_punctuation(title.lower())
+
+
+def tokenize(text, stop_words=STOP_WORDS):
+    """Whitespace tokens of normalized text, without stopwords."""
+    return [word for word in text.split() if word not in stop_words]
+
+
+def normalize_titles(titles):
+    """normalize_title for a batch of titles."""
+    return [normalize_title(title) for title in titles]
+
+
+def tokenize_batch(texts, stop_words=STOP_WORDS, intern=False):
+    """
+    tokenize for a batch of normalized texts. With intern, tokens are interned
+    so the many records buffered by the writers share one string per word.
+    """
+    if not intern:
+        return [[word for word in text.split() if word not in stop_words] for text in texts]
+    intern_word = sys.intern
+    return [[intern_word(word) for word in text.split() if word not in stop_words] for text in texts]
@@ -0,0 +1,59 @@
+import argparse
+import logging
+
+from pyspark.sql import SparkSession, Window
+from pyspark.sql import functions as F
+
+from text_cleaning import clean_posts
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def word_counts(df, text_col='cleaned_body', group_col='subreddit'):
+    """Count each word of a cleaned, space-separated text column per group."""
+    words = (df.select(F.col(group_col), F.explode(F.split(F.col(text_col), ' ')).alias('word'))
+               .filter(F.col('word') != ''))
+    return words.groupBy(group_col, 'word').count()
+
+
+def top_words(df, text_col='cleaned_body', group_col='subreddit', n=15):
+    """
+    The n most frequent words of every group, as (group, word, count, rank) rows.
+
+    Tokenizing, exploding and counting all happen on the executors in one pass,
+    so only n rows per group ever reach the driver, however large the corpus.
+    Ties are broken alphabetically so the result is stable between runs.
+    """
+    ranking = Window.partitionBy(group_col).orderBy(F.col('count').desc(), F.col('word'))
+    return (word_counts(df, text_col, group_col)
+            .withColumn('rank', F.row_number().over(ranking))
+            .filter(F.col('rank') <= n))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Most frequent words per subreddit")
+    parser.add_argument('--table', default='dev_ds_playground.social_posts')
+    parser.add_argument('--text-column', default='body', help="Raw text, cleaned with text_cleaning first")
+    parser.add_argument('--group-column', default='subreddit')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output-table', help="Save the result here instead of only printing it")
+    args = parser.parse_args(argv)
+
+    spark = SparkSession.builder.appName("RedditWordFrequency").enableHiveSupport().getOrCreate()
+
+    posts = clean_posts(spark.table(args.table), args.text_column, 'cleaned_body')
+    result = top_words(posts, 'cleaned_body', args.group_column, args.top)
+
+    if args.output_table:
+        result.write.saveAsTable(args.output_table, mode='overwrite')
+        logging.info("Saved the top %d words per %s to %s", args.top, args.group_column, args.output_table)
+        # Read back the small saved table rather than counting the corpus again
+        result = spark.table(args.output_table)
+    result.orderBy(args.group_column, 'rank').show(1000, truncate=False)
+
+    spark.stop()
+
+
+if __name__ == '__main__':
+    main()